@@ -0,0 +1,384 @@
+# ASGI entry point. The read-heavy GET endpoints for properties and bids are
+# served by async handlers below: their database calls run on a small thread
+# executor and bid event streams wait on the event loop, so slow or
+# long-lived clients no longer tie up a thread each. Every other route falls
+# through to the Flask app, run on a thread pool by a2wsgi.
+#
+#   cd backend && uvicorn asgi:application --port 5000
+#
+# Both modes share the same database pool, response cache, event hub and
+# /metrics histograms. The slow-request profiler samples request threads, so
+# it only sees the Flask routes, not the async handlers on the event loop.
+
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from urllib.parse import urlencode
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+from werkzeug.urls import url_decode
+
+import app as wsgi
+from caching import MemoryBackend, request_key, version_etag
+from db import AsyncPool, PoolTimeout
+from events import stream_events_async
+from metrics import finish_request, record_serialize, start_request
+from listings import ListingQueryError, parse_row_plan, shape_property_page
+from ratelimit import MemoryBucketStore
+from serializers import BID_FIELDS
+
+EXPOSE_HEADERS = 'X-Next-Cursor, X-Next-Offset, Link, ETag, X-Cache'
+
+db = AsyncPool(wsgi.db_pool, workers=wsgi.app.config['DB_POOL_SIZE'])
+repository = wsgi.repository
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = url_decode(scope.get('query_string', b''))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+
+    @property
+    def base_url(self):
+        host = self.headers.get('host')
+        if host is None:
+            server = self.scope.get('server') or ('localhost', None)
+            host = server[0] if server[1] is None else f'{server[0]}:{server[1]}'
+        return f"{self.scope.get('scheme', 'http')}://{host}{self.scope.get('root_path', '')}{self.path}"
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, mimetype='application/json'):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.status = status
+        self.headers = {'Content-Type': mimetype}
+        self.headers.update(headers or {})
+
+    async def send(self, send, receive):
+        await send({'type': 'http.response.start', 'status': self.status,
+                    'headers': _encode_headers(self.headers)})
+        await send({'type': 'http.response.body', 'body': self.body})
+
+
+class StreamingResponse(Response):
+    def __init__(self, chunks, status=200, headers=None, mimetype='text/event-stream'):
+        super().__init__(b'', status, headers, mimetype)
+        self.chunks = chunks
+
+    async def send(self, send, receive):
+        await send({'type': 'http.response.start', 'status': self.status,
+                    'headers': _encode_headers(self.headers)})
+
+        async def stream():
+            async for chunk in self.chunks:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        # Stop streaming (and unsubscribe) as soon as the client goes away
+        tasks = [asyncio.ensure_future(stream()), asyncio.ensure_future(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.chunks.aclose()
+
+
+def _encode_headers(headers):
+    # Same CORS headers flask_cors adds to the Flask routes
+    headers = dict(headers, **{
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': EXPOSE_HEADERS,
+    })
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers.items()]
+
+
+def jsonify(data, status=200):
+    # Byte-for-byte what Flask's jsonify produces
+    started = time.perf_counter()
+    body = json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n'
+    record_serialize(time.perf_counter() - started)
+    return Response(body, status)
+
+
+def _validators(etag, last_modified, weak=False):
+    headers = {'ETag': quote_etag(etag, weak)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def _not_modified(request, validators):
+    environ = {
+        'HTTP_IF_NONE_MATCH': request.headers.get('if-none-match', ''),
+        'HTTP_IF_MODIFIED_SINCE': request.headers.get('if-modified-since', ''),
+    }
+    return not is_resource_modified(environ, validators['ETag'], last_modified=validators.get('Last-Modified'))
+
+
+async def _compress(body, encoding):
+    # Off the event loop; a large page takes a few milliseconds to compress
+    return await asyncio.get_running_loop().run_in_executor(None, wsgi.compressor.compress, body, encoding)
+
+
+def cached_response(namespace, tables=wsgi.LISTING_TABLES):
+    # Async counterpart of app.cached_response, sharing its cache entries
+    def decorator(handler):
+        async def decorated(request, **kwargs):
+            path_key = request_key(request.path, request.args)
+            token, last_modified = await db.call(repository.table_state, tables)
+            etag = version_etag(path_key, token)
+            validators = _validators(etag, last_modified)
+            if _not_modified(request, validators):
+                return Response(b'', 304, dict(validators, Vary='Accept-Encoding'))
+
+            key = wsgi.response_cache.key(namespace.format(**kwargs), f'{path_key}#{token}')
+            cached = await _cache_call(wsgi.response_cache.get, key)
+            if cached is not None:
+                body, headers = cached
+                cache_status = 'HIT'
+            else:
+                response = await handler(request, **kwargs)
+                if response.status != 200:
+                    return response
+                body = response.body
+                headers = {name: response.headers[name] for name in wsgi.CACHED_HEADERS if name in response.headers}
+                await _cache_call(wsgi.response_cache.set, key, body, headers)
+                cache_status = 'MISS'
+
+            headers = dict(headers, **validators, **{'X-Cache': cache_status, 'Vary': 'Accept-Encoding'})
+            encoding = None
+            if len(body) >= wsgi.compressor.min_size and wsgi.compressor.compressible('application/json'):
+                encoding = wsgi.compressor.negotiate(request.headers.get('accept-encoding'))
+            if encoding is not None:
+                variant = await _cache_call(wsgi.response_cache.get, f'{key}|{encoding}')
+                if variant is None:
+                    body = await _compress(body, encoding)
+                    await _cache_call(wsgi.response_cache.set, f'{key}|{encoding}', body, {})
+                else:
+                    body = variant[0]
+                headers['Content-Encoding'] = encoding
+                headers['ETag'] = quote_etag(etag, weak=True)
+            return Response(body, 200, headers)
+        decorated.__name__ = handler.__name__
+        return decorated
+    return decorator
+
+
+def conditional_response(tables):
+    # Async counterpart of app.conditional_response
+    def decorator(handler):
+        async def decorated(request, **kwargs):
+            path_key = request_key(request.path, request.args)
+            token, last_modified = await db.call(repository.table_state, tables)
+            validators = _validators(version_etag(path_key, token), last_modified)
+            if _not_modified(request, validators):
+                return Response(b'', 304, validators)
+            response = await handler(request, **kwargs)
+            if response.status == 200:
+                response.headers.update(validators)
+            return response
+        decorated.__name__ = handler.__name__
+        return decorated
+    return decorator
+
+
+async def compress_response(request, response):
+    # What app.compress_response does for the Flask routes
+    content_type = response.headers['Content-Type'].split(';')[0].strip()
+    if not wsgi.compressor.compressible(content_type) or 'Content-Encoding' in response.headers:
+        return response
+    response.headers['Vary'] = 'Accept-Encoding'
+    if response.status in (204, 304) or request.method == 'HEAD' or len(response.body) < wsgi.compressor.min_size:
+        return response
+    encoding = wsgi.compressor.negotiate(request.headers.get('accept-encoding'))
+    if encoding is None:
+        return response
+    response.body = await _compress(response.body, encoding)
+    response.headers['Content-Encoding'] = encoding
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = 'W/' + etag
+    return response
+
+
+async def rate_limit(request, handler):
+    # What app.check_rate_limit does for the Flask routes. The async handlers
+    # are named after the Flask views they stand in for, so they share their
+    # budgets and buckets.
+    client = request.scope.get('client') or (None, None)
+    identity = wsgi.rate_limit_identity(request.headers.get('authorization'), client[0],
+                                        request.headers.get('x-forwarded-for'))
+    if isinstance(wsgi.rate_limiter.store, MemoryBucketStore):
+        allowed, retry_after = wsgi.rate_limiter.check(handler.__name__, identity)
+    else:
+        allowed, retry_after = await asyncio.get_running_loop().run_in_executor(
+            None, wsgi.rate_limiter.check, handler.__name__, identity)
+    if allowed:
+        return None
+    response = jsonify({'message': 'Too many requests, please retry later'}, 429)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+async def _cache_call(fn, *args):
+    # The in-process cache is a dict lookup; a Redis round trip must not
+    # block the event loop
+    if isinstance(wsgi.response_cache.backend, MemoryBackend):
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+@cached_response('listings')
+async def get_properties(request):
+    try:
+        properties, plan = await db.call(repository.property_page, request.args)
+    except ListingQueryError as e:
+        return jsonify({'message': str(e)}, 400)
+
+    body, next_cursor = shape_property_page(properties, plan)
+
+    headers = {}
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return Response(body, headers=headers)
+
+
+@cached_response('listings')
+async def search_properties(request):
+    try:
+        results, plan = await db.call(repository.search_properties, request.args)
+    except ListingQueryError as e:
+        return jsonify({'message': str(e)}, 400)
+
+    limit = plan['limit']
+    headers = {}
+    if len(results) > limit:
+        headers['X-Next-Offset'] = str(plan['offset'] + limit)
+    return Response('[' + ','.join(row['doc'] for row in results[:limit]) + ']', headers=headers)
+
+
+@cached_response('property:{property_id}')
+async def get_property(request, property_id):
+    try:
+        doc = await db.call(repository.property_document, property_id, request.args)
+    except ListingQueryError as e:
+        return jsonify({'message': str(e)}, 400)
+
+    if doc is None:
+        return jsonify({'message': 'Property not found'}, 404)
+    return Response(doc)
+
+
+@conditional_response(('bids',))
+async def get_bids_by_property(request, property_id):
+    try:
+        plan = parse_row_plan(request.args, BID_FIELDS)
+    except ListingQueryError as e:
+        return jsonify({'message': str(e)}, 400)
+
+    bids = await db.call(repository.bids_for_property, property_id, plan)
+    return Response(wsgi.serializer.rows(bids, plan))
+
+
+async def stream_bids_by_property(request, property_id):
+    last_event_id = request.headers.get('last-event-id', request.args.get('lastEventId'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'message': 'Invalid Last-Event-ID'}, 400)
+
+    events = stream_events_async(wsgi.event_hub, property_id, last_event_id,
+                                 keepalive=wsgi.app.config['EVENT_KEEPALIVE'])
+    return StreamingResponse(events, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Async routes, tried in order for GET requests; path segments become kwargs.
+# The middle column is the matching Flask rule, used as the metrics label.
+ROUTES = [
+    (re.compile(r'^/api/properties$'), '/api/properties', get_properties),
+    (re.compile(r'^/api/properties/search$'), '/api/properties/search', search_properties),
+    (re.compile(r'^/api/properties/(?P<property_id>[^/]+)$'), '/api/properties/<property_id>', get_property),
+    (re.compile(r'^/api/bids/property/(?P<property_id>[^/]+)/stream$'),
+     '/api/bids/property/<property_id>/stream', stream_bids_by_property),
+    (re.compile(r'^/api/bids/property/(?P<property_id>[^/]+)$'),
+     '/api/bids/property/<property_id>', get_bids_by_property),
+]
+
+# Fixed paths under /api/properties/ that are Flask routes, not property ids
+WSGI_ONLY_PATHS = {'/api/properties/suggest', '/api/properties/bulk'}
+
+
+def match_route(method, path):
+    if method != 'GET' or path in WSGI_ONLY_PATHS or path.startswith('/api/properties/geo/'):
+        return None, None, None
+    for pattern, rule, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            return handler, rule, match.groupdict()
+    return None, None, None
+
+
+class Application:
+    def __init__(self, flask_app, threads=32):
+        self.fallback = WSGIMiddleware(flask_app, workers=threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http':
+            handler, rule, kwargs = match_route(scope['method'], scope['path'])
+            if handler is not None:
+                request = Request(scope)
+                started = time.perf_counter()
+                stats = start_request()
+                try:
+                    response = None
+                    if wsgi.rate_limiter is not None:
+                        response = await rate_limit(request, handler)
+                    if response is None:
+                        response = await handler(request, **kwargs)
+                    if not isinstance(response, StreamingResponse):
+                        response = await compress_response(request, response)
+                except PoolTimeout:
+                    response = jsonify({'message': 'Database is busy, please retry'}, 503)
+                finally:
+                    finish_request()
+                if wsgi.app.config['METRICS_ENABLED']:
+                    size = None if isinstance(response, StreamingResponse) else len(response.body)
+                    wsgi.metrics.observe(request.method, rule, response.status,
+                                         time.perf_counter() - started, stats, size)
+                return await response.send(send, receive)
+
+        await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                db.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+# Threads serving the Flask routes
+application = Application(wsgi.app, threads=int(os.environ.get('ASGI_WSGI_THREADS', 32)))
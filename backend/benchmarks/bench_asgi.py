@@ -0,0 +1,173 @@
+# Side-by-side: the threaded WSGI server versus the ASGI entry point
+# (uvicorn asgi:application), for the read endpoints ported to async.
+#
+#   cd backend && python -m benchmarks.bench_asgi --rows 20000 --concurrency 32 --streams 200
+#
+# Each mode serves the same seeded database from its own subprocess. Every
+# path is measured twice: alone, and while --streams clients hold bid event
+# streams open. The server's thread count and RSS are read from /proc at the
+# end of each run.
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import Timer, emit, free_port, load_app, summarize
+from benchmarks.seed import seed_properties
+
+PATHS = [
+    ('listings_cached', '/api/properties?limit=20'),
+    ('property_bids', '/api/bids/property/{property_id}'),
+    ('search', '/api/properties/search?q=pool&limit=20'),
+]
+
+
+def serve(mode, port):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if mode == 'asgi':
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.application, host='127.0.0.1', port=port, log_level='error')
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        import app
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def proc_status(pid):
+    status = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('Threads', 'VmRSS'):
+                status[name] = value.strip()
+    return status
+
+
+def load(port, path, concurrency, requests):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        for _ in range(requests // concurrency):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(type(e).__name__)
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    with Timer() as timer:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    result = summarize(latencies, timer.elapsed)
+    result['errors'] = len(errors)
+    return result
+
+
+def open_streams(port, path, count):
+    streams = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        sock.recv(1024)  # headers and the retry: line
+        streams.append(sock)
+    return streams
+
+
+def run_mode(mode, db_path, property_id, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_asgi', '--serve', mode, '--port', str(port)],
+        env=dict(os.environ, DATABASE_PATH=db_path),
+    )
+    try:
+        wait_for(port)
+        results = {}
+        for name, path in PATHS:
+            path = path.format(property_id=property_id)
+            load(port, path, args.concurrency, args.concurrency * 5)  # warm up
+            results[name] = load(port, path, args.concurrency, args.requests)
+
+        streams = open_streams(port, f'/api/bids/property/{property_id}/stream', args.streams)
+        for name, path in PATHS:
+            path = path.format(property_id=property_id)
+            results[f'{name}_with_streams'] = load(port, path, args.concurrency, args.requests)
+        status = proc_status(server.pid)
+        for sock in streams:
+            sock.close()
+        return {'paths': results, 'server': status, 'open_streams': len(streams)}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=3200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    app_module = load_app()
+    conn = app_module.get_db_connection()
+    property_id = seed_properties(conn, args.rows)[0]
+    conn.executemany(
+        "INSERT INTO bids (id, property_id, user_id, amount, status) VALUES (?, ?, 'admin-1', ?, 'pending')",
+        [(f'bench-bid-{i}', property_id, float(i + 1)) for i in range(50)]
+    )
+    conn.commit()
+    conn.close()
+    app_module.db_pool.close_all()
+
+    emit({
+        'benchmark': 'asgi_vs_wsgi',
+        'rows': args.rows,
+        'concurrency': args.concurrency,
+        'results': {mode: run_mode(mode, app_module.DB_PATH, property_id, args) for mode in args.modes},
+    })
+
+
+if __name__ == '__main__':
+    main()
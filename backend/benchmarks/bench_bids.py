@@ -0,0 +1,73 @@
+# Burst of concurrent bids against a single property.
+#
+#   cd backend && python -m benchmarks.bench_bids --bids 5000 --threads 32
+#
+# Every bidder draws the next amount from a shared counter, so most bids
+# race for the lock with a higher amount than the last accepted one.
+
+import argparse
+import itertools
+import threading
+import time
+
+from benchmarks.common import Timer, emit, load_app, login, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bids', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    client = app_module.app.test_client()
+    owner = login(client, 'muser', 'muser')
+    bidder = login(client, 'mvc', 'mvc')
+
+    response = client.post('/api/properties', headers=owner, json={
+        'title': 'Hot auction', 'type': 'residential', 'propertyType': 'house',
+        'price': 100000, 'area': 1500, 'city': 'Austin', 'state': 'TX',
+    })
+    property_id = response.get_json()['property_id']
+
+    amounts = itertools.count(100001)
+    per_thread = args.bids // args.threads
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker():
+        local_client = app_module.app.test_client()
+        local_latencies = []
+        local_statuses = {}
+        for _ in range(per_thread):
+            payload = {'propertyId': property_id, 'amount': next(amounts)}
+            start = time.perf_counter()
+            r = local_client.post('/api/bids', headers=bidder, json=payload)
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[r.status_code] = local_statuses.get(r.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for code, count in local_statuses.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    with Timer() as timer:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    result = summarize(latencies, timer.elapsed)
+    result['benchmark'] = 'bid_burst'
+    result['threads'] = args.threads
+    result['status_counts'] = {str(k): v for k, v in sorted(statuses.items())}
+    result['engine'] = app_module.bid_engine.stats()
+    result['high_bid'] = app_module.repository.fetchone(
+        "SELECT high_bid FROM property_bid_stats WHERE property_id = ?", (property_id,)
+    )[0]
+    emit(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Listing import: one POST /api/properties per listing versus a single
+# NDJSON upload to POST /api/properties/bulk.
+#
+#   cd backend && python -m benchmarks.bench_bulk --rows 100000 --single 2000
+#
+# The one-at-a-time path is only timed for --single listings and
+# extrapolated, since running it for every row takes far longer.
+
+import argparse
+import json
+import random
+
+from benchmarks.common import Timer, emit, load_app, login
+from benchmarks.seed import ADJECTIVES, CITIES, FEATURES, KINDS, STREETS
+
+
+def make_listings(count, rng):
+    zip_codes = ['78701', '78704', '80202', '33131', '98101', '02108', '60601', '85004', '97205']
+    for _ in range(count):
+        city, state, _, _ = rng.choice(CITIES)
+        kind, property_type = rng.choice(KINDS)
+        adjective = rng.choice(ADJECTIVES)
+        yield {
+            'title': f'{adjective} {property_type} in {city}',
+            'description': f'{adjective} {property_type} close to downtown {city}.',
+            'type': kind,
+            'propertyType': property_type,
+            'price': rng.randrange(100000, 3000000, 1000),
+            'bedrooms': rng.randint(0, 6),
+            'bathrooms': rng.randint(1, 4),
+            'area': rng.randrange(400, 6000, 10),
+            'street': f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+            'city': city,
+            'state': state,
+            'zipCode': rng.choice(zip_codes),
+            'features': rng.sample(FEATURES, rng.randint(1, 4)),
+            'images': [f'/images/{rng.randint(1, 500)}.jpg'],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--single', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    app_module = load_app()
+    app_module.app.config['BULK_MAX_ITEMS'] = max(args.rows, app_module.app.config['BULK_MAX_ITEMS'])
+    client = app_module.app.test_client()
+    owner = login(client, 'muser', 'muser')
+
+    with Timer() as single:
+        for listing in make_listings(args.single, rng):
+            response = client.post('/api/properties', headers=owner, json=listing)
+            assert response.status_code == 201, response.data
+
+    body = '\n'.join(json.dumps(listing) for listing in make_listings(args.rows, rng))
+    with Timer() as bulk:
+        response = client.post('/api/properties/bulk', headers=owner, data=body,
+                               content_type='application/x-ndjson')
+    result = response.get_json()
+
+    per_listing = single.elapsed / args.single
+    emit({
+        'benchmark': 'bulk_import',
+        'rows': args.rows,
+        'single': {
+            'listings': args.single,
+            'elapsed_s': round(single.elapsed, 2),
+            'listings_per_s': round(args.single / single.elapsed, 1),
+            'extrapolated_s': round(per_listing * args.rows, 1),
+        },
+        'bulk': {
+            'status': response.status_code,
+            'created': result['succeeded'],
+            'failed': result['failed'],
+            'elapsed_s': round(bulk.elapsed, 2),
+            'listings_per_s': round(args.rows / bulk.elapsed, 1),
+        },
+        'speedup': round(per_listing * args.rows / bulk.elapsed, 1),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Bytes on the wire and latency of the listing endpoint per content coding,
+# and the cost of a conditional request that comes back 304.
+#
+#   cd backend && python -m benchmarks.bench_compression --rows 20000 --limit 50 200
+#
+# For each page size and coding: 'build' invalidates the response cache
+# before every request, so each one queries, encodes and compresses the page;
+# 'cached' reuses the cached body and its compressed variant. 'revalidate'
+# sends the ETag back and is answered 304 from the table change counters
+# alone. Latency is measured in-process with the test client, so it excludes
+# the network time that the smaller bodies save.
+
+import argparse
+import time
+
+from benchmarks.common import Timer, emit, load_app, summarize
+from benchmarks.seed import seed_properties
+
+
+def measure(client, path, headers, repeat, before=None):
+    latencies = []
+    size = 0
+    with Timer() as timer:
+        for _ in range(repeat):
+            if before is not None:
+                before()
+            start = time.perf_counter()
+            response = client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            size = len(response.get_data())
+    result = summarize(latencies, timer.elapsed)
+    result['status'] = response.status_code
+    result['bytes'] = size
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--limit', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db_connection()
+    with Timer() as seeding:
+        seed_properties(conn, args.rows)
+        conn.commit()
+    conn.close()
+    client = app_module.app.test_client()
+
+    def invalidate():
+        app_module.response_cache.invalidate('listings')
+
+    results = {}
+    for limit in args.limit:
+        path = f'/api/properties?limit={limit}'
+        etag = client.get(path).headers['ETag']
+        page = {}
+        for coding in ['identity'] + app_module.compressor.encodings:
+            headers = {'Accept-Encoding': coding}
+            build = measure(client, path, headers, args.repeat, before=invalidate)
+            cached = measure(client, path, headers, args.repeat)
+            page[coding] = {'build': build, 'cached': cached}
+        page['revalidate'] = measure(client, path, {'If-None-Match': etag}, args.repeat)
+        identity = page['identity']['cached']['bytes']
+        page['bytes_saved'] = {
+            coding: round(1 - page[coding]['cached']['bytes'] / identity, 3)
+            for coding in app_module.compressor.encodings
+        }
+        results[limit] = page
+
+    emit({
+        'benchmark': 'compression',
+        'rows': args.rows,
+        'seed_s': round(seeding.elapsed, 2),
+        'levels': app_module.compressor.levels,
+        'pages': results,
+    })
+
+
+if __name__ == '__main__':
+    main()
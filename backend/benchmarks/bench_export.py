@@ -0,0 +1,105 @@
+# Time-to-first-byte and peak memory of the admin bid export versus row count.
+#
+#   cd backend && python -m benchmarks.bench_export --rows 10000 100000 300000
+#
+# Each (row count, mode) pair runs in a fresh subprocess so ru_maxrss is a
+# clean peak for that case; the Python heap peak comes from tracemalloc. 'buffered' reproduces the old fetchall() +
+# jsonify path for comparison with the streamed formats.
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+
+from benchmarks.common import emit, load_app, login
+
+MODES = ('buffered', 'json', 'ndjson', 'csv')
+
+
+def seed_bids(app_module, rows):
+    conn = app_module.get_db_connection()
+    conn.execute("INSERT INTO properties (id, title, type, property_type, price, area, city, state, owner_id, status) "
+                 "VALUES ('bench-prop', 'Bench', 'residential', 'house', 1, 1, 'Austin', 'TX', 'user-1', 'active')")
+    batch = []
+    for i in range(rows):
+        batch.append((str(uuid.uuid4()), 'bench-prop', 'admin-1', float(i + 1), 'benchmark bid message', 'pending'))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO bids (id, property_id, user_id, amount, message, status) VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO bids (id, property_id, user_id, amount, message, status) VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def run_child(rows, mode):
+    app_module = load_app()
+    seed_bids(app_module, rows)
+    client = app_module.app.test_client()
+    headers = login(client, 'mvc', 'mvc')
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    if mode == 'buffered':
+        with app_module.app.app_context():
+            conn = app_module.get_db_connection()
+            bids = conn.execute("SELECT * FROM bids").fetchall()
+            conn.close()
+            body = app_module.jsonify([dict(bid) for bid in bids]).get_data()
+        ttfb = time.perf_counter() - start
+        size = len(body)
+    else:
+        response = client.get(f'/api/admin/bids?format={mode}', headers=headers, buffered=False)
+        chunks = iter(response.response)
+        size = len(next(chunks))
+        ttfb = time.perf_counter() - start
+        for chunk in chunks:
+            size += len(chunk)
+        response.close()
+    total = time.perf_counter() - start
+
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'rows': rows,
+        'mode': mode,
+        'ttfb_ms': round(ttfb * 1000, 2),
+        'total_ms': round(total * 1000, 2),
+        'bytes': size,
+        'peak_heap_kb': peak_heap // 1024,
+        # Includes file-backed pages of the mmap'd database, which grow with
+        # the amount of the table read even when the heap stays flat
+        'peak_rss_growth_kb': peak_rss - baseline_rss,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--child', nargs=2, metavar=('ROWS', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(int(args.child[0]), args.child[1])
+        return
+
+    results = []
+    for rows in args.rows:
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_export', '--child', str(rows), mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    emit({'benchmark': 'admin_export', 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Latency of bounding-box, radius and clustering queries through the
+# properties_geo R*Tree, compared with the same box filtered by a plain scan.
+#
+#   cd backend && python -m benchmarks.bench_geo --rows 1000000
+#
+# Queries run straight against SQLite (no HTTP or response cache) so the
+# numbers are the cost of the spatial lookup and JSON assembly.
+
+import argparse
+import time
+
+from werkzeug.datastructures import MultiDict
+
+from benchmarks.common import Timer, emit, load_app, summarize
+from benchmarks.seed import seed_properties
+from geo import build_bbox_query, build_cluster_query, build_radius_query
+
+DOWNTOWN_AUSTIN = {'minLat': '30.25', 'maxLat': '30.29', 'minLng': '-97.76', 'maxLng': '-97.72'}
+
+QUERIES = [
+    ('bbox_downtown', build_bbox_query, DOWNTOWN_AUSTIN),
+    ('bbox_downtown_filtered', build_bbox_query, dict(DOWNTOWN_AUSTIN, maxPrice='500000', minBedrooms='3')),
+    ('radius_2km', build_radius_query, {'lat': '30.27', 'lng': '-97.74', 'radiusKm': '2'}),
+    ('radius_10km', build_radius_query, {'lat': '30.27', 'lng': '-97.74', 'radiusKm': '10'}),
+    ('clusters_metro', build_cluster_query,
+     {'minLat': '29.9', 'maxLat': '30.6', 'minLng': '-98.1', 'maxLng': '-97.4', 'zoom': '10'}),
+    ('clusters_country', build_cluster_query,
+     {'minLat': '24', 'maxLat': '50', 'minLng': '-125', 'maxLng': '-66', 'zoom': '4'}),
+]
+
+# The same downtown box without the spatial index, for comparison
+SCAN_SQL = '''
+SELECT json_object('id', id, 'title', title, 'price', price) FROM properties
+WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ? LIMIT 200
+'''
+
+
+def time_query(conn, sql, params, repeat):
+    conn.execute(sql, params).fetchall()  # warm the page cache
+    latencies = []
+    with Timer() as timer:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            latencies.append(time.perf_counter() - start)
+    result = summarize(latencies, timer.elapsed)
+    result['rows'] = len(rows)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db_connection()
+    with Timer() as seeding:
+        seed_properties(conn, args.rows)
+
+    results = {}
+    for name, builder, params in QUERIES:
+        sql, sql_params = builder(MultiDict(params))[:2]
+        results[name] = time_query(conn, sql, sql_params, args.repeat)
+    box = [float(DOWNTOWN_AUSTIN[k]) for k in ('minLat', 'maxLat', 'minLng', 'maxLng')]
+    results['bbox_downtown_table_scan'] = time_query(conn, SCAN_SQL, box, max(1, args.repeat // 10))
+    conn.close()
+
+    emit({'benchmark': 'geo', 'rows': args.rows, 'seed_s': round(seeding.elapsed, 2), 'queries': results})
+
+
+if __name__ == '__main__':
+    main()
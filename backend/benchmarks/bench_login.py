@@ -0,0 +1,109 @@
+# Login throughput under concurrency, and how much a login burst slows down
+# an unrelated route, with hashing inline versus on the process pool.
+#
+#   cd backend && python -m benchmarks.bench_login --threads 16 --logins 400
+#
+# Each case runs in a fresh subprocess (PASSWORD_HASH_WORKERS differs) with
+# a real threaded HTTP server; a probe thread keeps requesting bids for one
+# property while the login threads run.
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import Timer, emit, load_app, start_server, summarize
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request(method, path, body=json.dumps(body) if body else None,
+                 headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status
+
+
+def run_child(threads, logins):
+    app_module = load_app()
+    server = start_server(app_module.app)
+    port = server.server_port
+
+    per_thread = logins // threads
+    latencies = []
+    statuses = {}
+    probe_latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def login_worker(i):
+        local = []
+        for n in range(per_thread):
+            # One in four logins is for an unknown user
+            username = 'nobody' if n % 4 == 3 else 'muser'
+            start = time.perf_counter()
+            status = request(port, 'POST', '/api/auth/login', {'username': username, 'password': 'muser'})
+            local.append(time.perf_counter() - start)
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local)
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            request(port, 'GET', '/api/bids/property/bench')
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    probe_thread = threading.Thread(target=probe)
+    probe_thread.start()
+    workers = [threading.Thread(target=login_worker, args=(i,)) for i in range(threads)]
+    with Timer() as timer:
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+    done.set()
+    probe_thread.join()
+    server.shutdown()
+
+    print(json.dumps({
+        'hash_workers': app_module.app.config['PASSWORD_HASH_WORKERS'],
+        'logins': summarize(latencies, timer.elapsed),
+        'statuses': statuses,
+        'probe_during_burst': summarize(probe_latencies, timer.elapsed),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--hash-workers', type=int, nargs='+', default=[0, os.cpu_count() or 1])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.threads, args.logins)
+        return
+
+    results = []
+    for workers in args.hash_workers:
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_login', '--child',
+             '--threads', str(args.threads), '--logins', str(args.logins)],
+            check=True, capture_output=True, text=True,
+            env=dict(os.environ, PASSWORD_HASH_WORKERS=str(workers)),
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    emit({'benchmark': 'login', 'threads': args.threads, 'cpus': os.cpu_count(), 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Cost of the rate limit check on the request path.
+#
+#   cd backend && python -m benchmarks.bench_ratelimit --clients 1 1000 100000 --threads 1 8
+#
+# 'check' times RateLimiter.check on the in-process store, spread over that
+# many client identities, from one or more threads sharing the limiter; the
+# budget is large enough that every call is allowed, so each one refills and
+# spends a bucket. 'request' is the same listing request through the test
+# client with the Flask hook on and off, and 'overhead_us' the difference in
+# median latency. 'limited' gives the listing route a budget of one request
+# and times the 429 answers that follow.
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import Timer, emit, load_app, summarize
+from ratelimit import MemoryBucketStore, RateLimiter
+
+UNLIMITED = (10 ** 9, 1)
+
+
+def measure_check(clients, threads, calls):
+    limiter = RateLimiter(MemoryBucketStore(maxsize=max(clients, 1)), default=UNLIMITED)
+    identities = [f'ip:10.0.{i // 256}.{i % 256}' for i in range(clients)]
+    per_thread = calls // threads
+
+    def run(offset):
+        check = limiter.check
+        for i in range(per_thread):
+            check('get_properties', identities[(offset + i) % clients])
+
+    workers = [threading.Thread(target=run, args=(n * 7919,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'calls': per_thread * threads,
+        'elapsed_s': round(elapsed, 4),
+        'us_per_call': round(elapsed / (per_thread * threads) * 1e6, 3),
+        'buckets': limiter.store.stats()['buckets'],
+    }
+
+
+def measure_requests(client, path, repeat):
+    latencies = []
+    with Timer() as timer:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+    result = summarize(latencies, timer.elapsed)
+    result['status'] = response.status_code
+    return result
+
+
+def compare_requests(app_module, client, path, repeat):
+    # Alternate on and off request by request, so drift in the process
+    # (cache warmth, GC) lands on both sides equally
+    limiter = RateLimiter(MemoryBucketStore(), default=UNLIMITED)
+    latencies = {True: [], False: []}
+    statuses = {}
+    for _ in range(repeat):
+        for enabled in (True, False):
+            app_module.rate_limiter = limiter if enabled else None
+            start = time.perf_counter()
+            statuses[enabled] = client.get(path).status_code
+            latencies[enabled].append(time.perf_counter() - start)
+    on, off = (dict(summarize(latencies[enabled], sum(latencies[enabled])), status=statuses[enabled])
+               for enabled in (True, False))
+    return {'limiter_on': on, 'limiter_off': off, 'overhead_us': round((on['p50_ms'] - off['p50_ms']) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    checks = {
+        f'{clients}x{threads}': measure_check(clients, threads, args.calls)
+        for clients in args.clients for threads in args.threads
+    }
+
+    app_module = load_app()
+    client = app_module.app.test_client()
+    path = '/api/properties?limit=20'
+    client.get(path)
+
+    requests = compare_requests(app_module, client, path, args.repeat)
+
+    app_module.rate_limiter = RateLimiter(MemoryBucketStore(), {'get_properties': (1, 3600)})
+    client.get(path)
+    rejected = measure_requests(client, path, args.repeat)
+
+    emit({
+        'benchmark': 'rate_limit',
+        'check': checks,
+        'request': requests,
+        'limited': rejected,
+    })
+
+
+if __name__ == '__main__':
+    main()
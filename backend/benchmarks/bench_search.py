@@ -0,0 +1,58 @@
+# Latency of full-text search and autocomplete against a seeded catalogue.
+#
+#   cd backend && python -m benchmarks.bench_search --rows 100000
+#
+# Queries run straight against SQLite (no HTTP or response cache) so the
+# numbers are the cost of the FTS5 lookup, BM25 ranking and JSON assembly.
+
+import argparse
+import time
+
+from werkzeug.datastructures import MultiDict
+
+from benchmarks.common import Timer, emit, load_app, summarize
+from benchmarks.seed import seed_properties
+from search import build_search_query, build_suggest_query
+
+QUERIES = [
+    ('search_word', {'q': 'renovated'}),
+    ('search_two_words', {'q': 'ocean view'}),
+    ('search_prefix', {'q': 'spac'}),
+    ('search_with_filters', {'q': 'pool', 'city': 'Austin', 'maxPrice': '500000'}),
+    ('search_rare', {'q': 'historic office seattle'}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db_connection()
+    with Timer() as seeding:
+        seed_properties(conn, args.rows)
+        # Merge the FTS segments written during the bulk load
+        app_module.repository.optimize()
+
+    results = {}
+    dialect = app_module.repository.dialect
+    cases = [(name, build_search_query(MultiDict(params), dialect)[:2]) for name, params in QUERIES]
+    cases.append(('suggest', build_suggest_query(MultiDict({'q': 'aus'}), dialect)))
+    for name, (sql, params) in cases:
+        conn.execute(sql, params).fetchall()  # warm the page cache
+        latencies = []
+        with Timer() as timer:
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                conn.execute(sql, params).fetchall()
+                latencies.append(time.perf_counter() - start)
+        results[name] = summarize(latencies, timer.elapsed)
+    conn.close()
+
+    emit({'benchmark': 'search', 'rows': args.rows, 'seed_s': round(seeding.elapsed, 2), 'queries': results})
+
+
+if __name__ == '__main__':
+    main()
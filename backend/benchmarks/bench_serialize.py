@@ -0,0 +1,85 @@
+# CPU cost and encoded size of the bid list response, per encoding path.
+#
+#   cd backend && python -m benchmarks.bench_serialize --rows 100 1000 10000
+#
+# 'jsonify' is the old dict(row) + flask.jsonify path; 'plan_json' and
+# 'plan_orjson' map rows through a RowPlan and encode with the stdlib or
+# orjson; 'fields' is plan_orjson limited to ?fields=id,amount,status.
+# Rows are fetched once up front, so only building and encoding the body is
+# timed. CPU per response is process time, and MB/s is encoded bytes per
+# CPU second.
+
+import argparse
+import time
+
+from benchmarks.common import emit, load_app
+from benchmarks.seed import seed_bids, seed_properties, seed_users
+from serializers import BID_FIELDS, Serializer, orjson, row_plan
+
+FIELDS_SUBSET = ('id', 'amount', 'status')
+
+
+def cases(app_module, fetch):
+    plan = row_plan(BID_FIELDS)
+    subset_plan = row_plan(FIELDS_SUBSET)
+    rows_star, rows_plan, rows_subset = fetch('*'), fetch(plan.select_sql), fetch(subset_plan.select_sql)
+    stdlib = Serializer('json')
+
+    def jsonify():
+        with app_module.app.app_context():
+            return app_module.jsonify([dict(row) for row in rows_star]).get_data()
+
+    yield 'jsonify', jsonify
+    yield 'plan_json', lambda: stdlib.rows(rows_plan, plan)
+    if orjson is not None:
+        fast = Serializer('orjson')
+        yield 'plan_orjson', lambda: fast.rows(rows_plan, plan)
+        yield 'fields', lambda: fast.rows(rows_subset, subset_plan)
+
+
+def measure(fn, min_seconds):
+    fn()  # warm up
+    runs = 0
+    size = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    while True:
+        size = len(fn())
+        runs += 1
+        if time.perf_counter() - wall_start >= min_seconds:
+            break
+    cpu = time.process_time() - cpu_start
+    return {
+        'responses': runs,
+        'bytes': size,
+        'cpu_ms_per_response': round(cpu / runs * 1000, 4),
+        'mb_per_cpu_s': round(size * runs / cpu / 1e6, 1) if cpu else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--seconds', type=float, default=1.0, help='minimum time per case')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db_connection()
+    users = seed_users(conn, 20, app_module.password_hasher.hash('bench'))
+    properties = seed_properties(conn, 10, owners=users)
+    seed_bids(conn, properties, users, max(args.rows))
+    conn.commit()
+
+    results = {}
+    for rows in args.rows:
+        def fetch(columns):
+            return conn.execute(f"SELECT {columns} FROM bids ORDER BY rowid LIMIT ?", (rows,)).fetchall()
+
+        results[rows] = {name: measure(fn, args.seconds) for name, fn in cases(app_module, fetch)}
+    conn.close()
+
+    emit({'benchmark': 'serialize', 'orjson': orjson is not None, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Fan-out load test for the bid event stream.
+#
+#   cd backend && python -m benchmarks.bench_stream --subscribers 200 --bids 200
+#
+# Starts the app on a local threaded server, opens N SSE subscribers on one
+# property, places bids through the API and measures how long each event
+# takes to reach every subscriber.
+
+import argparse
+import http.client
+import threading
+import time
+
+from benchmarks.common import Timer, emit, load_app, login, start_server, summarize
+
+
+def subscribe(port, property_id, ready, received, stop):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', f'/api/bids/property/{property_id}/stream')
+    response = conn.getresponse()
+    ready.release()
+    event_id = None
+    while not stop.is_set():
+        line = response.fp.readline()
+        if not line:
+            break
+        if line.startswith(b'id: '):
+            event_id = int(line[4:])
+        elif line == b'\n' and event_id is not None:
+            received.append((event_id, time.perf_counter()))
+            event_id = None
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--bids', type=int, default=200)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    server = start_server(app_module.app)
+
+    client = app_module.app.test_client()
+    owner = login(client, 'muser', 'muser')
+    bidder = login(client, 'mvc', 'mvc')
+    property_id = client.post('/api/properties', headers=owner, json={
+        'title': 'Live auction', 'type': 'residential', 'propertyType': 'house',
+        'price': 100000, 'area': 1500, 'city': 'Austin', 'state': 'TX',
+    }).get_json()['property_id']
+
+    ready = threading.Semaphore(0)
+    stop = threading.Event()
+    inboxes = [[] for _ in range(args.subscribers)]
+    threads = [
+        threading.Thread(target=subscribe, args=(server.port, property_id, ready, inbox, stop), daemon=True)
+        for inbox in inboxes
+    ]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        ready.acquire()
+    # Give every stream a moment to register with the hub
+    while app_module.event_hub.stats()['subscribers'] < args.subscribers:
+        time.sleep(0.01)
+
+    sent = {}
+    with Timer() as timer:
+        for i in range(args.bids):
+            start = time.perf_counter()
+            client.post('/api/bids', headers=bidder, json={'propertyId': property_id, 'amount': 100001 + i})
+            sent[app_module.event_hub.stats()['last_event_id']] = start
+        deadline = time.time() + 10
+        while time.time() < deadline and sum(len(i) for i in inboxes) < args.subscribers * args.bids:
+            time.sleep(0.01)
+
+    stop.set()
+    latencies = [received_at - sent[event_id] for inbox in inboxes for event_id, received_at in inbox if event_id in sent]
+    result = summarize(latencies, timer.elapsed)
+    result['benchmark'] = 'bid_stream_fanout'
+    result['subscribers'] = args.subscribers
+    result['bids'] = args.bids
+    result['expected_deliveries'] = args.subscribers * args.bids
+    result['hub'] = app_module.event_hub.stats()
+    emit(result)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
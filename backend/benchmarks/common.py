@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path=None):
+    # Import backend/app.py against a throwaway database. DATABASE_PATH must
+    # be set before the import because the pool and schema are created then.
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='ebn-bench-'), 'bench.db')
+    os.environ['DATABASE_PATH'] = db_path
+    # Load generators send far more requests per client than any budget
+    # allows; bench_ratelimit turns limiting back on for itself
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import app as app_module
+    return app_module
+
+
+def start_server(app):
+    # Real threaded HTTP server on an ephemeral port, without per-request logs
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def login(client, username, password):
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        raise RuntimeError(f'login failed for {username}: {response.status_code}')
+    return {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    # latencies in seconds; reported in milliseconds
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'elapsed_s': round(elapsed, 4),
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+def emit(result):
+    print(json.dumps(result, indent=2, sort_keys=True))
@@ -0,0 +1,559 @@
+# Mixed-workload load test across the whole API.
+#
+#   cd backend && python -m benchmarks.loadtest --properties 20000 --duration 30 --concurrency 16
+#   cd backend && python -m benchmarks.loadtest --target server --server serve --output results/new.json
+#   cd backend && python -m benchmarks.loadtest --compare results/base.json results/new.json
+#
+# Seeds users, properties, bids and contracts into a temporary database, then
+# runs --concurrency virtual users for --duration seconds (or until
+# --requests in total). Each one draws operations from a weighted mix meant to
+# look like real traffic: mostly browsing, search and detail views, bursts of
+# bids on a few hot listings, and a trickle of writes, logins and admin
+# exports. Every route except the event stream (see bench_stream) is hit.
+#
+# The data goes into a temporary SQLite database, or with --database-url into
+# a PostgreSQL one, which must start out empty.
+#
+# --target client drives app.test_client() in this process. --target server
+# starts the API in a subprocess and drives it over HTTP: a threaded werkzeug
+# server, serve.py's preloaded workers, or uvicorn on asgi.py.
+#
+# The JSON result records the git commit, environment and settings with the
+# per-operation throughput and p50/p95/p99, and for --target client the
+# group-commit writer's commits per second against requests per second. --compare diffs two result files
+# and exits non-zero when an operation regressed by more than --tolerance.
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+from benchmarks.common import BACKEND_DIR, Timer, emit, free_port, load_app, summarize
+from benchmarks.seed import CITIES, FEATURES, KINDS, seed_bids, seed_contracts, seed_properties, seed_users
+
+PASSWORD = 'bench-password'
+SEARCH_TERMS = ['pool', 'renovated', 'ocean view', 'spacious', 'garden', 'historic', 'modern condo', 'luxury']
+SUGGEST_PREFIXES = ['au', 'den', 'mia', 'sea', 'bos', 'chi', 'pho', 'por', 'oak', 'mai']
+SERVERS = ('werkzeug', 'serve', 'asgi')
+# Operations with fewer requests than this are left out of --compare
+MIN_COMPARE_REQUESTS = 50
+
+
+class ClientTransport:
+    # Flask test client: no sockets, so the numbers are the app's own cost
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, headers=None, body=None):
+        response = self._client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.headers, response.get_data()
+
+
+class HTTPTransport:
+    # One keep-alive connection per virtual user, reopened as needed
+
+    def __init__(self, port):
+        self._conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+
+    def request(self, method, path, headers=None, body=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        try:
+            self._conn.request(method, path, body=payload, headers=headers)
+            response = self._conn.getresponse()
+            return response.status, response.headers, response.read()
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            return 0, {}, b''
+
+
+class Dataset:
+    # Everything the virtual users need to know about the seeded data
+
+    def __init__(self, app_module, args):
+        rng = random.Random(args.seed)
+        conn = app_module.get_db_connection()
+        with Timer() as timer:
+            password_hash = app_module.password_hasher.hash(PASSWORD)
+            self.user_ids = seed_users(conn, args.users, password_hash)
+            self.property_ids = seed_properties(conn, args.properties, rng=rng, owners=self.user_ids)
+            self.bids = seed_bids(conn, self.property_ids, self.user_ids, args.bids, rng=rng)
+            self.contracts = seed_contracts(conn, self.property_ids, self.user_ids, self.user_ids,
+                                            args.contracts, rng=rng)
+            conn.close()
+            app_module.repository.optimize()
+        self.seed_seconds = timer.elapsed
+
+        # Tokens are minted directly; logging every user in would mostly
+        # measure PBKDF2. The login operation still does the real thing.
+        self.tokens = {
+            user_id: {'Authorization': 'Bearer ' + app_module.generate_token(user_id, f'bench{i}', 'user')}
+            for i, user_id in enumerate(self.user_ids)
+        }
+        self.admin = {'Authorization': 'Bearer ' + app_module.generate_token('admin-1', 'mvc', 'admin')}
+
+        owner_of = {property_id: self.user_ids[i % len(self.user_ids)] for i, property_id in enumerate(self.property_ids)}
+        self.bids_by_owner = {}
+        for bid_id, property_id in self.bids:
+            self.bids_by_owner.setdefault(owner_of[property_id], []).append(bid_id)
+        self.contracts_by_owner = {}
+        for contract_id, owner_id in self.contracts:
+            self.contracts_by_owner.setdefault(owner_id, []).append(contract_id)
+
+        # Bids on hot listings draw from one rising counter per listing, above
+        # any seeded amount, so concurrent bursts race each other
+        self.hot_properties = rng.sample(self.property_ids, min(args.hot_properties, len(self.property_ids)))
+        self.hot_amounts = {property_id: itertools.count(5000000, 250) for property_id in self.hot_properties}
+
+    def owned_properties(self, user_index):
+        return self.property_ids[user_index::len(self.user_ids)]
+
+    def counts(self):
+        return {
+            'users': len(self.user_ids),
+            'properties': len(self.property_ids),
+            'bids': len(self.bids),
+            'contracts': len(self.contracts),
+            'seed_s': round(self.seed_seconds, 2),
+        }
+
+
+class VirtualUser:
+    def __init__(self, index, transport, data, args):
+        self.index = index
+        self.http = transport
+        self.data = data
+        self.args = args
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.user_index = index % len(data.user_ids)
+        self.user_id = data.user_ids[self.user_index]
+        self.auth = data.tokens[self.user_id]
+        self.created_properties = []
+        self.registered_users = []
+        self.last_query = None
+        self.next_cursor = None
+        self.serial = itertools.count()
+
+    # Each operation yields (name, method, path, headers, body) for every
+    # request it makes; run() times them and may send back the response
+
+    def list_properties(self):
+        if self.next_cursor and self.rng.random() < 0.5:
+            # Next page of the previous listing query
+            query = dict(self.last_query, cursor=self.next_cursor)
+        else:
+            city = self.rng.choice(CITIES)[0]
+            query = self.rng.choice([
+                {'limit': 20},
+                {'city': city, 'limit': 20},
+                {'city': city, 'sort': 'price_asc', 'maxPrice': 800000, 'limit': 20},
+                {'minBedrooms': 3, 'sort': 'price_desc', 'limit': 50},
+                {'propertyType': self.rng.choice(KINDS)[1], 'sort': 'area_desc', 'limit': 20},
+            ])
+        status, headers, _ = yield ('list_properties', 'GET', '/api/properties?' + urlencode(query), None, None)
+        self.last_query = query
+        self.next_cursor = headers.get('X-Next-Cursor') if status == 200 else None
+
+    def property_detail(self):
+        yield ('property_detail', 'GET', f'/api/properties/{self.rng.choice(self.data.property_ids)}', None, None)
+
+    def search(self):
+        query = {'q': self.rng.choice(SEARCH_TERMS), 'limit': 20}
+        if self.rng.random() < 0.3:
+            query['city'] = self.rng.choice(CITIES)[0]
+        yield ('search', 'GET', '/api/properties/search?' + urlencode(query), None, None)
+
+    def suggest(self):
+        yield ('suggest', 'GET', '/api/properties/suggest?q=' + self.rng.choice(SUGGEST_PREFIXES), None, None)
+
+    def geo(self):
+        _, _, lat, lng = self.rng.choice(CITIES)
+        kind = self.rng.choice(['bbox', 'bbox', 'radius', 'clusters'])
+        if kind == 'bbox':
+            query = {'minLat': lat - 0.05, 'maxLat': lat + 0.05, 'minLng': lng - 0.05, 'maxLng': lng + 0.05}
+        elif kind == 'radius':
+            query = {'lat': lat, 'lng': lng, 'radiusKm': self.rng.choice([2, 5, 10])}
+        else:
+            query = {'minLat': lat - 1, 'maxLat': lat + 1, 'minLng': lng - 1, 'maxLng': lng + 1, 'zoom': 8}
+        yield (f'geo_{kind}', 'GET', f'/api/properties/geo/{kind}?' + urlencode(query), None, None)
+
+    def property_bids(self):
+        property_id = self.rng.choice(self.data.hot_properties + self.data.property_ids[:1000])
+        yield ('property_bids', 'GET', f'/api/bids/property/{property_id}', None, None)
+
+    def my_bids(self):
+        yield ('my_bids', 'GET', '/api/bids/user', self.auth, None)
+
+    def my_contracts(self):
+        yield ('my_contracts', 'GET', '/api/contracts/user', self.auth, None)
+
+    def bid_burst(self):
+        property_id = self.rng.choice(self.data.hot_properties)
+        amounts = self.data.hot_amounts[property_id]
+        for _ in range(self.args.burst):
+            yield ('place_bid', 'POST', '/api/bids', self.auth,
+                   {'propertyId': property_id, 'amount': next(amounts), 'message': 'Load test bid'})
+
+    def bid_status(self):
+        bids = self.data.bids_by_owner.get(self.user_id)
+        if bids:
+            yield ('bid_status', 'PUT', f'/api/bids/{self.rng.choice(bids)}/status', self.auth,
+                   {'status': self.rng.choice(['pending', 'accepted', 'rejected'])})
+
+    def bulk_bid_status(self):
+        items = [{'bidId': bid_id, 'status': self.rng.choice(['pending', 'rejected'])}
+                 for bid_id, _ in self.rng.sample(self.data.bids, min(25, len(self.data.bids)))]
+        yield ('bulk_bid_status', 'PUT', '/api/bids/status', self.data.admin, items)
+
+    def _listing(self):
+        city, state, lat, lng = self.rng.choice(CITIES)
+        kind, property_type = self.rng.choice(KINDS)
+        return {
+            'title': f'Load test {property_type} in {city}', 'description': 'Created by the load test',
+            'type': kind, 'propertyType': property_type, 'price': self.rng.randrange(100000, 2000000, 1000),
+            'area': self.rng.randrange(500, 5000, 10), 'bedrooms': self.rng.randint(1, 5), 'bathrooms': 2,
+            'city': city, 'state': state, 'latitude': lat, 'longitude': lng,
+            'features': self.rng.sample(FEATURES, 2), 'images': ['/images/placeholder.jpg'],
+        }
+
+    def create_property(self):
+        status, _, body = yield ('create_property', 'POST', '/api/properties', self.auth, self._listing())
+        if status == 201:
+            self.created_properties.append(json.loads(body)['property_id'])
+
+    def update_property(self):
+        property_id = self.rng.choice(self.data.owned_properties(self.user_index))
+        yield ('update_property', 'PUT', f'/api/properties/{property_id}', self.auth,
+               {'price': self.rng.randrange(100000, 2000000, 1000)})
+
+    def delete_property(self):
+        if self.created_properties:
+            property_id = self.created_properties.pop()
+            yield ('delete_property', 'DELETE', f'/api/properties/{property_id}', self.auth, None)
+
+    def bulk_import(self):
+        yield ('bulk_import', 'POST', '/api/properties/bulk', self.auth, [self._listing() for _ in range(50)])
+
+    def create_contract(self):
+        property_id = self.rng.choice(self.data.owned_properties(self.user_index))
+        yield ('create_contract', 'POST', '/api/contracts', self.auth, {
+            'propertyId': property_id, 'agentId': self.rng.choice(self.data.user_ids),
+            'commission': 3, 'startDate': '2025-01-01', 'endDate': '2026-01-01',
+        })
+
+    def contract_status(self):
+        contracts = self.data.contracts_by_owner.get(self.user_id)
+        if contracts:
+            yield ('contract_status', 'PUT', f'/api/contracts/{self.rng.choice(contracts)}/status', self.auth,
+                   {'status': self.rng.choice(['pending', 'active'])})
+
+    def login(self):
+        username = f'bench{self.rng.randrange(len(self.data.user_ids))}'
+        yield ('login', 'POST', '/api/auth/login', None, {'username': username, 'password': PASSWORD})
+
+    def register(self):
+        name = f'vu{self.index}-{next(self.serial)}-{os.getpid()}'
+        status, _, body = yield ('register', 'POST', '/api/auth/register', None,
+                                 {'username': name, 'email': f'{name}@example.com', 'password': PASSWORD})
+        if status == 201:
+            self.registered_users.append(json.loads(body)['user_id'])
+
+    def delete_user(self):
+        if self.registered_users:
+            yield ('delete_user', 'DELETE', f'/api/admin/users/{self.registered_users.pop()}', self.data.admin, None)
+
+    def admin_export(self):
+        table = self.rng.choice(['users', 'bids', 'contracts'])
+        fmt = self.rng.choice(['json', 'ndjson', 'csv'])
+        yield (f'export_{table}', 'GET', f'/api/admin/{table}?format={fmt}', self.data.admin, None)
+
+    def admin_stats(self):
+        path, query = self.rng.choice([
+            ('', {}),
+            ('/bids', {'bucket': self.rng.choice(['day', 'week', 'month'])}),
+            ('/listings', {'group': self.rng.choice(['city', 'state'])}),
+            ('/agents', {'limit': 20}),
+        ])
+        yield ('admin_stats', 'GET', f'/api/admin/stats{path}?' + urlencode(query), self.data.admin, None)
+
+    def health(self):
+        yield ('health_ready', 'GET', '/api/health/ready', None, None)
+
+    # (operation, relative weight)
+    MIX = [
+        (list_properties, 20), (property_detail, 16), (search, 8), (suggest, 4), (geo, 6),
+        (property_bids, 6), (my_bids, 2), (my_contracts, 2),
+        (bid_burst, 4), (bid_status, 1), (bulk_bid_status, 0.2),
+        (create_property, 1.5), (update_property, 1), (delete_property, 0.5), (bulk_import, 0.1),
+        (create_contract, 0.5), (contract_status, 0.5),
+        (login, 0.5), (register, 0.2), (delete_user, 0.1),
+        (admin_export, 0.1), (admin_stats, 0.2), (health, 0.5),
+    ]
+
+    def run(self, until, budget, record):
+        operations = [operation for operation, _ in self.MIX]
+        weights = [weight for _, weight in self.MIX]
+        while time.monotonic() < until() and budget():
+            steps = self.rng.choices(operations, weights)[0](self)
+            response = None
+            try:
+                while True:
+                    name, method, path, headers, body = steps.send(response)
+                    start = time.perf_counter()
+                    response = self.http.request(method, path, headers, body)
+                    record(name, time.perf_counter() - start, response[0])
+            except StopIteration:
+                pass
+
+
+def start_server(kind, db_path, workers):
+    port = free_port()
+    env = dict(os.environ, DATABASE_PATH=db_path)
+    if kind == 'serve':
+        command = [sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+        env['LOG_LEVEL'] = 'WARNING'
+    elif kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port), '--log-level', 'error']
+    else:
+        command = [sys.executable, '-m', 'benchmarks.loadtest', '--serve-werkzeug', str(port)]
+    # Own process group, so stop_server() also reaches the hashing pool
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health/ready')
+            if conn.getresponse().status == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f'{kind} server did not become ready')
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def serve_werkzeug(port):
+    import logging
+    from werkzeug.serving import make_server
+
+    app_module = load_app(os.environ['DATABASE_PATH'])
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app_module.app, threaded=True).serve_forever()
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {'commit': git('rev-parse', 'HEAD') or None, 'dirty': bool(git('status', '--porcelain', '--', '.'))}
+    except OSError:
+        return {'commit': None, 'dirty': None}
+
+
+def run_load(args):
+    # Inherited by the server subprocess
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    app_module = load_app()
+    data = Dataset(app_module, args)
+
+    server = None
+    if args.target == 'server':
+        server, port = start_server(args.server, os.environ['DATABASE_PATH'], args.workers)
+        make_transport = lambda: HTTPTransport(port)
+    else:
+        make_transport = lambda: ClientTransport(app_module.app)
+
+    latencies = {}
+    statuses = {}
+    lock = threading.Lock()
+    measuring = threading.Event()
+    issued = itertools.count()
+
+    def record(name, elapsed, status):
+        if not measuring.is_set():
+            return
+        with lock:
+            latencies.setdefault(name, []).append(elapsed)
+            counts = statuses.setdefault(name, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    deadline = [float('inf')]
+    # --requests counts operations started once measuring begins
+    budget = (lambda: not measuring.is_set() or next(issued) < args.requests) if args.requests else (lambda: True)
+    users = [VirtualUser(i, make_transport(), data, args) for i in range(args.concurrency)]
+    threads = [threading.Thread(target=user.run, args=(lambda: deadline[0], budget, record), daemon=True)
+               for user in users]
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        measuring.set()
+        commits_before = writer_counts(app_module) if args.target == 'client' else None
+        with Timer() as timer:
+            if not args.requests:
+                deadline[0] = time.monotonic() + args.duration
+            for thread in threads:
+                thread.join()
+    finally:
+        deadline[0] = 0
+        if server is not None:
+            stop_server(server)
+
+    operations = {}
+    for name in sorted(latencies):
+        result = summarize(latencies[name], timer.elapsed)
+        result['status_counts'] = {str(code): count for code, count in sorted(statuses[name].items())}
+        result['errors'] = sum(count for code, count in statuses[name].items() if code == 0 or code >= 500)
+        operations[name] = result
+    overall = summarize([value for values in latencies.values() for value in values], timer.elapsed)
+    overall['errors'] = sum(op['errors'] for op in operations.values())
+
+    # Commits per second next to requests per second: how much the
+    # group-commit writer batched. Only known for --target client, where the
+    # writer is in this process.
+    group_commit = None
+    if commits_before is not None:
+        commits_after = writer_counts(app_module)
+        if commits_after is not None:
+            commits, writes = (after - before for after, before in zip(commits_after, commits_before))
+            group_commit = {
+                'commits': commits,
+                'writes': writes,
+                'commits_per_second': round(commits / timer.elapsed, 1),
+                'requests_per_second': overall['throughput_rps'],
+                'writes_per_commit': round(writes / commits, 2) if commits else None,
+            }
+
+    return {
+        'benchmark': 'loadtest',
+        'target': args.target if args.target == 'client' else f'server:{args.server}',
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'git': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'database': app_module.repository.dialect.name,
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'config': {
+            'seed': args.seed, 'concurrency': args.concurrency, 'duration_s': args.duration,
+            'requests': args.requests, 'warmup_s': args.warmup, 'burst': args.burst,
+            'hot_properties': args.hot_properties, 'workers': args.workers if args.target == 'server' else None,
+        },
+        'dataset': data.counts(),
+        'overall': overall,
+        'group_commit': group_commit,
+        'operations': operations,
+    }
+
+
+def writer_counts(app_module):
+    writer = app_module.repository.writer
+    if writer is None:
+        return None
+    stats = writer.stats()
+    return stats['commits'], stats['writes']
+
+
+def compare(base_path, new_path, tolerance):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    rows = []
+    regressions = []
+    for name in sorted(set(base['operations']) & set(new['operations'])):
+        before, after = base['operations'][name], new['operations'][name]
+        if min(before['requests'], after['requests']) < MIN_COMPARE_REQUESTS:
+            continue
+        row = {'operation': name}
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            old, current = before[metric], after[metric]
+            row[metric] = {'base': old, 'new': current,
+                           'change': round((current - old) / old, 4) if old else None}
+        slower = row['p95_ms']['change'] is not None and row['p95_ms']['change'] > tolerance
+        fewer = row['throughput_rps']['change'] is not None and row['throughput_rps']['change'] < -tolerance
+        if slower or fewer:
+            regressions.append(name)
+        rows.append(row)
+
+    emit({
+        'benchmark': 'loadtest_compare',
+        'base': {'commit': base['git']['commit'], 'target': base['target']},
+        'new': {'commit': new['git']['commit'], 'target': new['target']},
+        'tolerance': tolerance,
+        'operations': rows,
+        'regressions': regressions,
+    })
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed-workload load test for the API.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--properties', type=int, default=20000)
+    parser.add_argument('--bids', type=int, default=50000)
+    parser.add_argument('--contracts', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1, help='seeds the dataset and every virtual user')
+    parser.add_argument('--database-url', help='an empty PostgreSQL database to run against instead of SQLite')
+    parser.add_argument('--target', choices=('client', 'server'), default='client')
+    parser.add_argument('--server', choices=SERVERS, default='werkzeug')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='serve.py workers')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to measure')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests instead')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of unmeasured load first')
+    parser.add_argument('--burst', type=int, default=5, help='bids per bid burst')
+    parser.add_argument('--hot-properties', type=int, default=5)
+    parser.add_argument('--output', help='also write the result JSON here')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='diff two result files')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='allowed p95 increase / throughput drop before --compare fails')
+    parser.add_argument('--serve-werkzeug', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_werkzeug:
+        serve_werkzeug(args.serve_werkzeug)
+        return
+    if args.compare:
+        sys.exit(compare(*args.compare, args.tolerance))
+
+    result = run_load(args)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    emit(result)
+
+
+if __name__ == '__main__':
+    main()
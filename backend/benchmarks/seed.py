@@ -0,0 +1,136 @@
+# Synthetic data generation shared by the benchmarks. Each seed_* call is one
+# transaction, begun explicitly because PostgreSQL connections autocommit.
+
+import random
+import uuid
+
+# (city, state, latitude, longitude) of each city centre; listings are
+# scattered up to ~30km around it
+CITIES = [
+    ('Austin', 'TX', 30.27, -97.74), ('Denver', 'CO', 39.74, -104.99),
+    ('Miami', 'FL', 25.77, -80.19), ('Seattle', 'WA', 47.61, -122.33),
+    ('Boston', 'MA', 42.36, -71.06), ('Chicago', 'IL', 41.88, -87.63),
+    ('Phoenix', 'AZ', 33.45, -112.07), ('Portland', 'OR', 45.52, -122.68),
+]
+FEATURES = ['Pool', 'Garage', 'Garden', 'Balcony', 'Gym', 'Fireplace', 'Ocean View', 'Parking', 'Central AC']
+ADJECTIVES = ['Modern', 'Cozy', 'Spacious', 'Historic', 'Sunny', 'Luxury', 'Quiet', 'Renovated']
+KINDS = [('residential', 'house'), ('residential', 'condo'), ('residential', 'apartment'), ('commercial', 'retail'), ('commercial', 'office')]
+STREETS = ['Main Street', 'Oak Avenue', 'Maple Drive', 'Ocean View Blvd', 'Park Lane', 'Hill Road']
+
+
+def seed_users(conn, count, password_hash, prefix='bench'):
+    # Regular accounts bench0..benchN-1. They share one password hash so
+    # seeding doesn't pay for N key derivations. Returns their ids.
+    rows = [
+        (f'{prefix}-user-{i}', f'{prefix}{i}', f'{prefix}{i}@example.com', password_hash, 'user')
+        for i in range(count)
+    ]
+    conn.execute('BEGIN')
+    conn.executemany("INSERT INTO users (id, username, email, password, role) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return [row[0] for row in rows]
+
+
+def seed_properties(conn, count, owner_id='user-1', batch_size=5000, rng=None, owners=None):
+    # Bulk insert listings plus their features; returns the new property ids.
+    # With owners, listing i belongs to owners[i % len(owners)].
+    rng = rng or random.Random(42)
+    ids = []
+    properties = []
+    features = []
+    conn.execute('BEGIN')
+    for i in range(count):
+        property_id = str(uuid.uuid4())
+        ids.append(property_id)
+        city, state, latitude, longitude = rng.choice(CITIES)
+        kind, property_type = rng.choice(KINDS)
+        adjective = rng.choice(ADJECTIVES)
+        properties.append((
+            property_id,
+            f'{adjective} {property_type} in {city}',
+            f'{adjective} {property_type} close to downtown {city} with great light.',
+            kind, property_type,
+            float(rng.randrange(100000, 3000000, 1000)),
+            rng.randint(0, 6), rng.randint(1, 4),
+            float(rng.randrange(400, 6000, 10)),
+            f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+            city, state, f'{rng.randint(10000, 99999)}',
+            owners[i % len(owners)] if owners else owner_id, 'active',
+            latitude + rng.uniform(-0.3, 0.3), longitude + rng.uniform(-0.3, 0.3),
+        ))
+        for position, feature in enumerate(rng.sample(FEATURES, rng.randint(1, 4))):
+            features.append((property_id, position, feature))
+        if len(properties) >= batch_size:
+            _flush(conn, properties, features)
+            properties, features = [], []
+    _flush(conn, properties, features)
+    conn.commit()
+    return ids
+
+
+def seed_bids(conn, property_ids, user_ids, count, batch_size=10000, rng=None):
+    # Random pending bids spread over the listings; returns (bid id, property id) pairs
+    rng = rng or random.Random(43)
+    bids = []
+    batch = []
+    conn.execute('BEGIN')
+    for _ in range(count):
+        bid_id = str(uuid.uuid4())
+        property_id = rng.choice(property_ids)
+        bids.append((bid_id, property_id))
+        batch.append((bid_id, property_id, rng.choice(user_ids), float(rng.randrange(50000, 3000000, 500)),
+                      'Benchmark offer', 'pending'))
+        if len(batch) >= batch_size:
+            _insert_bids(conn, batch)
+            batch = []
+    _insert_bids(conn, batch)
+    conn.commit()
+    return bids
+
+
+def _insert_bids(conn, batch):
+    conn.executemany(
+        "INSERT INTO bids (id, property_id, user_id, amount, message, status) VALUES (?, ?, ?, ?, ?, ?)",
+        batch
+    )
+
+
+def seed_contracts(conn, property_ids, owners, agent_ids, count, rng=None):
+    # Pending contracts on random listings, owned the way seed_properties(owners=)
+    # assigned them; returns (contract id, owner id) pairs
+    rng = rng or random.Random(44)
+    rows = []
+    for _ in range(count):
+        index = rng.randrange(len(property_ids))
+        rows.append((
+            str(uuid.uuid4()), property_ids[index], owners[index % len(owners)], rng.choice(agent_ids),
+            round(rng.uniform(1, 6), 2), 'pending', '2025-01-01', '2026-01-01',
+        ))
+    conn.execute('BEGIN')
+    conn.executemany(
+        """
+        INSERT INTO contracts (id, property_id, owner_id, agent_id, commission, status, start_date, end_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows
+    )
+    conn.commit()
+    return [(row[0], row[2]) for row in rows]
+
+
+def _flush(conn, properties, features):
+    # Features first, the way bulk imports do it, so each listing is indexed
+    # for search in one go
+    conn.executemany(
+        "INSERT INTO property_features (property_id, position, feature) VALUES (?, ?, ?)",
+        features
+    )
+    conn.executemany(
+        """
+        INSERT INTO properties
+        (id, title, description, type, property_type, price, bedrooms, bathrooms, area,
+         street, city, state, zip_code, owner_id, status, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        properties
+    )
@@ -0,0 +1,154 @@
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from caching import SharedGeneration
+
+
+class BidRejected(Exception):
+    def __init__(self, message, status=409, high_bid=None):
+        super().__init__(message)
+        self.status = status
+        self.high_bid = high_bid
+
+
+class BidEngine:
+    # Accepts bids one property at a time. Bids for the same property are
+    # serialized on a striped lock, validated against an in-memory high bid
+    # (O(1) fast reject), then written in a write transaction (the
+    # repository's, so group-committed when it has a writer) that re-checks
+    # the stored high bid, retrying with jittered backoff when another writer
+    # holds the lock. On SQLite that's BEGIN IMMEDIATE's database lock; on
+    # PostgreSQL the listing's row is locked, so other processes bidding on
+    # it wait while bids on other listings go ahead.
+    #
+    # The in-memory high bid is per process. Behind the database, the
+    # transaction re-check catches it; ahead of it (a bid was rejected or
+    # removed) it would turn away valid bids, so whoever changes or deletes
+    # bids calls forget(). That bumps the listing's counter in shared memory,
+    # which every worker forked from the same master checks before trusting
+    # its copy, so a fast reject needs no database read. Copies are kept for
+    # the max_tracked most recently bid-on listings.
+
+    def __init__(self, repository, stripes=64, max_tracked=10000, max_retries=8, base_backoff=0.005,
+                 generations=None):
+        self._repository = repository
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        # property_id -> (high bid, the listing's generation when it was read)
+        self._high = OrderedDict()
+        self._high_lock = threading.Lock()
+        self._generations = generations or SharedGeneration(slots=4096)
+        self.max_tracked = max_tracked
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'accepted': 0,
+            'rejected_low': 0,
+            'fast_rejects': 0,
+            'lock_retries': 0,
+            'busy_failures': 0,
+            'evictions': 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def _lock_for(self, property_id):
+        return self._stripes[hash(property_id) % len(self._stripes)]
+
+    def forget(self, property_id):
+        self._generations.bump(property_id)
+        with self._high_lock:
+            self._high.pop(property_id, None)
+
+    def _known_high(self, property_id, generation):
+        with self._high_lock:
+            entry = self._high.get(property_id)
+            if entry is None or entry[1] != generation:
+                return None
+            self._high.move_to_end(property_id)
+            return entry[0]
+
+    def _remember(self, property_id, high, generation):
+        # A copy read before a forget() keeps the generation it was read
+        # under, so it is ignored from then on rather than trusted
+        with self._high_lock:
+            self._high[property_id] = (high, generation)
+            self._high.move_to_end(property_id)
+            if len(self._high) > self.max_tracked:
+                self._high.popitem(last=False)
+                self._count('evictions')
+
+    def place_bid(self, property_id, user_id, amount, message=None):
+        generation = self._generations.get(property_id)
+        with self._lock_for(property_id):
+            high = self._known_high(property_id, generation)
+            if high is not None and amount <= high:
+                self._count('fast_rejects')
+                self._count('rejected_low')
+                raise BidRejected('Bid must be higher than the current high bid', high_bid=high)
+
+            return self._write_bid(property_id, user_id, amount, message, generation)
+
+    def _write_bid(self, property_id, user_id, amount, message, generation):
+        for attempt in range(self.max_retries):
+            try:
+                bid_id = self._repository.run_write(self._insert_bid, property_id, user_id, amount, message)
+            except BidRejected as e:
+                if e.high_bid is not None:
+                    self._remember(property_id, e.high_bid, generation)
+                raise
+            except self._repository.lock_errors as e:
+                if not self._repository.is_lock_error(e):
+                    raise
+                self._count('lock_retries')
+                delay = self.base_backoff * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+                continue
+
+            self._remember(property_id, amount, generation)
+            self._count('accepted')
+            return bid_id
+
+        self._count('busy_failures')
+        raise BidRejected('Bidding is busy, please retry', status=503)
+
+    def _insert_bid(self, conn, property_id, user_id, amount, message):
+        # Runs in the repository's write transaction, which a BidRejected
+        # raised here rolls back
+        property = conn.execute(
+            "SELECT id FROM properties WHERE id = ?" + self._repository.dialect.row_lock, (property_id,)
+        ).fetchone()
+        if not property:
+            raise BidRejected('Property not found', status=404)
+
+        high = self._stored_high_bid(conn, property_id)
+        if high is not None and amount <= high:
+            self._count('rejected_low')
+            raise BidRejected('Bid must be higher than the current high bid', high_bid=high)
+
+        bid_id = str(uuid.uuid4())
+        conn.execute(
+            "INSERT INTO bids (id, property_id, user_id, amount, message, status) VALUES (?, ?, ?, ?, ?, ?)",
+            (bid_id, property_id, user_id, amount, message, 'pending')
+        )
+        return bid_id
+
+    def _stored_high_bid(self, conn, property_id):
+        # property_bid_stats is maintained by triggers on bids
+        row = conn.execute(
+            "SELECT high_bid FROM property_bid_stats WHERE property_id = ?",
+            (property_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['tracked_properties'] = len(self._high)
+        stats['max_tracked'] = self.max_tracked
+        return stats
@@ -0,0 +1,206 @@
+import json
+import uuid
+
+from geo import explicit_coordinates, lookup_centroids
+from listings import ListingQueryError, split_list_field
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+PROPERTY_REQUIRED_FIELDS = ('title', 'type', 'propertyType', 'price', 'area', 'city', 'state')
+PROPERTY_NUMERIC_FIELDS = ('price', 'area', 'bedrooms', 'bathrooms')
+
+
+class BulkPayloadError(ValueError):
+    pass
+
+
+def parse_items(stream, mimetype, max_items):
+    """Read a bulk upload: a JSON array, or NDJSON with one object per line.
+
+    Returns (items, errors) where errors maps the index of every NDJSON line
+    that isn't valid JSON to a message; its slot in items is None.
+    """
+    items = []
+    errors = {}
+    if mimetype in NDJSON_MIMETYPES:
+        # Read line by line so the raw upload is never held as one string
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            if len(items) >= max_items:
+                raise BulkPayloadError(f'At most {max_items} items per request')
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                errors[len(items)] = f'Invalid JSON: {e}'
+                items.append(None)
+        return items, errors
+
+    try:
+        items = json.load(stream)
+    except ValueError:
+        raise BulkPayloadError('Body must be a JSON array or NDJSON')
+    if not isinstance(items, list):
+        raise BulkPayloadError('Body must be a JSON array or NDJSON')
+    if len(items) > max_items:
+        raise BulkPayloadError(f'At most {max_items} items per request')
+    return items, errors
+
+
+def _failed(index, message):
+    return {'index': index, 'status': 'failed', 'message': message}
+
+
+def _check_object(item):
+    if not isinstance(item, dict):
+        raise ListingQueryError('Item must be a JSON object')
+
+
+def validate_property(item):
+    _check_object(item)
+    for field in PROPERTY_REQUIRED_FIELDS:
+        if item.get(field) in (None, ''):
+            raise ListingQueryError(f'Missing required field: {field}')
+    for field in PROPERTY_NUMERIC_FIELDS:
+        value = item.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ListingQueryError(f'{field} must be a number')
+    return explicit_coordinates(item)
+
+
+def import_properties(conn, items, owner_id, errors=None, batch_size=5000, begin='BEGIN IMMEDIATE'):
+    """Validate and insert listings in one transaction, opened with begin.
+
+    Returns one result per item, in order: {'index', 'status': 'created',
+    'id'} or {'index', 'status': 'failed', 'message'}. Invalid items are
+    reported and skipped; the valid ones are still imported.
+    """
+    errors = errors or {}
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if index in errors:
+            results[index] = _failed(index, errors[index])
+            continue
+        try:
+            coordinates = validate_property(item)
+        except ListingQueryError as e:
+            results[index] = _failed(index, str(e))
+            continue
+        valid.append((index, item, coordinates))
+
+    centroids = lookup_centroids(conn, (item.get('zipCode') for _, item, coordinates in valid if coordinates is None))
+
+    conn.execute(begin)
+    try:
+        for start in range(0, len(valid), batch_size):
+            properties, features, images = [], [], []
+            for index, item, coordinates in valid[start:start + batch_size]:
+                property_id = str(uuid.uuid4())
+                if coordinates is None:
+                    coordinates = centroids.get(str(item.get('zipCode')), (None, None))
+                properties.append((
+                    property_id, item['title'], item.get('description'), item['type'],
+                    item['propertyType'], item['price'], item.get('bedrooms'), item.get('bathrooms'),
+                    item['area'], item.get('street'), item['city'], item['state'], item.get('zipCode'),
+                    owner_id, 'active', coordinates[0], coordinates[1],
+                ))
+                features.extend(
+                    (property_id, i, feature) for i, feature in enumerate(split_list_field(item.get('features')))
+                )
+                images.extend(
+                    (property_id, i, url) for i, url in enumerate(split_list_field(item.get('images')))
+                )
+                results[index] = {'index': index, 'status': 'created', 'id': property_id}
+            # Children go in first: properties_fts_insert then indexes each
+            # listing with its features in one go (foreign keys aren't enforced)
+            conn.executemany(
+                "INSERT INTO property_features (property_id, position, feature) VALUES (?, ?, ?)",
+                features
+            )
+            conn.executemany(
+                "INSERT INTO property_images (property_id, position, url) VALUES (?, ?, ?)",
+                images
+            )
+            conn.executemany(
+                """
+                INSERT INTO properties
+                (id, title, description, type, property_type, price, bedrooms, bathrooms, area,
+                 street, city, state, zip_code, owner_id, status, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                properties
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+
+def update_bid_statuses(conn, items, current_user, errors=None, chunk_size=500, begin='BEGIN IMMEDIATE',
+                        before_commit=None):
+    """Apply [{'bidId', 'status'}] updates in one transaction, opened with begin.
+
+    Only the property owner or an admin may change a bid. Returns
+    (results, updated) where updated lists (bid_id, property_id, status)
+    for every bid that changed; before_commit(conn, updated) runs in the
+    same transaction.
+    """
+    errors = errors or {}
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if index in errors:
+            results[index] = _failed(index, errors[index])
+            continue
+        try:
+            _check_object(item)
+            if not item.get('bidId'):
+                raise ListingQueryError('Missing required field: bidId')
+            if not isinstance(item.get('status'), str) or not item['status']:
+                raise ListingQueryError('Status is required')
+        except ListingQueryError as e:
+            results[index] = _failed(index, str(e))
+            continue
+        valid.append((index, str(item['bidId']), item['status']))
+
+    updated = []
+    conn.execute(begin)
+    try:
+        bid_ids = list({bid_id for _, bid_id, _ in valid})
+        bids = {}
+        for start in range(0, len(bid_ids), chunk_size):
+            chunk = bid_ids[start:start + chunk_size]
+            rows = conn.execute(
+                f"""
+                SELECT b.id, b.property_id, p.owner_id
+                FROM bids b JOIN properties p ON b.property_id = p.id
+                WHERE b.id IN ({', '.join('?' * len(chunk))})
+                """,
+                chunk
+            )
+            bids.update((row['id'], row) for row in rows)
+
+        for index, bid_id, status in valid:
+            bid = bids.get(bid_id)
+            if bid is None:
+                results[index] = _failed(index, 'Bid not found')
+            elif bid['owner_id'] != current_user['id'] and current_user['role'] != 'admin':
+                results[index] = _failed(index, 'Unauthorized to update this bid')
+            else:
+                results[index] = {'index': index, 'status': 'updated', 'id': bid_id}
+                updated.append((bid_id, bid['property_id'], status))
+
+        conn.executemany(
+            "UPDATE bids SET status = ? WHERE id = ?",
+            [(status, bid_id) for bid_id, _, status in updated]
+        )
+        if before_commit is not None:
+            before_commit(conn, updated)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results, updated
@@ -0,0 +1,379 @@
+import ctypes
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+
+class TTLCache:
+    # Thread-safe LRU cache bounded by entry count, where every entry also
+    # carries its own expiry time.
+
+    def __init__(self, maxsize=10000, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        # get() without counting a hit or miss or refreshing the entry's recency
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= self._clock():
+                return default
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self._clock() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > self._clock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SharedGeneration:
+    # Counters in shared memory. Processes forked after they are created (the
+    # workers serve.py forks from its preloaded master) all see the same
+    # values, so bumping one tells every one of them that what they cached
+    # under it is out of date. Keys are hashed onto a fixed number of slots;
+    # two keys sharing one only cost each other a cache miss. Reading a
+    # counter is a single memory load.
+
+    def __init__(self, slots=1):
+        self._values = multiprocessing.RawArray(ctypes.c_uint64, slots)
+        self._lock = multiprocessing.Lock()
+
+    def _slot(self, key):
+        if key is None:
+            return 0
+        return zlib.crc32(str(key).encode()) % len(self._values)
+
+    def get(self, key=None):
+        return self._values[self._slot(key)]
+
+    def bump(self, key=None):
+        slot = self._slot(key)
+        with self._lock:
+            self._values[slot] += 1
+
+
+class AuthCache:
+    # Maps verified bearer tokens to the user row they resolved to, so
+    # token_required can skip both the JWT signature check and the users
+    # lookup. Entries never outlive the token's own exp claim.
+    #
+    # invalidate_user() empties the cache in this process and, through the
+    # shared generation, in every worker forked from the same master. A
+    # process that does not share it (another host, or a server started
+    # separately) keeps its entries for up to ttl seconds.
+
+    def __init__(self, maxsize=10000, ttl=60.0, generation=None):
+        self._tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = generation or SharedGeneration()
+        self._seen = self._generation.get()
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def _sync(self):
+        generation = self._generation.get()
+        if generation != self._seen:
+            with self._lock:
+                if generation != self._seen:
+                    self._tokens.clear()
+                    self._seen = generation
+
+    def get(self, token):
+        self._sync()
+        return self._tokens.get(token)
+
+    def peek(self, token):
+        self._sync()
+        return self._tokens.peek(token)
+
+    def generation(self):
+        # Take this before reading the user row and hand it to set()
+        return self._generation.get()
+
+    def set(self, token, user, expires_at, generation=None):
+        # A row read before an invalidation must not be cached after it
+        self._sync()
+        ttl = expires_at - time.time()
+        with self._lock:
+            if generation is None or generation == self._seen:
+                self._tokens.set(token, user, ttl=ttl)
+
+    def invalidate_user(self, user_id):
+        # Call whenever a user is deleted or their role/credentials change.
+        # Tokens are not tracked per user across processes, so every cached
+        # token is dropped and re-verified on its next use.
+        self._generation.bump()
+        with self._lock:
+            self.invalidations += 1
+        self._sync()
+
+    def clear(self):
+        self._tokens.clear()
+
+    def stats(self):
+        stats = self._tokens.stats()
+        stats['invalidations'] = self.invalidations
+        stats['generation'] = self._seen
+        return stats
+
+
+class MemoryBackend:
+    # In-process LRU store bounded by the total size of the cached bytes
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._data = OrderedDict()
+        self._counters = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, self._clock() + ttl)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        value, _ = self._data.pop(key)
+        self._bytes -= len(value)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'entries': len(self._data),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+        }
+
+
+class RedisBackend:
+    # Shared store for multi-worker deployments; works against Redis or any
+    # server speaking its protocol. Eviction is left to the server's maxmemory
+    # policy.
+
+    def __init__(self, url, prefix='ebn:'):
+        import redis  # optional dependency, only needed when configured
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self.url = url
+
+    def get(self, key):
+        return self._client.get(self._prefix + key)
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, value, ex=max(1, int(ttl)))
+
+    def incr(self, key):
+        return self._client.incr(self._prefix + key)
+
+    def get_counter(self, key):
+        value = self._client.get(self._prefix + key)
+        return int(value) if value else 0
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+    def stats(self):
+        info = self._client.info('memory')
+        return {
+            'backend': 'redis',
+            'url': self.url,
+            'bytes': info.get('used_memory'),
+        }
+
+
+def make_backend(url=None, max_bytes=64 * 1024 * 1024):
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    return MemoryBackend(max_bytes=max_bytes)
+
+
+class ResponseCache:
+    # Caches encoded response bodies keyed by namespace + request path.
+    # Invalidation bumps a per-namespace version that is part of every key,
+    # so a write invalidates all pages of a namespace in O(1) and stale
+    # entries simply age out of the LRU.
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def key(self, namespace, key):
+        # Resolve the versioned key before running the handler, so a write
+        # that lands mid-request can't get stale data stored under the new version
+        version = self.backend.get_counter('version:' + namespace)
+        return f'{namespace}:{version}:{key}'
+
+    def get(self, full_key):
+        raw = self.backend.get(full_key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if raw is None:
+            return None
+        return decode_entry(raw)
+
+    def set(self, full_key, body, headers):
+        self.backend.set(full_key, encode_entry(body, headers), self.ttl)
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.incr('version:' + namespace)
+        with self._lock:
+            self.invalidations += len(namespaces)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'ttl': self.ttl,
+            }
+        stats.update(self.backend.stats())
+        return stats
+
+
+def request_key(path, args):
+    # Cache key for a GET request; args is a werkzeug MultiDict
+    return f'{path}?{urlencode(sorted(args.items(multi=True)))}'
+
+
+def table_state(conn, tables):
+    """Change counters for tables, from table_changes.
+
+    Returns a token that changes whenever any of the tables is written, and
+    the time of the latest write as a Unix timestamp.
+    """
+    rows = conn.execute(
+        f"SELECT name, version, changed_at FROM table_changes WHERE name IN ({', '.join('?' * len(tables))})"
+        " ORDER BY name",
+        tuple(tables)
+    ).fetchall()
+    # The change times keep tokens from repeating across databases whose
+    # counters happen to be equal
+    token = ','.join(f'{name}:{version}:{changed_at!r}' for name, version, changed_at in rows)
+    last_modified = max((changed_at for _, _, changed_at in rows), default=None)
+    return token, last_modified
+
+
+def version_etag(key, token):
+    # ETag for the response to key while the tables are at the state token
+    return hashlib.blake2b(f'{key}#{token}'.encode(), digest_size=16).hexdigest()
+
+
+def encode_entry(body, headers):
+    # One header line of JSON, then the raw body, so entries are plain bytes
+    # that any backend can hold
+    return json.dumps(headers, separators=(',', ':')).encode() + b'\n' + body
+
+
+def decode_entry(raw):
+    head, _, body = raw.partition(b'\n')
+    return body, json.loads(head)
@@ -0,0 +1,153 @@
+import threading
+import zlib
+
+try:
+    import brotli  # optional dependency, enables br
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # optional dependency, enables zstd
+except ImportError:
+    zstandard = None
+
+# Content-Encoding tokens in server preference order, used to break ties
+# between encodings the client accepts equally
+ENCODINGS = ('zstd', 'br', 'gzip')
+DEFAULT_LEVELS = {'zstd': 3, 'br': 5, 'gzip': 6}
+
+# Bodies worth compressing; event streams are left alone so every event is
+# delivered as soon as it's written
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+
+
+def installed_encodings():
+    available = {'gzip'}
+    if brotli is not None:
+        available.add('br')
+    if zstandard is not None:
+        available.add('zstd')
+    return [encoding for encoding in ENCODINGS if encoding in available]
+
+
+def parse_accept_encoding(header):
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+class Compressor:
+    # Negotiated response compression. Encodings that aren't installed are
+    # dropped, and bodies under min_size are sent as they are: below about a
+    # packet the framing overhead outweighs the bytes saved.
+
+    def __init__(self, encodings=ENCODINGS, min_size=1024, levels=None):
+        installed = installed_encodings()
+        self.encodings = [encoding for encoding in encodings if encoding in installed]
+        self.min_size = min_size
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self._lock = threading.Lock()
+        self._counts = {encoding: [0, 0, 0] for encoding in self.encodings}  # responses, bytes in, bytes out
+
+    def compressible(self, mimetype):
+        return bool(self.encodings) and mimetype in COMPRESSIBLE_TYPES
+
+    def negotiate(self, accept_encoding):
+        """Best encoding the client accepts, or None for identity."""
+        accepted = parse_accept_encoding(accept_encoding)
+        best = None
+        best_q = 0.0
+        for encoding in self.encodings:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def compress(self, body, encoding):
+        level = self.levels[encoding]
+        if encoding == 'gzip':
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            compressed = compressor.compress(body) + compressor.flush()
+        elif encoding == 'br':
+            compressed = brotli.compress(body, quality=level)
+        else:
+            compressed = zstandard.ZstdCompressor(level=level).compress(body)
+        self._record(encoding, len(body), len(compressed))
+        return compressed
+
+    def stream(self, chunks, encoding):
+        """Compress an iterable body chunk by chunk.
+
+        Each chunk is flushed as it's compressed, so a streamed export still
+        reaches the client batch by batch. The wrapped iterable is closed
+        with this generator, releasing whatever it holds.
+        """
+        flush, finish = self._stream_codec(encoding)
+        size_in = size_out = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                if not chunk:
+                    continue
+                out = flush(chunk)
+                size_in += len(chunk)
+                size_out += len(out)
+                if out:
+                    yield out
+            out = finish()
+            size_out += len(out)
+            yield out
+            self._record(encoding, size_in, size_out)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def _stream_codec(self, encoding):
+        level = self.levels[encoding]
+        if encoding == 'gzip':
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            return (lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH),
+                    compressor.flush)
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=level)
+            return (lambda data: compressor.process(data) + compressor.flush(),
+                    compressor.finish)
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        return (lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+                compressor.flush)
+
+    def _record(self, encoding, size_in, size_out):
+        with self._lock:
+            counts = self._counts[encoding]
+            counts[0] += 1
+            counts[1] += size_in
+            counts[2] += size_out
+
+    def stats(self):
+        with self._lock:
+            encodings = {
+                encoding: {
+                    'responses': responses,
+                    'bytes_in': size_in,
+                    'bytes_out': size_out,
+                    'ratio': size_out / size_in if size_in else None,
+                }
+                for encoding, (responses, size_in, size_out) in self._counts.items()
+            }
+        return {'min_size': self.min_size, 'levels': self.levels, 'encodings': encodings}
@@ -0,0 +1,144 @@
+import re
+
+from dialects import SQLITE
+from listings import ListingQueryError, parse_limit
+
+# Aggregates for /api/admin/stats. Everything here reads the summary tables
+# of migrations.DASHBOARD_SUMMARIES, which hold one row per group rather than
+# per bid, listing or contract, so the GROUP BYs below roll up a few hundred
+# rows at most however much history there is.
+
+BID_BUCKETS = ('day', 'week', 'month')
+LOCATION_GROUPS = ('city', 'state')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+OVERVIEW_QUERIES = {
+    'users': 'SELECT role AS key, SUM(user_count) AS count, NULL AS total FROM user_role_stats GROUP BY role',
+    'listings': '''
+        SELECT status AS key, SUM(listing_count) AS count, SUM(total_price) AS total
+        FROM listing_stats GROUP BY status
+    ''',
+    'bids': '''
+        SELECT status AS key, SUM(bid_count) AS count, SUM(total_amount) AS total
+        FROM bid_daily_stats GROUP BY status
+    ''',
+    'contracts': '''
+        SELECT status AS key, SUM(contract_count) AS count, SUM(total_commission) AS total
+        FROM contract_agent_stats GROUP BY status
+    ''',
+}
+
+# What each overview's total column adds up
+OVERVIEW_TOTALS = {'listings': 'total_price', 'bids': 'total_amount', 'contracts': 'total_commission'}
+
+
+def _money(value):
+    return round(value, 2) if value is not None else None
+
+
+def shape_overview(name, rows):
+    """{'count', 'by_<role|status>': {key: count}} plus the summed total, for one OVERVIEW_QUERIES result."""
+    by = 'by_role' if name == 'users' else 'by_status'
+    overview = {'count': sum(row['count'] for row in rows), by: {row['key']: row['count'] for row in rows}}
+    if name in OVERVIEW_TOTALS:
+        overview[OVERVIEW_TOTALS[name]] = _money(sum(row['total'] for row in rows))
+    if name == 'listings':
+        overview['average_price'] = _money(overview['total_price'] / overview['count']) if overview['count'] else None
+    return overview
+
+
+def _date(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    if not DATE_PATTERN.fullmatch(value):
+        raise ListingQueryError(f'{name} must be a date as YYYY-MM-DD')
+    return value
+
+
+def build_bid_volume_query(args, dialect=SQLITE):
+    """Bids and amount bid per ?bucket= (day, week or month), oldest first.
+
+    ?from= and ?to= bound the days included, and ?status= counts only bids
+    with that status.
+    """
+    bucket = args.get('bucket', 'day')
+    if bucket not in BID_BUCKETS:
+        raise ListingQueryError(f"bucket must be one of: {', '.join(BID_BUCKETS)}")
+    period = {'day': 'day', 'week': dialect.week_start('day'), 'month': 'substr(day, 1, 7)'}[bucket]
+
+    where, params = [], []
+    for name, op in (('from', '>='), ('to', '<=')):
+        value = _date(args, name)
+        if value is not None:
+            where.append(f'day {op} ?')
+            params.append(value)
+    if args.get('status'):
+        where.append('status = ?')
+        params.append(args['status'])
+
+    sql = f'SELECT {period} AS period, SUM(bid_count) AS bids, SUM(total_amount) AS amount FROM bid_daily_stats'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' GROUP BY 1 ORDER BY 1'
+    return sql, params
+
+
+def build_listing_location_query(args):
+    """Listing count and average price per ?group= (city or state), largest first."""
+    group = args.get('group', 'city')
+    if group not in LOCATION_GROUPS:
+        raise ListingQueryError(f"group must be one of: {', '.join(LOCATION_GROUPS)}")
+    columns = 'state, city' if group == 'city' else 'state'
+    limit = parse_limit(args, default=50, maximum=1000)
+
+    sql = f'SELECT {columns}, SUM(listing_count) AS listings, SUM(total_price) AS total_price FROM listing_stats'
+    params = []
+    if args.get('status'):
+        sql += ' WHERE status = ?'
+        params.append(args['status'])
+    sql += f' GROUP BY {columns} ORDER BY listings DESC, {columns} LIMIT ?'
+    return sql, params + [limit]
+
+
+def build_agent_commission_query(args):
+    """Contracts and commission per agent, highest total commission first."""
+    limit = parse_limit(args, default=50, maximum=1000)
+    where, params = '', []
+    if args.get('status'):
+        where = ' WHERE status = ?'
+        params.append(args['status'])
+    sql = f'''
+        SELECT s.agent_id, u.username, s.contracts, s.total_commission
+        FROM (
+            SELECT agent_id, SUM(contract_count) AS contracts, SUM(total_commission) AS total_commission
+            FROM contract_agent_stats{where}
+            GROUP BY agent_id
+        ) s
+        LEFT JOIN users u ON u.id = s.agent_id
+        ORDER BY s.total_commission DESC, s.agent_id
+        LIMIT ?
+    '''
+    return sql, params + [limit]
+
+
+def shape_bid_volume(rows):
+    return [{'period': row['period'], 'bids': row['bids'], 'amount': _money(row['amount'])} for row in rows]
+
+
+def shape_listing_locations(rows):
+    shaped = []
+    for row in rows:
+        location = {key: row[key] for key in row.keys() if key in LOCATION_GROUPS}
+        location['listings'] = row['listings']
+        location['average_price'] = _money(row['total_price'] / row['listings'])
+        shaped.append(location)
+    return shaped
+
+
+def shape_agent_commissions(rows):
+    return [
+        {'agent_id': row['agent_id'], 'username': row['username'], 'contracts': row['contracts'],
+         'total_commission': _money(row['total_commission'])}
+        for row in rows
+    ]
@@ -0,0 +1,508 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import queue
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import quote
+
+from metrics import record_query
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Pragmas applied once to every connection the pool opens
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,      # negative means KiB, so ~16MB of page cache
+    'mmap_size': 134217728,    # 128MB
+    'temp_store': 'MEMORY',
+}
+
+
+class TimedCursor:
+    # Cursor proxy adding each statement, and the time spent executing it and
+    # stepping through its rows, to the current request's metrics
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, fn, *args, statements=0):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            record_query(time.perf_counter() - start, statements)
+
+    def execute(self, sql, params=()):
+        self._timed(self._cursor.execute, sql, params, statements=1)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._timed(self._cursor.executemany, sql, seq_of_params, statements=1)
+        return self
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed(self._cursor.fetchmany)
+        return self._timed(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._timed(next, self._cursor)
+
+
+class PooledConnection:
+    # Thin proxy around a sqlite3 connection; close() hands it back to the pool
+    # instead of closing it, so handlers keep their existing open/close pattern.
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return TimedCursor(self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        return False
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._conn)
+
+
+class ConnectionPool:
+    def __init__(self, path, size=8, timeout=10.0, busy_timeout=5000,
+                 statement_cache_size=256, health_check_interval=30.0, pragmas=None,
+                 on_connect=None, read_only=False):
+        self.path = path
+        # Read-only connections open the file with mode=ro, so they can never
+        # take the write lock, and leave the journal mode to the writers
+        self.read_only = read_only
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.statement_cache_size = statement_cache_size
+        self.health_check_interval = health_check_interval
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        if read_only:
+            self.pragmas.pop('journal_mode', None)
+        # Called with every new connection, e.g. to register SQL functions
+        self.on_connect = on_connect
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        # Connections opened before the last recycle() are closed on release
+        self._generation = 0
+        self._generations = {}
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+        }
+        self._in_use = 0
+
+    def _connect(self):
+        if self.read_only:
+            target, uri = f'file:{quote(os.path.abspath(self.path))}?mode=ro', True
+        else:
+            target, uri = self.path, False
+        conn = sqlite3.connect(
+            target,
+            timeout=self.busy_timeout / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            uri=uri,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        with self._lock:
+            self._stats['created'] += 1
+            self._generations[id(conn)] = self._generation
+        return conn
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._generations.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._stats['closed'] += 1
+
+    def _healthy(self, conn):
+        # Only ping connections that have been sitting idle for a while
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolTimeout(f'No database connection available after {self.timeout}s')
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+                if not self._healthy(conn):
+                    self._discard(conn)
+                    conn = None
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._in_use += 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._generations.get(id(conn)) != self._generation:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.put(conn)
+        except sqlite3.Error:
+            self._discard(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def recycle(self):
+        # Close idle connections now and those in use when they come back, so
+        # every connection from here on opens the database file afresh
+        with self._lock:
+            self._generation += 1
+        self.close_all()
+
+    def reset(self):
+        # Drop every idle connection without touching them; used after fork(),
+        # where inherited sqlite handles must not be reused by the child.
+        self._idle = queue.LifoQueue()
+        self._last_used = {}
+        self._generations = {}
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._in_use = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_use'] = self._in_use
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        stats['path'] = self.path
+        stats['read_only'] = self.read_only
+        stats['pragmas'] = self.pragmas
+        stats['statement_cache_size'] = self.statement_cache_size
+        return stats
+
+
+class SnapshotPool(ConnectionPool):
+    # Read-only pool over a copy of source's database rather than the live
+    # file. The copy is taken with the backup API on first use and then every
+    # refresh_interval seconds by a background thread, written next to path
+    # and renamed over it; connections to the previous copy are recycled.
+    # Reads from it can be up to refresh_interval behind the primary.
+
+    def __init__(self, source, path, refresh_interval=5.0, **kwargs):
+        super().__init__(path, read_only=True, **kwargs)
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self._refreshed_at = None
+        self._stats['refreshes'] = 0
+        self._stats['refresh_failures'] = 0
+
+    def acquire(self):
+        if self._refresher is None:
+            self._start()
+        return super().acquire()
+
+    def _start(self):
+        with self._refresh_lock:
+            if self._refresher is None:
+                self.refresh()
+                self._refresher = threading.Thread(target=self._refresh_loop, name='db-snapshot', daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                with self._lock:
+                    self._stats['refresh_failures'] += 1
+
+    def refresh(self):
+        # The pid keeps workers refreshing the same snapshot out of each
+        # other's way; the rename is atomic, so readers see one copy or the other
+        partial = f'{self.path}.{os.getpid()}.tmp'
+        source = self.source.acquire()
+        try:
+            copy = sqlite3.connect(partial)
+            try:
+                source.raw.backup(copy)
+                # A standalone file, so read-only connections need no -wal or -shm
+                copy.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                copy.close()
+        finally:
+            source.close()
+        os.replace(partial, self.path)
+        with self._lock:
+            self._stats['refreshes'] += 1
+        self._refreshed_at = time.monotonic()
+        self.recycle()
+
+    def reset(self):
+        # After fork(): the refresher thread stayed behind in the parent
+        super().reset()
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+
+    def stats(self):
+        stats = super().stats()
+        stats['refresh_interval'] = self.refresh_interval
+        stats['snapshot_age_s'] = (
+            round(time.monotonic() - self._refreshed_at, 3) if self._refreshed_at is not None else None
+        )
+        return stats
+
+
+class GroupCommitWriter:
+    # Every write in the process goes through one thread, so request threads
+    # never contend for the database's write lock. Callers queue a unit of
+    # work, fn(conn, *args), and block on its result. The thread takes the
+    # first unit waiting plus whatever else arrives in the next window_ms (up
+    # to max_batch), runs each under its own savepoint, so a unit that raises
+    # only undoes its own changes, and commits the lot once.
+    #
+    # A unit's exception is raised to its caller once the batch commits; if
+    # the commit itself fails, every caller in the batch gets that error.
+    # Units run in their caller's context, so their queries still count
+    # towards the request's metrics.
+
+    def __init__(self, pool, begin='BEGIN IMMEDIATE', window_ms=2.0, max_batch=256):
+        self.pool = pool
+        self.begin = begin
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = time.monotonic()
+        self._stats = {
+            'writes': 0,
+            'failed_writes': 0,
+            'commits': 0,
+            'failed_commits': 0,
+            'largest_batch': 0,
+        }
+
+    def submit(self, fn, *args):
+        """Run fn(conn, *args) in the next group commit; returns its result."""
+        if self._thread is None:
+            self._start()
+        future = Future()
+        self._queue.put((fn, args, contextvars.copy_context(), future))
+        return future.result()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            conn = self.pool.acquire()
+            try:
+                conn.execute(self.begin)
+                try:
+                    for fn, args, context, future in batch:
+                        conn.execute('SAVEPOINT unit')
+                        try:
+                            result = context.run(fn, conn, *args)
+                        except Exception as e:
+                            conn.execute('ROLLBACK TO unit')
+                            conn.execute('RELEASE unit')
+                            outcomes.append((future, None, e))
+                        else:
+                            conn.execute('RELEASE unit')
+                            outcomes.append((future, result, None))
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            finally:
+                conn.close()
+        except Exception as e:
+            with self._lock:
+                self._stats['failed_commits'] += 1
+            for _, _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self._stats['commits'] += 1
+            self._stats['writes'] += len(batch)
+            self._stats['failed_writes'] += sum(1 for _, _, error in outcomes if error is not None)
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def reset(self):
+        # After fork(): the writer thread stayed behind in the parent
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        elapsed = time.monotonic() - self._started
+        stats['queued'] = self._queue.qsize()
+        stats['window_ms'] = self.window * 1000
+        stats['max_batch'] = self.max_batch
+        stats['writes_per_commit'] = round(stats['writes'] / stats['commits'], 2) if stats['commits'] else None
+        stats['commits_per_second'] = round(stats['commits'] / elapsed, 2)
+        stats['writes_per_second'] = round(stats['writes'] / elapsed, 2)
+        return stats
+
+
+class AsyncPool:
+    # Async front for a connection pool, for the ASGI handlers. Database
+    # calls block, so each one runs on a small executor sized to the pool;
+    # the event loop only ever awaits the result.
+
+    def __init__(self, pool, workers=None):
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or pool.size,
+            thread_name_prefix='db',
+        )
+
+    def _call(self, fn, args):
+        conn = self.pool.acquire()
+        try:
+            return fn(conn, *args)
+        finally:
+            conn.close()
+
+    async def run(self, fn, *args):
+        # Run fn(conn, *args) with a pooled connection off the event loop, in
+        # the caller's context so its queries count towards the request
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, self._call, fn, args)
+
+    async def call(self, fn, *args):
+        # Run fn(*args), e.g. a Repository method, off the event loop in the
+        # caller's context
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, fn, *args)
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,80 @@
+# SQL that differs between the storage backends. The query builders in
+# listings, search and geo take one of these; everything else they emit runs
+# unchanged on SQLite and PostgreSQL.
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+
+    # Take the write lock up front so the transaction never has to upgrade
+    # from a read lock, which can fail with SQLITE_BUSY without waiting
+    begin_write = 'BEGIN IMMEDIATE'
+    begin_migration = 'BEGIN IMMEDIATE'
+
+    # Bids are already serialized by BEGIN IMMEDIATE's database-wide lock
+    row_lock = ''
+    # and so are job claims
+    skip_locked = ''
+
+    def json_object(self, pairs):
+        return 'json_object(' + ', '.join(f"'{key}', {expression}" for key, expression in pairs) + ')'
+
+    def child_array(self, table, column):
+        # NULLIF keeps the old contract of null (not []) for listings without any
+        return f'''json(NULLIF((
+    SELECT json_group_array({column}) FROM (
+        SELECT {column} FROM {table} c
+        WHERE c.property_id = p.id ORDER BY c.position
+    )
+), '[]'))'''
+
+    def document(self, expression):
+        # json_object() already returns text
+        return expression
+
+    def round(self, expression, digits):
+        return f'round({expression}, {digits})'
+
+    def week_start(self, day):
+        # The Monday on or before a YYYY-MM-DD date, in the same format
+        return f"date({day}, '-6 days', 'weekday 1')"
+
+
+class PostgresDialect:
+    name = 'postgresql'
+
+    # Writers lock only the rows they touch; the schema lock keeps two
+    # processes starting at once from applying the same migration
+    begin_write = 'BEGIN'
+    begin_migration = 'BEGIN; LOCK TABLE schema_migrations IN SHARE ROW EXCLUSIVE MODE'
+
+    # Bids for one listing queue on its row instead of a database lock
+    row_lock = ' FOR UPDATE'
+    # Workers claiming jobs pass over the rows other workers have locked
+    skip_locked = ' FOR UPDATE SKIP LOCKED'
+
+    def json_object(self, pairs):
+        # json rather than jsonb keeps the keys in the order they're listed
+        return 'json_build_object(' + ', '.join(f"'{key}', {expression}" for key, expression in pairs) + ')'
+
+    def child_array(self, table, column):
+        # json_agg() over no rows is NULL, matching SQLite's null for none
+        return f'''(
+    SELECT json_agg({column} ORDER BY c.position) FROM {table} c
+    WHERE c.property_id = p.id
+)'''
+
+    def document(self, expression):
+        # As text, so rows come back encoded the way SQLite's do
+        return f'({expression})::text'
+
+    def round(self, expression, digits):
+        # round(x, n) only exists for numeric
+        return f'round(({expression})::numeric, {digits})'
+
+    def week_start(self, day):
+        return f"to_char(date_trunc('week', ({day})::date), 'YYYY-MM-DD')"
+
+
+SQLITE = SQLiteDialect()
+POSTGRES = PostgresDialect()
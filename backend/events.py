@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import json
+import queue
+import threading
+from collections import deque
+
+
+class Subscription:
+    def __init__(self, topic, max_queue):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def put_nowait(self, event):
+        # Called from publisher threads; raises queue.Full when behind
+        self.queue.put_nowait(event)
+
+
+class AsyncSubscription(Subscription):
+    # Delivers into an asyncio.Queue on the subscriber's event loop, so an
+    # ASGI stream waits for events without holding a thread
+
+    def __init__(self, topic, max_queue, loop):
+        self.topic = topic
+        self.queue = asyncio.Queue()
+        self.dropped = False
+        self.max_queue = max_queue
+        self._loop = loop
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def put_nowait(self, event):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise queue.Full
+            self._pending += 1
+        try:
+            self._loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # The subscriber's loop has shut down
+            raise queue.Full
+
+    async def get(self, timeout):
+        event = await asyncio.wait_for(self.queue.get(), timeout)
+        with self._lock:
+            self._pending -= 1
+        return event
+
+
+class EventHub:
+    # In-process fan-out of bid events to Server-Sent Events subscribers.
+    #
+    # Every topic (a property id) keeps a short ring buffer of recent events,
+    # so a client reconnecting with Last-Event-ID gets exactly what it missed.
+    # Each subscriber has a bounded queue; a subscriber that falls behind is
+    # dropped rather than slowing publishers down, and resumes from the ring
+    # buffer when it reconnects. Events only reach subscribers connected to
+    # the same process.
+
+    def __init__(self, history=256, max_queue=512):
+        self.history = history
+        self.max_queue = max_queue
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._buffers = {}
+        self._evicted = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'dropped_subscribers': 0}
+
+    def publish(self, topic, event_type, data):
+        payload = json.dumps(data, separators=(',', ':'), default=str)
+        with self._lock:
+            event_id = next(self._ids)
+            self._last_id = event_id
+            event = (event_id, event_type, payload)
+            buffer = self._buffers.get(topic)
+            if buffer is None:
+                buffer = self._buffers[topic] = deque(maxlen=self.history)
+            if len(buffer) == self.history:
+                self._evicted[topic] = buffer[0][0]
+            buffer.append(event)
+            subscribers = list(self._subscribers.get(topic, ()))
+            self._stats['published'] += 1
+
+        delivered = 0
+        for sub in subscribers:
+            try:
+                sub.put_nowait(event)
+                delivered += 1
+            except queue.Full:
+                self._drop(sub)
+        with self._lock:
+            self._stats['delivered'] += delivered
+        return event_id
+
+    def subscribe(self, topic, last_event_id=None, loop=None):
+        """Register a subscriber; returns (subscription, backlog).
+
+        backlog is the list of buffered events after last_event_id, or None
+        when that id has already left the ring buffer and the client must
+        reload the full state instead. Pass the running event loop to get an
+        AsyncSubscription.
+        """
+        if loop is None:
+            sub = Subscription(topic, self.max_queue)
+        else:
+            sub = AsyncSubscription(topic, self.max_queue, loop)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(sub)
+            backlog = []
+            if last_event_id is not None:
+                buffer = self._buffers.get(topic, ())
+                backlog = [event for event in buffer if event[0] > last_event_id]
+                # Events were lost if the buffer already evicted one the client
+                # hadn't seen, or the id comes from a previous server run
+                if (last_event_id < self._evicted.get(topic, 0)
+                        or last_event_id > self._last_id):
+                    backlog = None
+        return sub, backlog
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subscribers = self._subscribers.get(sub.topic)
+            if subscribers is not None:
+                subscribers.discard(sub)
+                if not subscribers:
+                    del self._subscribers[sub.topic]
+
+    def _drop(self, sub):
+        sub.dropped = True
+        self.unsubscribe(sub)
+        with self._lock:
+            self._stats['dropped_subscribers'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['topics'] = len(self._buffers)
+            stats['subscribers'] = sum(len(s) for s in self._subscribers.values())
+            stats['last_event_id'] = self._last_id
+        return stats
+
+
+def _sse_preamble(hub, backlog, retry_ms):
+    yield f'retry: {retry_ms}\n\n'
+    if backlog is None:
+        # The client missed events we no longer have; it should refetch
+        yield format_sse(hub.stats()['last_event_id'], 'reset', '{}')
+    else:
+        for event in backlog:
+            yield format_sse(*event)
+
+
+def format_sse(event_id, event_type, payload):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+def stream_events(hub, topic, last_event_id=None, keepalive=15.0, retry_ms=3000):
+    # Generator producing the text/event-stream body for one subscriber
+    sub, backlog = hub.subscribe(topic, last_event_id)
+    try:
+        yield from _sse_preamble(hub, backlog, retry_ms)
+        while not sub.dropped:
+            try:
+                event = sub.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(*event)
+    finally:
+        hub.unsubscribe(sub)
+
+
+async def stream_events_async(hub, topic, last_event_id=None, keepalive=15.0, retry_ms=3000):
+    # Same stream as stream_events, as an async generator for the ASGI app
+    sub, backlog = hub.subscribe(topic, last_event_id, loop=asyncio.get_running_loop())
+    try:
+        for chunk in _sse_preamble(hub, backlog, retry_ms):
+            yield chunk
+        while not sub.dropped:
+            try:
+                event = await sub.get(keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(*event)
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _encode(value):
+    # Keys sorted, as jsonify sorted them before these lists were streamed
+    return json.dumps(value, separators=(',', ':'), sort_keys=True, default=str)
+
+
+def stream_query(open_cursor, sql, params=(), fmt='json', batch_size=500):
+    """Yield an encoded export of a query, one fetchmany() batch at a time.
+
+    open_cursor(sql, params, batch_size) is a context manager giving a
+    cursor over the rows, e.g. Repository.streaming_cursor. It's only entered
+    once the response body starts being consumed and is exited when the
+    generator finishes or is closed, so memory stays at one batch no matter
+    how many rows the table holds.
+    """
+    with open_cursor(sql, params, batch_size) as cursor:
+        columns = [d[0] for d in cursor.description]
+
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue()
+        elif fmt == 'json':
+            yield '['
+
+        first = True
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if fmt == 'csv':
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(tuple(row) for row in rows)
+                yield buffer.getvalue()
+            elif fmt == 'ndjson':
+                yield ''.join(_encode(dict(zip(columns, row))) + '\n' for row in rows)
+            else:
+                chunk = ','.join(_encode(dict(zip(columns, row))) for row in rows)
+                yield chunk if first else ',' + chunk
+            first = False
+
+        if fmt == 'json':
+            yield ']'
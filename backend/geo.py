@@ -0,0 +1,233 @@
+import csv
+import math
+import os
+
+from dialects import SQLITE
+from listings import ListingQueryError, filter_clauses, parse_fields, parse_key_case, parse_limit, property_json_sql
+from serializers import output_key
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.045
+MAX_RADIUS_KM = 500
+
+# Zip code centroids loaded into zip_centroids by the migration. The shipped
+# file only covers a handful of metro areas; point GEOCODE_DATA_PATH at a full
+# zip_code,latitude,longitude dataset (or use `flask load-zip-centroids`)
+ZIP_CENTROIDS_PATH = os.environ.get(
+    'GEOCODE_DATA_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'zip_centroids.csv'),
+)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def register_functions(conn):
+    # Registered on every pooled connection; SQLite's own math functions are
+    # a compile-time option we can't rely on
+    conn.create_function('haversine_km', 4, haversine_km, deterministic=True)
+
+
+def load_zip_centroids(conn, path):
+    # Load (or refresh) the local geocoding table from a CSV with
+    # zip_code,latitude,longitude columns; returns the number of rows read
+    with open(path, newline='') as f:
+        rows = [
+            (row['zip_code'].strip(), float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)
+        ]
+    conn.executemany(
+        'INSERT INTO zip_centroids (zip_code, latitude, longitude) VALUES (?, ?, ?)'
+        ' ON CONFLICT (zip_code) DO UPDATE SET latitude = excluded.latitude, longitude = excluded.longitude',
+        rows
+    )
+    return len(rows)
+
+
+def backfill_coordinates(conn):
+    # Geocode every property that has a known zip code but no coordinates
+    cursor = conn.execute('''
+    UPDATE properties SET
+        latitude = (SELECT z.latitude FROM zip_centroids z WHERE z.zip_code = properties.zip_code),
+        longitude = (SELECT z.longitude FROM zip_centroids z WHERE z.zip_code = properties.zip_code)
+    WHERE latitude IS NULL
+      AND zip_code IN (SELECT zip_code FROM zip_centroids)
+    ''')
+    return cursor.rowcount
+
+
+def explicit_coordinates(data):
+    if data.get('latitude') is None or data.get('longitude') is None:
+        return None
+    try:
+        return float(data['latitude']), float(data['longitude'])
+    except (TypeError, ValueError):
+        raise ListingQueryError('latitude and longitude must be numbers')
+
+
+def geocode(cursor, data, zip_code):
+    """Coordinates for a create/update payload: explicit latitude/longitude
+    win, otherwise the zip code's centroid, otherwise (None, None)."""
+    coordinates = explicit_coordinates(data)
+    if coordinates is not None:
+        return coordinates
+    if not zip_code:
+        return None, None
+    cursor.execute('SELECT latitude, longitude FROM zip_centroids WHERE zip_code = ?', (str(zip_code),))
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def lookup_centroids(conn, zip_codes, chunk_size=500):
+    # {zip_code: (latitude, longitude)} for many zip codes in a few queries
+    zip_codes = list({str(z) for z in zip_codes if z})
+    centroids = {}
+    for i in range(0, len(zip_codes), chunk_size):
+        chunk = zip_codes[i:i + chunk_size]
+        rows = conn.execute(
+            f"SELECT zip_code, latitude, longitude FROM zip_centroids WHERE zip_code IN ({', '.join('?' * len(chunk))})",
+            chunk
+        )
+        centroids.update((row[0], (row[1], row[2])) for row in rows)
+    return centroids
+
+
+def _float(args, name, low, high):
+    try:
+        value = float(args[name])
+    except KeyError:
+        raise ListingQueryError(f'{name} is required')
+    except ValueError:
+        raise ListingQueryError(f'{name} must be a number')
+    if not low <= value <= high:
+        raise ListingQueryError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def parse_bbox(args):
+    bbox = (
+        _float(args, 'minLat', -90, 90), _float(args, 'maxLat', -90, 90),
+        _float(args, 'minLng', -180, 180), _float(args, 'maxLng', -180, 180),
+    )
+    if bbox[0] > bbox[1] or bbox[2] > bbox[3]:
+        raise ListingQueryError('minLat/minLng must not exceed maxLat/maxLng')
+    return bbox
+
+
+def radius_bbox(lat, lng, radius_km):
+    # Bounding box enclosing the circle, used as the R*Tree prefilter
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return (max(lat - dlat, -90), min(lat + dlat, 90), max(lng - dlng, -180), min(lng + dlng, 180))
+
+
+GEO_FROM = '''
+    FROM properties_geo g
+    JOIN property_keys k ON k.key = g.key
+    JOIN properties p ON p.id = k.property_id
+    WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?
+'''
+
+# PostgreSQL has no R*Tree without extensions; a btree on (latitude,
+# longitude) narrows the box to a latitude band and filters longitude in it
+POSTGRES_GEO_FROM = '''
+    FROM properties p
+    WHERE p.latitude BETWEEN ? AND ? AND p.longitude BETWEEN ? AND ?
+'''
+
+
+def geo_from(dialect):
+    return GEO_FROM if dialect is SQLITE else POSTGRES_GEO_FROM
+
+
+def build_bbox_query(args, dialect=SQLITE):
+    bbox = parse_bbox(args)
+    where, params = filter_clauses(args)
+    limit = parse_limit(args, default=200, maximum=1000)
+    fields = parse_fields(args.get('fields'))
+    case = parse_key_case(args)
+    sql = f'SELECT {property_json_sql(fields, case, dialect)} AS doc' + geo_from(dialect)
+    for clause in where:
+        sql += ' AND ' + clause
+    sql += ' LIMIT ?'
+    return sql, list(bbox) + params + [limit]
+
+
+def build_radius_query(args, dialect=SQLITE):
+    lat = _float(args, 'lat', -90, 90)
+    lng = _float(args, 'lng', -180, 180)
+    radius_km = _float(args, 'radiusKm', 0, MAX_RADIUS_KM)
+    where, params = filter_clauses(args)
+    limit = parse_limit(args, default=200, maximum=1000)
+    fields = parse_fields(args.get('fields'))
+    case = parse_key_case(args)
+    distance = [(output_key('distance_km', case), dialect.round('d.distance', 3))]
+    sql = (
+        f'SELECT {property_json_sql(fields, case, dialect, extra=distance)} AS doc'
+        ' FROM (SELECT p.id AS id, haversine_km(?, ?, p.latitude, p.longitude) AS distance'
+        + geo_from(dialect)
+    )
+    for clause in where:
+        sql += ' AND ' + clause
+    sql += ') d JOIN properties p ON p.id = d.id WHERE d.distance <= ? ORDER BY d.distance LIMIT ?'
+    return sql, [lat, lng] + list(radius_bbox(lat, lng, radius_km)) + params + [radius_km, limit]
+
+
+def build_cluster_query(args, dialect=SQLITE):
+    # Grid clustering for zoomed-out map tiles: the box is cut into square
+    # cells sized from the web-map zoom level and each non-empty cell comes
+    # back as one marker with its count and centroid (and the listing id when
+    # it holds a single one). Without filters this never leaves the R*Tree.
+    bbox = parse_bbox(args)
+    try:
+        zoom = int(args.get('zoom', 4))
+    except ValueError:
+        raise ListingQueryError('zoom must be an integer')
+    zoom = max(0, min(zoom, 20))
+    cell = 360.0 / (2 ** zoom) / 8
+    where, params = filter_clauses(args)
+    sql = cluster_sql(where) if dialect is SQLITE else postgres_cluster_sql(where, dialect)
+    return sql, list(bbox) + params + [cell, cell], {'cell_degrees': cell, 'zoom': zoom}
+
+
+def cluster_sql(where):
+    sql = """
+    SELECT json_object(
+        'latitude', round(c.latitude, 5), 'longitude', round(c.longitude, 5), 'count', c.count,
+        'id', CASE WHEN c.count = 1 THEN (SELECT property_id FROM property_keys WHERE key = c.key) END
+    ) AS doc
+    FROM (
+        SELECT AVG(g.min_lat) AS latitude, AVG(g.min_lng) AS longitude, COUNT(*) AS count, MIN(g.key) AS key
+        FROM properties_geo g
+    """
+    if where:
+        sql += 'JOIN property_keys k ON k.key = g.key JOIN properties p ON p.id = k.property_id '
+    sql += 'WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?'
+    for clause in where:
+        sql += ' AND ' + clause
+    sql += ' GROUP BY CAST((g.min_lat + 90) / ? AS INTEGER), CAST((g.min_lng + 180) / ? AS INTEGER)) c'
+    return sql
+
+
+def postgres_cluster_sql(where, dialect):
+    # Same cells as the R*Tree version; floor() because a CAST to integer
+    # rounds on PostgreSQL
+    doc = dialect.json_object([
+        ('latitude', dialect.round('c.latitude', 5)), ('longitude', dialect.round('c.longitude', 5)),
+        ('count', 'c.count'), ('id', 'CASE WHEN c.count = 1 THEN c.id END'),
+    ])
+    sql = f'''
+    SELECT {dialect.document(doc)} AS doc
+    FROM (
+        SELECT AVG(p.latitude) AS latitude, AVG(p.longitude) AS longitude, COUNT(*) AS count, MIN(p.id) AS id
+    ''' + POSTGRES_GEO_FROM
+    for clause in where:
+        sql += ' AND ' + clause
+    sql += ' GROUP BY floor((p.latitude + 90) / ?), floor((p.longitude + 180) / ?)) c'
+    return sql
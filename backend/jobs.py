@@ -0,0 +1,284 @@
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# queued: waiting for available_at; running: claimed by a worker until
+# available_at, after which another worker may take it over; done and failed
+# are final, failed once max_attempts have all raised
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+def enqueue_job(conn, kind, payload, key=None, delay=0.0, max_attempts=5):
+    """Queue a job on conn, in whatever transaction it's in.
+
+    Run it in the transaction of the write that needs the job, so the job is
+    committed (or rolled back) with it. A job whose key matches one already
+    queued, running or finished within the retention period is dropped;
+    returns whether this one was queued.
+    """
+    now = time.time()
+    return conn.execute(
+        """
+        INSERT INTO jobs (kind, payload, idempotency_key, max_attempts, available_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        """,
+        (kind, json.dumps(payload, separators=(',', ':')), key, max_attempts, now + delay, now)
+    ).rowcount > 0
+
+
+def claim_job(conn, visibility_timeout, skip_locked=''):
+    """Take the job that has been due longest, or None when nothing is due.
+
+    The job comes back as a dict with its payload decoded, attempts counting
+    this one and due_at the time it fell due. Claiming hides it from other
+    workers for visibility_timeout seconds; a worker that dies holding it
+    loses it to the next claim after that. skip_locked is the dialect's, so
+    concurrent claims on PostgreSQL pass over each other's rows instead of
+    waiting on them.
+    """
+    now = time.time()
+    row = conn.execute(
+        f"""
+        SELECT id, kind, payload, attempts, max_attempts, available_at FROM jobs
+        WHERE status IN ('queued', 'running') AND available_at <= ?
+        ORDER BY available_at
+        LIMIT 1{skip_locked}
+        """,
+        (now,)
+    ).fetchone()
+    if row is None:
+        return None
+    conn.execute(
+        "UPDATE jobs SET status = 'running', attempts = attempts + 1, available_at = ?, started_at = ? WHERE id = ?",
+        (now + visibility_timeout, now, row['id'])
+    )
+    job = dict(row, payload=json.loads(row['payload']), attempts=row['attempts'] + 1, due_at=row['available_at'])
+    del job['available_at']
+    return job
+
+
+def next_due_at(conn):
+    # When the next job falls due, or None when there are none
+    return conn.execute(
+        "SELECT MIN(available_at) FROM jobs WHERE status IN ('queued', 'running')"
+    ).fetchone()[0]
+
+
+def complete_job(conn, job_id, attempt):
+    # False when the job was taken over after its visibility timeout ran out
+    return conn.execute(
+        "UPDATE jobs SET status = 'done', finished_at = ?, last_error = NULL"
+        " WHERE id = ? AND attempts = ? AND status = 'running'",
+        (time.time(), job_id, attempt)
+    ).rowcount > 0
+
+
+def fail_job(conn, job_id, attempt, error, retry_delay=None):
+    """Record a failed attempt; retried after retry_delay, or failed for good when None."""
+    now = time.time()
+    if retry_delay is None:
+        sql = "UPDATE jobs SET status = 'failed', finished_at = ?, last_error = ?"
+        params = (now, error)
+    else:
+        sql = "UPDATE jobs SET status = 'queued', available_at = ?, last_error = ?"
+        params = (now + retry_delay, error)
+    return conn.execute(
+        sql + " WHERE id = ? AND attempts = ? AND status = 'running'", params + (job_id, attempt)
+    ).rowcount > 0
+
+
+def purge_jobs(conn, finished_before):
+    # Finished jobs are kept a while so their idempotency keys hold
+    return conn.execute(
+        "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (finished_before,)
+    ).rowcount
+
+
+def retry_failed_jobs(conn, kind=None):
+    # Failed jobs get max_attempts more, from now
+    sql = ("UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, finished_at = NULL"
+           " WHERE status = 'failed'")
+    params = (time.time(),)
+    if kind is not None:
+        sql += ' AND kind = ?'
+        params += (kind,)
+    return conn.execute(sql, params).rowcount
+
+
+def job_queue_depth(conn):
+    """Jobs per unfinished status, and how long the longest-due queued job has waited (lag_s)."""
+    now = time.time()
+    rows = conn.execute(
+        """
+        SELECT status, COUNT(*) AS jobs, MIN(CASE WHEN status = 'queued' THEN available_at END) AS due
+        FROM jobs WHERE status IN ('queued', 'running', 'failed')
+        GROUP BY status
+        """
+    ).fetchall()
+    depth = {status: 0 for status in ('queued', 'running', 'failed')}
+    depth['lag_s'] = 0.0
+    for row in rows:
+        depth[row['status']] = row['jobs']
+        if row['due'] is not None:
+            depth['lag_s'] = round(max(0.0, now - row['due']), 3)
+    return depth
+
+
+class JobQueue:
+    # Worker threads running the jobs queued in the database's jobs table.
+    # Each worker claims one due job at a time, runs its kind's handler
+    # outside any transaction, then marks it done; a handler that raises is
+    # retried with exponential backoff until max_attempts, then left failed.
+    #
+    # Delivery is at least once: a job whose worker died, or outlived its
+    # visibility timeout, runs again, so handlers must be idempotent. Every
+    # process with workers takes jobs from the same table, and one that
+    # queues a job wakes its own workers at once; the others find it within
+    # poll_interval.
+
+    def __init__(self, repository, workers=2, poll_interval=1.0, visibility_timeout=60.0,
+                 retry_backoff=1.0, max_retry_delay=300.0, retention=86400.0, metrics=None):
+        self.repository = repository
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.retry_backoff = retry_backoff
+        self.max_retry_delay = max_retry_delay
+        self.retention = retention
+        self.metrics = metrics
+        self._handlers = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._purged_at = 0.0
+        self._stats = {
+            'completed': 0,
+            'retried': 0,
+            'failed': 0,
+            'lost': 0,
+        }
+
+    def handler(self, kind):
+        """Decorator registering fn(payload) as the handler for kind."""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def notify(self):
+        # Call after committing a write that queued jobs
+        self._wake.set()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            self._stopping.clear()
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def shutdown(self, timeout=None):
+        # Lets running jobs finish; jobs not done by timeout are picked up
+        # again once their visibility timeout runs out
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def reset(self):
+        # After fork(): the worker threads stayed behind in the parent
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.repository.claim_job(self.visibility_timeout)
+            except Exception:
+                logger.exception('Could not claim a job')
+                job = None
+            if job is not None:
+                self._execute(job)
+                continue
+            self._purge()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def run_pending(self):
+        """Run every due job in this thread, e.g. from a CLI command; returns how many ran."""
+        count = 0
+        while True:
+            job = self.repository.claim_job(self.visibility_timeout)
+            if job is None:
+                return count
+            self._execute(job)
+            count += 1
+
+    def _execute(self, job):
+        kind, attempt = job['kind'], job['attempts']
+        started = time.time()
+        if attempt == 1 and self.metrics is not None:
+            self.metrics.observe_job_wait(kind, max(0.0, started - job['due_at']))
+
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f'No handler for job kind {kind!r}')
+            if attempt > job['max_attempts']:
+                raise RuntimeError('Worker lost the job after its last attempt')
+            handler(job['payload'])
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            final = handler is None or attempt >= job['max_attempts']
+            delay = None if final else min(self.retry_backoff * 2 ** (attempt - 1), self.max_retry_delay)
+            logger.warning('Job %s (%s) attempt %s failed: %s', job['id'], kind, attempt, error)
+            self._finish(kind, started, 'failed' if final else 'retried',
+                         self.repository.fail_job, job['id'], attempt, error, delay)
+            return
+        self._finish(kind, started, 'completed', self.repository.complete_job, job['id'], attempt)
+
+    def _finish(self, kind, started, outcome, record, *args):
+        try:
+            recorded = record(*args)
+        except Exception:
+            # The job is still claimed; it runs again after its visibility timeout
+            logger.exception('Could not record the outcome of job %s', args[0])
+            recorded = False
+        with self._lock:
+            self._stats[outcome if recorded else 'lost'] += 1
+        if self.metrics is not None:
+            self.metrics.observe_job_run(kind, outcome, time.time() - started)
+
+    def _purge(self):
+        now = time.time()
+        if now - self._purged_at < self.retention / 24:
+            return
+        self._purged_at = now
+        try:
+            self.repository.purge_jobs(now - self.retention)
+        except Exception:
+            logger.exception('Could not purge finished jobs')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = len(self._threads)
+        stats.update({
+            'handlers': sorted(self._handlers),
+            'poll_interval': self.poll_interval,
+            'visibility_timeout': self.visibility_timeout,
+            'retention': self.retention,
+        })
+        return stats
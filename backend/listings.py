@@ -0,0 +1,256 @@
+import base64
+import json
+
+from dialects import SQLITE
+from serializers import camel_case, output_key, row_plan
+
+
+# Columns a client may ask for with ?fields=
+PROPERTY_FIELDS = (
+    'id', 'title', 'description', 'type', 'property_type', 'price', 'bedrooms',
+    'bathrooms', 'area', 'street', 'city', 'state', 'zip_code', 'features',
+    'images', 'owner_id', 'status', 'listed_at', 'bid_stats', 'latitude', 'longitude',
+)
+
+# Exact-match filters: query parameter -> column
+EQUALITY_FILTERS = {
+    'city': 'city',
+    'state': 'state',
+    'type': 'type',
+    'propertyType': 'property_type',
+    'status': 'status',
+}
+
+# Range filters: query parameter -> (column, operator)
+RANGE_FILTERS = {
+    'minPrice': ('price', '>='),
+    'maxPrice': ('price', '<='),
+    'minBedrooms': ('bedrooms', '>='),
+    'maxBedrooms': ('bedrooms', '<='),
+    'minArea': ('area', '>='),
+    'maxArea': ('area', '<='),
+}
+
+# Sort name -> (column, direction). Every sort is tie-broken on id so the
+# (column, id) pair is unique and can be used as a keyset cursor.
+SORTS = {
+    'newest': ('listed_at', 'DESC'),
+    'oldest': ('listed_at', 'ASC'),
+    'price_asc': ('price', 'ASC'),
+    'price_desc': ('price', 'DESC'),
+    'area_asc': ('area', 'ASC'),
+    'area_desc': ('area', 'DESC'),
+}
+
+# Summary maintained by triggers on bids, so clients don't need the bid history
+BID_STATS_KEYS = ('high_bid', 'bid_count', 'pending_count', 'last_bid_at')
+
+# Features and images live in child tables; their arrays are assembled in SQL
+CHILD_ARRAYS = {'features': ('property_features', 'feature'), 'images': ('property_images', 'url')}
+
+# JSON key styles selectable with ?case=; camel is what the frontend's models use
+KEY_CASES = ('snake', 'camel')
+
+DEFAULT_SORT = 'newest'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ListingQueryError(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ListingQueryError('Invalid cursor')
+    return sort_value, row_id
+
+
+def parse_fields(raw, allowed=PROPERTY_FIELDS):
+    # Names may be given in either case style; they come back as columns
+    if not raw:
+        return list(allowed)
+    columns = {camel_case(f): f for f in allowed}
+    columns.update((f, f) for f in allowed)
+    fields = []
+    unknown = []
+    for name in (f.strip() for f in raw.split(',')):
+        if name and name not in columns:
+            unknown.append(name)
+        elif name and columns[name] not in fields:
+            fields.append(columns[name])
+    if unknown:
+        raise ListingQueryError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def parse_key_case(args):
+    case = args.get('case') or 'snake'
+    if case not in KEY_CASES:
+        raise ListingQueryError(f"case must be one of: {', '.join(KEY_CASES)}")
+    return case
+
+
+def parse_row_plan(args, allowed):
+    """RowPlan for a list endpoint from its ?fields= and ?case= parameters."""
+    return row_plan(tuple(parse_fields(args.get('fields'), allowed)), parse_key_case(args))
+
+
+def bid_stats_sql(case='snake', dialect=SQLITE):
+    keys = [output_key(key, case) for key in BID_STATS_KEYS]
+    stats = dialect.json_object(zip(keys, ('s.high_bid', 's.bid_count', 's.pending_count', 's.last_bid_at')))
+    empty = dialect.json_object(zip(keys, ('NULL', '0', '0', 'NULL')))
+    return f'COALESCE((SELECT {stats} FROM property_bid_stats s WHERE s.property_id = p.id), {empty})'
+
+
+def property_json_sql(fields, case='snake', dialect=SQLITE, extra=()):
+    # One JSON object per row, so rows leave the database already encoded.
+    # extra is (key, expression) pairs appended after the fields.
+    pairs = []
+    for field in fields:
+        if field == 'bid_stats':
+            expression = bid_stats_sql(case, dialect)
+        elif field in CHILD_ARRAYS:
+            expression = dialect.child_array(*CHILD_ARRAYS[field])
+        else:
+            expression = 'p.' + field
+        pairs.append((output_key(field, case), expression))
+    return dialect.document(dialect.json_object(pairs + list(extra)))
+
+
+def _number(args, name):
+    try:
+        return float(args[name])
+    except ValueError:
+        raise ListingQueryError(f'{name} must be a number')
+
+
+def _values(args, name):
+    values = args.getlist(name) if hasattr(args, 'getlist') else [args.get(name)]
+    return [v for v in values if v not in (None, '')]
+
+
+def filter_clauses(args):
+    """Build the WHERE clauses and params for the structured listing filters."""
+    where = []
+    params = []
+
+    for name, column in EQUALITY_FILTERS.items():
+        values = _values(args, name)
+        if len(values) == 1:
+            where.append(f'p.{column} = ?')
+            params.append(values[0])
+        elif values:
+            where.append(f"p.{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+    # Every requested feature must be present; each is an index lookup on
+    # property_features (feature, property_id)
+    for feature in _values(args, 'feature'):
+        where.append('p.id IN (SELECT property_id FROM property_features WHERE feature = ?)')
+        params.append(feature)
+
+    for name, (column, op) in RANGE_FILTERS.items():
+        if args.get(name) not in (None, ''):
+            where.append(f'p.{column} {op} ?')
+            params.append(_number(args, name))
+
+    return where, params
+
+
+def parse_limit(args, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        raise ListingQueryError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+
+def build_property_query(args, dialect=SQLITE):
+    """Turn listing query parameters into (sql, params, plan).
+
+    plan carries what the caller needs to shape the page: the requested
+    fields, the page size and the sort column used for the next cursor.
+    """
+    where, params = filter_clauses(args)
+
+    sort = args.get('sort', DEFAULT_SORT)
+    if sort not in SORTS:
+        raise ListingQueryError(f"sort must be one of: {', '.join(SORTS)}")
+    sort_column, direction = SORTS[sort]
+
+    limit = parse_limit(args)
+
+    if args.get('cursor'):
+        sort_value, row_id = decode_cursor(args['cursor'])
+        comparison = '<' if direction == 'DESC' else '>'
+        where.append(f'(p.{sort_column}, p.id) {comparison} (?, ?)')
+        params.extend([sort_value, row_id])
+
+    fields = parse_fields(args.get('fields'))
+    case = parse_key_case(args)
+    # The sort column and id ride along so the next cursor can be built
+    sql = f"SELECT {property_json_sql(fields, case, dialect)} AS doc, p.{sort_column} AS sort_value, p.id AS id FROM properties p"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY p.{sort_column} {direction}, p.id {direction} LIMIT ?'
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+
+    plan = {'fields': fields, 'limit': limit, 'sort_column': sort_column}
+    return sql, params, plan
+
+
+def build_property_detail_query(property_id, args=None, dialect=SQLITE):
+    fields = parse_fields(args.get('fields')) if args else PROPERTY_FIELDS
+    case = parse_key_case(args) if args else 'snake'
+    sql = f"SELECT {property_json_sql(fields, case, dialect)} AS doc FROM properties p WHERE p.id = ?"
+    return sql, (property_id,)
+
+
+def shape_property_page(rows, plan):
+    """Join the pre-encoded rows into a JSON array and compute the next cursor."""
+    limit = plan['limit']
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    body = '[' + ','.join(row['doc'] for row in rows) + ']'
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last['sort_value'], last['id'])
+    return body, next_cursor
+
+
+def split_list_field(values):
+    # Accept either a JSON array or the legacy comma-joined string
+    if not values:
+        return []
+    if isinstance(values, str):
+        values = values.split(',')
+    return [str(v).strip() for v in values if str(v).strip()]
+
+
+def replace_property_children(cursor, property_id, features=None, images=None):
+    # None leaves the existing rows alone; a list (even empty) replaces them
+    if features is not None:
+        cursor.execute("DELETE FROM property_features WHERE property_id = ?", (property_id,))
+        cursor.executemany(
+            "INSERT INTO property_features (property_id, position, feature) VALUES (?, ?, ?)",
+            [(property_id, i, feature) for i, feature in enumerate(features)]
+        )
+    if images is not None:
+        cursor.execute("DELETE FROM property_images WHERE property_id = ?", (property_id,))
+        cursor.executemany(
+            "INSERT INTO property_images (property_id, position, url) VALUES (?, ?, ?)",
+            [(property_id, i, url) for i, url in enumerate(images)]
+        )
@@ -0,0 +1,244 @@
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+JOB_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+
+
+class RequestStats:
+    # What one request spent on SQL and JSON encoding. Lives in a context
+    # variable, so the pooled connections and the JSON encoder can add to it
+    # without being handed the request.
+    __slots__ = ('queries', 'query_seconds', 'serialize_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request():
+    _current.set(None)
+
+
+def record_query(elapsed, statements=1):
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += statements
+        stats.query_seconds += elapsed
+
+
+def record_serialize(elapsed):
+    stats = _current.get()
+    if stats is not None:
+        stats.serialize_seconds += elapsed
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    # Fixed-bucket histogram per label set, rendered in the Prometheus text
+    # format. Buckets hold plain counts; they're made cumulative on render.
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def total_count(self):
+        # Observations across every label set
+        with self._lock:
+            return sum(count for _, _, count in self._series.values())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % (bound if bound == '+Inf' else _format_value(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {count}')
+        return lines
+
+
+class Metrics:
+    # Per-route request metrics for one process. Routes are labelled by their
+    # URL rule (/api/properties/<property_id>), not the concrete path, so the
+    # number of series stays bounded.
+
+    def __init__(self):
+        self.started = time.time()
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time to produce a response, by route.',
+            LATENCY_BUCKETS, ('method', 'route', 'status'))
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'SQL statements executed per request.',
+            QUERY_COUNT_BUCKETS, ('method', 'route'))
+        self.request_db_time = Histogram(
+            'http_request_db_seconds', 'Time per request spent executing SQL and fetching rows.',
+            LATENCY_BUCKETS, ('method', 'route'))
+        self.serialize_time = Histogram(
+            'http_response_serialize_seconds', 'Time per request spent encoding JSON in Python.',
+            LATENCY_BUCKETS, ('method', 'route'))
+        self.response_size = Histogram(
+            'http_response_size_bytes', 'Response body size; streamed responses are not counted.',
+            SIZE_BUCKETS, ('method', 'route'))
+        self.job_wait = Histogram(
+            'job_queue_wait_seconds', 'Time from a background job falling due to its first attempt, by kind.',
+            JOB_WAIT_BUCKETS, ('kind',))
+        self.job_duration = Histogram(
+            'job_run_seconds', 'Time per background job attempt, by kind and outcome.',
+            LATENCY_BUCKETS, ('kind', 'outcome'))
+
+    def observe(self, method, route, status, elapsed, stats, size=None):
+        self.request_duration.observe(elapsed, method, route, str(status))
+        self.request_queries.observe(stats.queries, method, route)
+        self.request_db_time.observe(stats.query_seconds, method, route)
+        self.serialize_time.observe(stats.serialize_seconds, method, route)
+        if size is not None:
+            self.response_size.observe(size, method, route)
+
+    def observe_job_wait(self, kind, elapsed):
+        self.job_wait.observe(elapsed, kind)
+
+    def observe_job_run(self, kind, outcome, elapsed):
+        self.job_duration.observe(elapsed, kind, outcome)
+
+    def requests_per_second(self):
+        # Since the process started
+        return round(self.request_duration.total_count() / (time.time() - self.started), 2)
+
+    def render(self, gauges=None):
+        """Prometheus text exposition; gauges maps 'name{labels}' to a value."""
+        lines = []
+        for histogram in (self.request_duration, self.request_queries, self.request_db_time,
+                          self.serialize_time, self.response_size, self.job_wait, self.job_duration):
+            lines.extend(histogram.render())
+        gauges = dict(gauges or {})
+        gauges['process_start_time_seconds'] = self.started
+        for name, value in gauges.items():
+            if value is not None:
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    # Opt-in sampling profiler. While enabled, a background thread snapshots
+    # the stack of every thread that is serving a request each interval; when
+    # a request turns out slower than threshold_ms its samples are written to
+    # output_dir in the collapsed-stack format that flamegraph.pl, speedscope
+    # and inferno read ("outer;inner;leaf count" per line).
+
+    def __init__(self, threshold_ms, output_dir, interval_ms=5.0, max_files=500):
+        self.threshold = threshold_ms / 1000.0
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000.0
+        self.max_files = max_files
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._pid = None
+        self.dumps = 0
+
+    def _ensure_sampler(self):
+        # Started lazily, and again in forked workers, where threads from the
+        # parent don't exist
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._active = {}
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._sample, name='profiler', daemon=True).start()
+
+    def start(self):
+        self._ensure_sampler()
+        samples = Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = samples
+        return samples
+
+    def finish(self, samples, elapsed, method, path):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if elapsed < self.threshold or not samples or self.dumps >= self.max_files:
+            return None
+        self.dumps += 1
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_')[:80]
+        filename = os.path.join(
+            self.output_dir,
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{method}-{slug}-{int(elapsed * 1000)}ms.folded',
+        )
+        with open(filename, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return filename
+
+    def _sample(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in active:
+                frame = frames.get(ident)
+                if frame is not None and ident != me:
+                    samples[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
@@ -0,0 +1,680 @@
+import logging
+import re
+
+from geo import ZIP_CENTROIDS_PATH, backfill_coordinates, load_zip_centroids
+
+logger = logging.getLogger(__name__)
+
+
+def _split_legacy_list_columns(conn):
+    # One-time copy of the comma-joined properties.features/images columns
+    # into the child tables. The legacy columns are kept (SQLite before 3.35
+    # cannot drop them) but cleared, and nothing writes to them any more.
+    rows = conn.execute(
+        'SELECT id, features, images FROM properties WHERE features IS NOT NULL OR images IS NOT NULL'
+    ).fetchall()
+    feature_rows = []
+    image_rows = []
+    for property_id, features, images in rows:
+        for i, feature in enumerate(f for f in (features or '').split(',') if f):
+            feature_rows.append((property_id, i, feature))
+        for i, url in enumerate(u for u in (images or '').split(',') if u):
+            image_rows.append((property_id, i, url))
+    conn.executemany(
+        'INSERT OR IGNORE INTO property_features (property_id, position, feature) VALUES (?, ?, ?)',
+        feature_rows
+    )
+    conn.executemany(
+        'INSERT OR IGNORE INTO property_images (property_id, position, url) VALUES (?, ?, ?)',
+        image_rows
+    )
+    conn.execute('UPDATE properties SET features = NULL, images = NULL')
+
+
+def rebuild_bid_stats(conn):
+    # Re-derive every property_bid_stats row from the bids table. Used to
+    # backfill the summary and by the rebuild-bid-stats command.
+    conn.execute('DELETE FROM property_bid_stats')
+    conn.execute('''
+    INSERT INTO property_bid_stats (property_id, high_bid, bid_count, pending_count, last_bid_at)
+    SELECT property_id,
+           MAX(CASE WHEN status != 'rejected' THEN amount END),
+           COUNT(*),
+           SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END),
+           MAX(timestamp)
+    FROM bids
+    GROUP BY property_id
+    ''')
+
+
+def rebuild_search_index(conn):
+    # Re-derive properties_fts from properties and property_features
+    conn.execute('''
+    INSERT OR IGNORE INTO property_keys (property_id) SELECT id FROM properties
+    ''')
+    conn.execute('DELETE FROM properties_fts')
+    conn.execute('''
+    INSERT INTO properties_fts (rowid, title, description, street, city, features)
+    SELECT k.key, p.title, p.description, p.street, p.city,
+           (SELECT group_concat(feature, ' ') FROM property_features f WHERE f.property_id = p.id)
+    FROM properties p JOIN property_keys k ON k.property_id = p.id
+    ''')
+
+
+def rebuild_geo_index(conn):
+    # Re-derive the properties_geo R*Tree from properties.latitude/longitude
+    conn.execute('''
+    INSERT OR IGNORE INTO property_keys (property_id) SELECT id FROM properties
+    ''')
+    conn.execute('DELETE FROM properties_geo')
+    conn.execute('''
+    INSERT INTO properties_geo (key, min_lat, max_lat, min_lng, max_lng)
+    SELECT k.key, p.latitude, p.latitude, p.longitude, p.longitude
+    FROM properties p JOIN property_keys k ON k.property_id = p.id
+    WHERE p.latitude IS NOT NULL AND p.longitude IS NOT NULL
+    ''')
+
+
+def rebuild_dashboard_stats(conn):
+    # Re-derive every DASHBOARD_SUMMARIES table from its source. Used to
+    # backfill them and by the rebuild-dashboard-stats command.
+    for table, source, keys, count, total in DASHBOARD_SUMMARIES:
+        expressions = [expression.format(r='r') for expression in keys.values()]
+        aggregates = ['COUNT(*)'] + ([f"SUM({total[1].format(r='r')})"] if total else [])
+        conn.execute(f'DELETE FROM {table}')
+        conn.execute(f'''
+        INSERT INTO {table} ({', '.join(_summary_columns(keys, count, total))})
+        SELECT {', '.join(expressions + aggregates)}
+        FROM {source} r
+        GROUP BY {', '.join(expressions)}
+        ''')
+
+
+def _geocode_existing_properties(conn):
+    load_zip_centroids(conn, ZIP_CENTROIDS_PATH)
+    backfill_coordinates(conn)
+    rebuild_geo_index(conn)
+
+
+# Tables whose writes bump a counter in table_changes. Responses built from
+# them derive their ETag and Last-Modified from the counters, so an unchanged
+# page can be answered with 304 without reading any of its rows.
+CHANGE_COUNTED_TABLES = (
+    'properties', 'property_features', 'property_images', 'property_bid_stats',
+    'bids', 'contracts', 'users',
+)
+
+UNIX_NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# Running totals behind /api/admin/stats, one row per group, kept current by
+# triggers on the source table so the dashboards never scan it. Each entry is
+# (summary table, source table, {key column: expression}, count column,
+# (total column, expression) or None); expressions are over a source row
+# named {r}.
+DASHBOARD_SUMMARIES = [
+    ('bid_daily_stats', 'bids', {'day': 'substr({r}.timestamp, 1, 10)', 'status': '{r}.status'},
+     'bid_count', ('total_amount', '{r}.amount')),
+    ('listing_stats', 'properties', {'state': '{r}.state', 'city': '{r}.city', 'status': '{r}.status'},
+     'listing_count', ('total_price', '{r}.price')),
+    ('contract_agent_stats', 'contracts', {'agent_id': '{r}.agent_id', 'status': '{r}.status'},
+     'contract_count', ('total_commission', '{r}.commission')),
+    ('user_role_stats', 'users', {'role': '{r}.role'}, 'user_count', None),
+]
+
+
+def _summary_columns(keys, count, total):
+    return list(keys) + [count] + ([total[0]] if total else [])
+
+
+def summary_source_columns(keys, total):
+    # Source columns a summary reads, in the order they first appear
+    expressions = list(keys.values()) + ([total[1]] if total else [])
+    return list(dict.fromkeys(re.findall(r'\{r\}\.(\w+)', ' '.join(expressions))))
+
+
+def _summary_steps(table, source, keys, count, total):
+    # Row triggers moving each inserted, updated or deleted row in or out of
+    # its group. Emptied groups are deleted.
+    columns = summary_source_columns(keys, total)
+    match = ' AND '.join(f'{key} = {expression.format(r="OLD")}' for key, expression in keys.items())
+    values = [expression.format(r='NEW') for expression in keys.values()] + ['1']
+    add_total = subtract_total = ''
+    if total:
+        values.append(total[1].format(r='NEW'))
+        add_total = f', {total[0]} = {total[0]} + excluded.{total[0]}'
+        subtract_total = f', {total[0]} = {total[0]} - {total[1].format(r="OLD")}'
+    add = f'''
+            INSERT INTO {table} ({', '.join(_summary_columns(keys, count, total))})
+            VALUES ({', '.join(values)})
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {count} = {count} + 1{add_total};'''
+    subtract = f'''
+            UPDATE {table} SET {count} = {count} - 1{subtract_total} WHERE {match};
+            DELETE FROM {table} WHERE {match} AND {count} <= 0;'''
+    changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {source} BEGIN{add}\n        END',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {', '.join(columns)} ON {source}
+        WHEN {changed} BEGIN{subtract}{add}
+        END''',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {source} BEGIN{subtract}\n        END',
+    ]
+
+
+def _change_counter_steps(table):
+    steps = [f"INSERT OR IGNORE INTO table_changes (name, version, changed_at) VALUES ('{table}', 0, {UNIX_NOW_SQL})"]
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        steps.append(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_count_{event.lower()} AFTER {event} ON {table} BEGIN
+            UPDATE table_changes SET version = version + 1, changed_at = {UNIX_NOW_SQL}
+            WHERE name = '{table}';
+        END
+        ''')
+    return steps
+
+
+# Each migration is (version, name, steps). A step is either a single SQL
+# statement or a callable taking the connection, for data migrations.
+# Versions are applied in order and recorded in schema_migrations; never
+# edit a migration that has shipped, add a new one instead.
+MIGRATIONS = [
+    (1, 'create base tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS properties (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            type TEXT NOT NULL,
+            property_type TEXT NOT NULL,
+            price REAL NOT NULL,
+            bedrooms INTEGER,
+            bathrooms INTEGER,
+            area REAL NOT NULL,
+            street TEXT,
+            city TEXT NOT NULL,
+            state TEXT NOT NULL,
+            zip_code TEXT,
+            features TEXT,
+            images TEXT,
+            owner_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            listed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (owner_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bids (
+            id TEXT PRIMARY KEY,
+            property_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            message TEXT,
+            status TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (property_id) REFERENCES properties (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS contracts (
+            id TEXT PRIMARY KEY,
+            property_id TEXT NOT NULL,
+            owner_id TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            commission REAL NOT NULL,
+            status TEXT NOT NULL,
+            start_date TIMESTAMP,
+            end_date TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (property_id) REFERENCES properties (id),
+            FOREIGN KEY (owner_id) REFERENCES users (id),
+            FOREIGN KEY (agent_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, 'listing filter and keyset sort indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_properties_listed ON properties (listed_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_price ON properties (price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_area ON properties (area, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_status_listed ON properties (status, listed_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_status_price ON properties (status, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_city_price ON properties (city, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_state_price ON properties (state, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_type_price ON properties (type, property_type, price, id)',
+    ]),
+    (3, 'secondary indexes for bids, contracts and owners', [
+        # Bid history per property, newest last; amount makes max-bid lookups covered
+        'CREATE INDEX IF NOT EXISTS idx_bids_property ON bids (property_id, timestamp, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_bids_property_amount ON bids (property_id, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_bids_user ON bids (user_id, timestamp)',
+        # get_contracts_by_user ORs these two, which SQLite serves as a multi-index OR
+        'CREATE INDEX IF NOT EXISTS idx_contracts_owner ON contracts (owner_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_contracts_agent ON contracts (agent_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_contracts_property ON contracts (property_id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_owner ON properties (owner_id)',
+    ]),
+    (4, 'normalize property features and images', [
+        '''
+        CREATE TABLE IF NOT EXISTS property_features (
+            property_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            feature TEXT NOT NULL,
+            PRIMARY KEY (property_id, position),
+            FOREIGN KEY (property_id) REFERENCES properties (id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_property_features_feature ON property_features (feature, property_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS property_images (
+            property_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (property_id, position),
+            FOREIGN KEY (property_id) REFERENCES properties (id)
+        ) WITHOUT ROWID
+        ''',
+        _split_legacy_list_columns,
+    ]),
+    (5, 'materialized per-property bid aggregates', [
+        '''
+        CREATE TABLE IF NOT EXISTS property_bid_stats (
+            property_id TEXT PRIMARY KEY,
+            high_bid REAL,
+            bid_count INTEGER NOT NULL DEFAULT 0,
+            pending_count INTEGER NOT NULL DEFAULT 0,
+            last_bid_at TIMESTAMP,
+            FOREIGN KEY (property_id) REFERENCES properties (id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_bids_property_status ON bids (property_id, status)',
+        # high_bid ignores rejected bids, matching what BidEngine accepts against
+        '''
+        CREATE TRIGGER IF NOT EXISTS bids_stats_insert AFTER INSERT ON bids BEGIN
+            INSERT INTO property_bid_stats (property_id, high_bid, bid_count, pending_count, last_bid_at)
+            VALUES (
+                NEW.property_id,
+                CASE WHEN NEW.status != 'rejected' THEN NEW.amount END,
+                1,
+                NEW.status = 'pending',
+                NEW.timestamp
+            )
+            ON CONFLICT (property_id) DO UPDATE SET
+                high_bid = CASE
+                    WHEN NEW.status != 'rejected' AND (high_bid IS NULL OR NEW.amount > high_bid)
+                    THEN NEW.amount ELSE high_bid END,
+                bid_count = bid_count + 1,
+                pending_count = pending_count + (NEW.status = 'pending'),
+                last_bid_at = MAX(COALESCE(last_bid_at, NEW.timestamp), NEW.timestamp);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS bids_stats_update AFTER UPDATE OF status, amount ON bids BEGIN
+            UPDATE property_bid_stats SET
+                pending_count = pending_count + (NEW.status = 'pending') - (OLD.status = 'pending'),
+                high_bid = (
+                    SELECT MAX(amount) FROM bids
+                    WHERE property_id = NEW.property_id AND status != 'rejected'
+                )
+            WHERE property_id = NEW.property_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS bids_stats_delete AFTER DELETE ON bids BEGIN
+            UPDATE property_bid_stats SET
+                bid_count = bid_count - 1,
+                pending_count = pending_count - (OLD.status = 'pending'),
+                high_bid = (
+                    SELECT MAX(amount) FROM bids
+                    WHERE property_id = OLD.property_id AND status != 'rejected'
+                ),
+                last_bid_at = (SELECT MAX(timestamp) FROM bids WHERE property_id = OLD.property_id)
+            WHERE property_id = OLD.property_id;
+            DELETE FROM property_bid_stats WHERE property_id = OLD.property_id AND bid_count <= 0;
+        END
+        ''',
+        rebuild_bid_stats,
+    ]),
+    (6, 'full-text search index over properties', [
+        # Integer surrogate keys for properties: FTS5 (and other virtual
+        # tables) address rows by integer rowid, and the implicit rowid of
+        # properties may be renumbered by VACUUM
+        '''
+        CREATE TABLE IF NOT EXISTS property_keys (
+            key INTEGER PRIMARY KEY,
+            property_id TEXT NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts USING fts5(
+            title, description, street, city, features,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS properties_fts_insert AFTER INSERT ON properties BEGIN
+            INSERT OR IGNORE INTO property_keys (property_id) VALUES (NEW.id);
+            INSERT INTO properties_fts (rowid, title, description, street, city, features)
+            VALUES (
+                (SELECT key FROM property_keys WHERE property_id = NEW.id),
+                NEW.title, NEW.description, NEW.street, NEW.city, ''
+            );
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS properties_fts_update
+        AFTER UPDATE OF title, description, street, city ON properties BEGIN
+            UPDATE properties_fts SET
+                title = NEW.title, description = NEW.description,
+                street = NEW.street, city = NEW.city
+            WHERE rowid = (SELECT key FROM property_keys WHERE property_id = NEW.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS properties_fts_delete AFTER DELETE ON properties BEGIN
+            DELETE FROM properties_fts
+            WHERE rowid = (SELECT key FROM property_keys WHERE property_id = OLD.id);
+            DELETE FROM property_keys WHERE property_id = OLD.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS property_features_fts_insert AFTER INSERT ON property_features BEGIN
+            UPDATE properties_fts SET features = (
+                SELECT group_concat(feature, ' ') FROM property_features WHERE property_id = NEW.property_id
+            )
+            WHERE rowid = (SELECT key FROM property_keys WHERE property_id = NEW.property_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS property_features_fts_delete AFTER DELETE ON property_features BEGIN
+            UPDATE properties_fts SET features = (
+                SELECT group_concat(feature, ' ') FROM property_features WHERE property_id = OLD.property_id
+            )
+            WHERE rowid = (SELECT key FROM property_keys WHERE property_id = OLD.property_id);
+        END
+        ''',
+        rebuild_search_index,
+    ]),
+    (7, 'property coordinates and spatial index', [
+        'ALTER TABLE properties ADD COLUMN latitude REAL',
+        'ALTER TABLE properties ADD COLUMN longitude REAL',
+        '''
+        CREATE TABLE IF NOT EXISTS zip_centroids (
+            zip_code TEXT PRIMARY KEY,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        # Points are stored as degenerate boxes keyed by property_keys.key
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS properties_geo USING rtree(
+            key, min_lat, max_lat, min_lng, max_lng
+        )
+        ''',
+        _geocode_existing_properties,
+        # The key may not exist yet when this fires before the FTS trigger,
+        # hence the INSERT OR IGNORE
+        '''
+        CREATE TRIGGER IF NOT EXISTS properties_geo_insert AFTER INSERT ON properties
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO property_keys (property_id) VALUES (NEW.id);
+            INSERT INTO properties_geo (key, min_lat, max_lat, min_lng, max_lng)
+            SELECT key, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            FROM property_keys WHERE property_id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS properties_geo_update
+        AFTER UPDATE OF latitude, longitude ON properties BEGIN
+            DELETE FROM properties_geo
+            WHERE key = (SELECT key FROM property_keys WHERE property_id = NEW.id);
+            INSERT INTO properties_geo (key, min_lat, max_lat, min_lng, max_lng)
+            SELECT key, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            FROM property_keys
+            WHERE property_id = NEW.id AND NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+        END
+        ''',
+        # BEFORE, so the key is still there when properties_fts_delete removes it
+        '''
+        CREATE TRIGGER IF NOT EXISTS properties_geo_delete BEFORE DELETE ON properties BEGIN
+            DELETE FROM properties_geo
+            WHERE key = (SELECT key FROM property_keys WHERE property_id = OLD.id);
+        END
+        ''',
+    ]),
+    (8, 'index features already present when a listing is inserted', [
+        # Bulk imports write property_features before the listing itself, so
+        # each listing reaches the FTS index once instead of once per feature
+        'DROP TRIGGER IF EXISTS properties_fts_insert',
+        '''
+        CREATE TRIGGER properties_fts_insert AFTER INSERT ON properties BEGIN
+            INSERT OR IGNORE INTO property_keys (property_id) VALUES (NEW.id);
+            INSERT INTO properties_fts (rowid, title, description, street, city, features)
+            VALUES (
+                (SELECT key FROM property_keys WHERE property_id = NEW.id),
+                NEW.title, NEW.description, NEW.street, NEW.city,
+                COALESCE((SELECT group_concat(feature, ' ') FROM property_features WHERE property_id = NEW.id), '')
+            );
+        END
+        ''',
+    ]),
+    (9, 'count changes per table for conditional requests', [
+        '''
+        CREATE TABLE IF NOT EXISTS table_changes (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ] + [
+        step
+        for table in CHANGE_COUNTED_TABLES
+        for step in _change_counter_steps(table)
+    ]),
+    (10, 'dashboard summary tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS bid_daily_stats (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            bid_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS listing_stats (
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            status TEXT NOT NULL,
+            listing_count INTEGER NOT NULL DEFAULT 0,
+            total_price REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (state, city, status)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS contract_agent_stats (
+            agent_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            contract_count INTEGER NOT NULL DEFAULT 0,
+            total_commission REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (agent_id, status)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_role_stats (
+            role TEXT PRIMARY KEY,
+            user_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+    ] + [
+        step
+        for summary in DASHBOARD_SUMMARIES
+        for step in _summary_steps(*summary)
+    ] + [
+        rebuild_dashboard_stats,
+    ]),
+    (11, 'background job queue and notifications', [
+        # Times are Unix timestamps. The partial indexes hold only the jobs
+        # workers still have to look at, and the finished ones to purge.
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            available_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            last_error TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (available_at) WHERE status IN ('queued', 'running')",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at) WHERE status = 'done'",
+        '''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id, created_at)',
+    ]),
+]
+
+
+def ensure_migrations_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+
+
+def latest_version(migrations=MIGRATIONS):
+    return max(version for version, _, _ in migrations)
+
+
+def current_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, migrations=MIGRATIONS, target=None, begin='BEGIN IMMEDIATE'):
+    """Apply pending migrations in order; returns the list of applied versions.
+
+    Each migration runs in its own transaction, opened with begin, and the
+    version check is repeated once the write lock is held, so concurrent
+    processes starting against the same database apply every migration once.
+    """
+    ensure_migrations_table(conn)
+    applied = []
+    for version, name, steps in sorted(migrations, key=lambda m: m[0]):
+        if target is not None and version > target:
+            break
+        if version <= current_version(conn):
+            continue
+
+        conn.execute(begin)
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, name) VALUES (?, ?)',
+                (version, name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception('Migration %s (%s) failed', version, name)
+            raise
+
+        logger.info('Applied migration %s: %s', version, name)
+        applied.append(version)
+    return applied
+
+
+# Hot queries issued by the API, checked with EXPLAIN QUERY PLAN so a
+# missing index shows up at startup instead of as a slow endpoint.
+HOT_QUERIES = [
+    ('bids by property', 'SELECT * FROM bids WHERE property_id = ?', ('',)),
+    ('bids by user', 'SELECT * FROM bids WHERE user_id = ?', ('',)),
+    ('contracts by user', 'SELECT * FROM contracts WHERE owner_id = ? OR agent_id = ?', ('', '')),
+    ('bid with property owner', '''
+        SELECT b.*, p.owner_id
+        FROM bids b
+        JOIN properties p ON b.property_id = p.id
+        WHERE b.id = ?
+    ''', ('',)),
+    ('user by id', 'SELECT * FROM users WHERE id = ?', ('',)),
+    ('user by username', 'SELECT * FROM users WHERE username = ?', ('',)),
+    ('newest active listings', '''
+        SELECT id FROM properties WHERE status = ?
+        ORDER BY listed_at DESC, id DESC LIMIT 50
+    ''', ('active',)),
+    ('cheapest listings in a city', '''
+        SELECT id FROM properties WHERE city = ?
+        ORDER BY price ASC, id ASC LIMIT 50
+    ''', ('',)),
+    ('listings with a feature', '''
+        SELECT id FROM properties
+        WHERE id IN (SELECT property_id FROM property_features WHERE feature = ?)
+    ''', ('',)),
+    ('search result to listing', '''
+        SELECT p.id FROM property_keys k JOIN properties p ON p.id = k.property_id
+        WHERE k.key = ?
+    ''', (0,)),
+    ('listings in a bounding box', '''
+        SELECT p.id FROM properties_geo g
+        JOIN property_keys k ON k.key = g.key
+        JOIN properties p ON p.id = k.property_id
+        WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?
+    ''', (0, 0, 0, 0)),
+    ('features of a listing', '''
+        SELECT feature FROM property_features WHERE property_id = ? ORDER BY position
+    ''', ('',)),
+]
+
+
+def _is_slow_plan_step(detail):
+    # 'SCAN bids' is a full table scan; 'SCAN bids USING INDEX ...' walks an
+    # index in order and is fine, as is a constrained virtual table (R*Tree)
+    # lookup. Temp b-trees mean an unindexed sort.
+    if detail.startswith('SCAN') and ' USING ' not in detail and 'VIRTUAL TABLE INDEX' not in detail:
+        return True
+    return 'USE TEMP B-TREE' in detail
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """Return [(name, [plan details])] for hot queries with slow plan steps."""
+    slow = []
+    for name, sql, params in queries:
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        details = [row[3] for row in plan]
+        if any(_is_slow_plan_step(detail) for detail in details):
+            slow.append((name, details))
+    return slow
@@ -0,0 +1,111 @@
+import multiprocessing
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # Runs password hashing and verification on a dedicated process pool so
+    # CPU-bound PBKDF2 work never holds up the request threads. At most
+    # max_pending hashes may be queued or running; callers that can't get a
+    # slot within queue_timeout get HasherBusy instead of piling up.
+    #
+    # With workers=0 hashing runs inline on the calling thread.
+
+    def __init__(self, method='pbkdf2:sha256', iterations=260000, workers=2,
+                 max_pending=64, queue_timeout=5.0):
+        self.method = f'{method}:{iterations}' if method.startswith('pbkdf2') else method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._dummy_hash = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'hashed': 0, 'verified': 0, 'dummy_checks': 0, 'rehashed': 0, 'busy_rejects': 0}
+
+    def start(self):
+        # Fork the workers now, while the process is still single threaded,
+        # rather than on the first login
+        if self.workers and self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('fork'),
+                    )
+                    self._dummy_hash = self._executor.submit(
+                        generate_password_hash, secrets.token_urlsafe(16), self.method
+                    ).result()
+        return self
+
+    def reset(self):
+        # For a freshly forked worker process: the parent's pool is unusable
+        # here, a new one is started on first use
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('busy_rejects')
+            raise HasherBusy('Too many password checks in progress')
+        try:
+            return self.start()._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        self._count('hashed')
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        self._count('verified')
+        return self._run(check_password_hash, stored_hash, password)
+
+    def dummy_verify(self, password):
+        # Same work as verify() against a real hash, for usernames that don't
+        # exist, so response time doesn't reveal which accounts are registered
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(secrets.token_urlsafe(16))
+        self._count('dummy_checks')
+        self._run(check_password_hash, self._dummy_hash, password)
+        return False
+
+    def rehash(self, password):
+        # New hash with the current parameters, after needs_rehash() said so
+        self._count('rehashed')
+        return self.hash(password)
+
+    def needs_rehash(self, stored_hash):
+        # Werkzeug hashes look like "pbkdf2:sha256:260000$salt$hash"
+        method = stored_hash.split('$', 1)[0]
+        return method != self.method
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'method': self.method,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'started': self._executor is not None,
+        })
+        return stats
@@ -0,0 +1,249 @@
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit
+
+import psycopg  # optional dependency (requirements-postgres.txt), only needed with a postgresql:// DATABASE_URL
+import psycopg_pool
+from psycopg import pq
+
+from db import PooledConnection, PoolTimeout, TimedCursor
+from dialects import POSTGRES
+from postgres_schema import HOT_QUERIES, MIGRATIONS
+from repository import Repository
+
+# SQLSTATEs worth retrying a write for: serialization_failure,
+# deadlock_detected and lock_not_available (lock_timeout ran out)
+LOCK_SQLSTATES = ('40001', '40P01', '55P03')
+
+
+@lru_cache(maxsize=256)
+def _row_class(names):
+    # Indexing by name uses the first column of that name, as sqlite3.Row does
+    index = {}
+    for i, name in enumerate(names):
+        index.setdefault(name, i)
+
+    class Row(tuple):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            if isinstance(key, str):
+                key = index[key]
+            return tuple.__getitem__(self, key)
+
+        def keys(self):
+            return list(names)
+
+    return Row
+
+
+def row_factory(cursor):
+    # Rows that behave like sqlite3.Row: by position, by column name, and
+    # through dict(row)
+    if cursor.description is None:
+        return tuple
+    return _row_class(tuple(column.name for column in cursor.description))
+
+
+@lru_cache(maxsize=1024)
+def _translate(sql):
+    # The repository writes SQL with sqlite3's ? placeholders
+    return sql.replace('%', '%%').replace('?', '%s')
+
+
+class QmarkCursor:
+    # psycopg cursor taking ? placeholders. Statements without parameters go
+    # through untouched, so % in them needs no escaping.
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=()):
+        if params:
+            self._cursor.execute(_translate(sql), params)
+        else:
+            self._cursor.execute(sql)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(_translate(sql), seq_of_params)
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._cursor.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class PostgresConnection(PooledConnection):
+    def cursor(self, name=None):
+        # A name gives a server-side cursor, which must be used in a transaction
+        raw = self._conn.cursor(name) if name else self._conn.cursor()
+        return TimedCursor(QmarkCursor(raw))
+
+
+class PostgresPool:
+    # The ConnectionPool interface over psycopg_pool. Connections run in
+    # autocommit mode, so reads never hold a transaction open; writes start
+    # one explicitly with the dialect's begin_write, as they do on SQLite.
+    #
+    # lock_timeout plays the part of SQLite's busy_timeout, and prepared
+    # statements that of its statement cache: psycopg prepares a query once
+    # it has been run a few times, keeping up to statement_cache_size.
+
+    def __init__(self, url, size=8, timeout=10.0, lock_timeout=5000, statement_cache_size=256):
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.statement_cache_size = statement_cache_size
+        self._lock = threading.Lock()
+        self._pool = None
+        # Pools dropped by reset() after fork(); kept referenced so their
+        # connections, shared with the parent, are never closed from here
+        self._abandoned = []
+
+    def _configure(self, conn):
+        conn.prepared_max = self.statement_cache_size
+        conn.execute(f'SET lock_timeout = {int(self.lock_timeout)}')
+
+    def _open(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = psycopg_pool.ConnectionPool(
+                    self.url,
+                    min_size=1,
+                    max_size=self.size,
+                    timeout=self.timeout,
+                    kwargs={'autocommit': True, 'row_factory': row_factory},
+                    configure=self._configure,
+                    name='api',
+                    open=True,
+                )
+            return self._pool
+
+    def acquire(self):
+        pool = self._pool or self._open()
+        try:
+            conn = pool.getconn()
+        except psycopg_pool.PoolTimeout:
+            raise PoolTimeout(f'No database connection available after {self.timeout}s')
+        return PostgresConnection(self, conn)
+
+    def release(self, conn):
+        # Broken connections are discarded by putconn()
+        if conn.info.transaction_status in (pq.TransactionStatus.INTRANS, pq.TransactionStatus.INERROR):
+            try:
+                conn.rollback()
+            except psycopg.Error:
+                pass
+        self._pool.putconn(conn)
+
+    def close_all(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def reset(self):
+        # After fork(): the child starts a pool of its own on first use
+        with self._lock:
+            if self._pool is not None:
+                self._abandoned.append(self._pool)
+            self._pool = None
+
+    def stats(self):
+        stats = self._pool.get_stats() if self._pool is not None else {}
+        available = stats.get('pool_available', 0)
+        # The URL without its password
+        parts = urlsplit(self.url)
+        netloc = parts.netloc.rpartition('@')[2]
+        if parts.username:
+            netloc = f'{parts.username}@{netloc}'
+        return {
+            'created': stats.get('connections_num', 0),
+            'checkouts': stats.get('requests_num', 0),
+            'waits': stats.get('requests_queued', 0),
+            'timeouts': stats.get('requests_errors', 0),
+            'in_use': stats.get('pool_size', 0) - available,
+            'idle': available,
+            'size': self.size,
+            'database': urlunsplit(parts._replace(netloc=netloc)),
+            'lock_timeout_ms': self.lock_timeout,
+            'statement_cache_size': self.statement_cache_size,
+        }
+
+
+class PostgresRepository(Repository):
+    dialect = POSTGRES
+    migrations = MIGRATIONS
+    lock_errors = (psycopg.errors.OperationalError,)
+
+    def is_lock_error(self, error):
+        return error.sqlstate in LOCK_SQLSTATES
+
+    @contextmanager
+    def streaming_cursor(self, sql, params=(), batch_size=500):
+        # A server-side cursor, so rows come over batch by batch instead of
+        # the whole result being buffered client-side
+        with self.connection(read_only=True) as conn:
+            conn.execute('BEGIN')
+            cursor = conn.cursor('export')
+            cursor.itersize = batch_size
+            try:
+                cursor.execute(sql, params)
+                yield cursor
+            finally:
+                cursor.close()
+                conn.rollback()
+
+    def slow_query_plans(self, queries=HOT_QUERIES):
+        # Sequential scans and sorts in each plan. The tables may be too small
+        # for the planner to bother with an index, so it's told to avoid both
+        # if it can: what's left is a missing index.
+        slow = []
+        with self.transaction() as conn:
+            conn.execute('SET LOCAL enable_seqscan = off')
+            conn.execute('SET LOCAL enable_sort = off')
+            for name, sql, params in queries:
+                plan = conn.execute('EXPLAIN (FORMAT JSON) ' + sql, params).fetchone()[0]
+                steps = list(_plan_steps(plan[0]['Plan']))
+                if any(step.startswith(('Seq Scan', 'Sort')) for step in steps):
+                    slow.append((name, steps))
+        return slow
+
+    def optimize(self):
+        # Refresh planner statistics and the visibility map after a bulk load
+        with self.connection() as conn:
+            conn.execute('VACUUM (ANALYZE)')
+
+    def rebuild_search_index(self):
+        with self.transaction() as conn:
+            conn.execute('''
+            UPDATE properties SET search_vector = property_search_vector(
+                title, city, street, description, property_features_text(id)
+            )
+            ''')
+
+    def rebuild_geo_index(self):
+        with self.connection() as conn:
+            conn.execute('REINDEX INDEX idx_properties_geo')
+
+
+def _plan_steps(node):
+    step = node['Node Type']
+    if 'Relation Name' in node:
+        step += ' on ' + node['Relation Name']
+    if 'Index Name' in node:
+        step += ' using ' + node['Index Name']
+    yield step
+    for child in node.get('Plans', ()):
+        yield from _plan_steps(child)
@@ -0,0 +1,438 @@
+from geo import ZIP_CENTROIDS_PATH, backfill_coordinates, load_zip_centroids
+from migrations import (CHANGE_COUNTED_TABLES, DASHBOARD_SUMMARIES, HOT_QUERIES, rebuild_dashboard_stats,
+                        summary_source_columns)
+
+# Schema for the PostgreSQL backend. It starts from the end state of the
+# SQLite migrations rather than replaying them: the same tables, columns and
+# indexes, with the SQLite-only pieces swapped for built-in equivalents.
+# properties_fts becomes a weighted tsvector column with a GIN index, the
+# properties_geo R*Tree a btree on (latitude, longitude), and property_keys
+# goes away with them. Foreign keys are left out, as SQLite never enforced
+# them and deletes rely on that. Timestamps stay TEXT in SQLite's
+# CURRENT_TIMESTAMP format so both backends return the same values.
+
+NOW_TEXT = "to_char(timezone('UTC', now()), 'YYYY-MM-DD HH24:MI:SS')"
+
+
+def _load_zip_centroids(conn):
+    load_zip_centroids(conn, ZIP_CENTROIDS_PATH)
+    backfill_coordinates(conn)
+
+
+def _change_counter_steps(table):
+    # One bump per statement rather than per row, so a bulk import costs one
+    # counter update
+    return [
+        f"INSERT INTO table_changes (name, version, changed_at) VALUES ('{table}', 0, "
+        "extract(epoch FROM clock_timestamp())) ON CONFLICT (name) DO NOTHING",
+        f'''
+        CREATE TRIGGER {table}_count_changes AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION count_table_change()
+        ''',
+    ]
+
+
+def _summary_steps(table, source, keys, count, total):
+    # The SQLite row triggers as statement triggers over transition tables:
+    # each statement moves its rows between groups with one aggregate, so a
+    # bulk import costs one upsert per group rather than per row. Updates
+    # that leave every summarized column alone do nothing.
+    columns = summary_source_columns(keys, total)
+    expressions = [expression.format(r='r') for expression in keys.values()]
+    aggregates = ['COUNT(*)'] + ([f"SUM({total[1].format(r='r')})"] if total else [])
+    grouped = f"SELECT {', '.join(expressions + aggregates)} FROM {{rows}} r GROUP BY {', '.join(expressions)}"
+    names = list(keys) + ['n'] + (['total'] if total else [])
+    match = ' AND '.join(f's.{key} = g.{key}' for key in keys)
+    add_total = subtract_total = ''
+    if total:
+        add_total = f', {total[0]} = s.{total[0]} + EXCLUDED.{total[0]}'
+        subtract_total = f', {total[0]} = s.{total[0]} - g.total'
+    old_values = ', '.join(f'o.{column}' for column in columns)
+    new_values = ', '.join(f'n.{column}' for column in columns)
+    return [
+        f'''
+        CREATE OR REPLACE FUNCTION {table}_apply() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            -- Nested, as the transition tables only exist for their own events
+            IF TG_OP = 'UPDATE' THEN
+                IF NOT EXISTS (
+                    SELECT 1 FROM old_rows o JOIN new_rows n ON n.id = o.id
+                    WHERE ({old_values}) IS DISTINCT FROM ({new_values})
+                ) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE {table} s SET {count} = s.{count} - g.n{subtract_total}
+                FROM ({grouped.format(rows='old_rows')}) AS g ({', '.join(names)})
+                WHERE {match};
+                DELETE FROM {table} WHERE {count} <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {table} AS s ({', '.join(list(keys) + [count] + ([total[0]] if total else []))})
+                {grouped.format(rows='new_rows')}
+                ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {count} = s.{count} + EXCLUDED.{count}{add_total};
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        ''',
+        f'''
+        CREATE TRIGGER {table}_insert AFTER INSERT ON {source}
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {table}_apply()
+        ''',
+        f'''
+        CREATE TRIGGER {table}_update AFTER UPDATE ON {source}
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {table}_apply()
+        ''',
+        f'''
+        CREATE TRIGGER {table}_delete AFTER DELETE ON {source}
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {table}_apply()
+        ''',
+    ]
+
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        f'''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            created_at TEXT DEFAULT {NOW_TEXT}
+        )
+        ''',
+        f'''
+        CREATE TABLE IF NOT EXISTS properties (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            type TEXT NOT NULL,
+            property_type TEXT NOT NULL,
+            price DOUBLE PRECISION NOT NULL,
+            bedrooms INTEGER,
+            bathrooms INTEGER,
+            area DOUBLE PRECISION NOT NULL,
+            street TEXT,
+            city TEXT NOT NULL,
+            state TEXT NOT NULL,
+            zip_code TEXT,
+            owner_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            listed_at TEXT DEFAULT {NOW_TEXT},
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION,
+            search_vector tsvector
+        )
+        ''',
+        f'''
+        CREATE TABLE IF NOT EXISTS bids (
+            id TEXT PRIMARY KEY,
+            property_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            amount DOUBLE PRECISION NOT NULL,
+            message TEXT,
+            status TEXT NOT NULL,
+            timestamp TEXT DEFAULT {NOW_TEXT}
+        )
+        ''',
+        f'''
+        CREATE TABLE IF NOT EXISTS contracts (
+            id TEXT PRIMARY KEY,
+            property_id TEXT NOT NULL,
+            owner_id TEXT NOT NULL,
+            agent_id TEXT NOT NULL,
+            commission DOUBLE PRECISION NOT NULL,
+            status TEXT NOT NULL,
+            start_date TEXT,
+            end_date TEXT,
+            created_at TEXT DEFAULT {NOW_TEXT}
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS property_features (
+            property_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            feature TEXT NOT NULL,
+            PRIMARY KEY (property_id, position)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS property_images (
+            property_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (property_id, position)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS property_bid_stats (
+            property_id TEXT PRIMARY KEY,
+            high_bid DOUBLE PRECISION,
+            bid_count INTEGER NOT NULL DEFAULT 0,
+            pending_count INTEGER NOT NULL DEFAULT 0,
+            last_bid_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS zip_centroids (
+            zip_code TEXT PRIMARY KEY,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS table_changes (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at DOUBLE PRECISION NOT NULL
+        )
+        ''',
+        # The indexes of SQLite migrations 2 to 5
+        'CREATE INDEX IF NOT EXISTS idx_properties_listed ON properties (listed_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_price ON properties (price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_area ON properties (area, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_status_listed ON properties (status, listed_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_status_price ON properties (status, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_city_price ON properties (city, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_state_price ON properties (state, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_type_price ON properties (type, property_type, price, id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_owner ON properties (owner_id)',
+        'CREATE INDEX IF NOT EXISTS idx_bids_property ON bids (property_id, timestamp, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_bids_property_amount ON bids (property_id, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_bids_property_status ON bids (property_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_bids_user ON bids (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_contracts_owner ON contracts (owner_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_contracts_agent ON contracts (agent_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_contracts_property ON contracts (property_id)',
+        'CREATE INDEX IF NOT EXISTS idx_property_features_feature ON property_features (feature, property_id)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_search ON properties USING GIN (search_vector)',
+        'CREATE INDEX IF NOT EXISTS idx_properties_geo ON properties (latitude, longitude)',
+        # property_bid_stats, kept by the same rules as SQLite migration 5
+        '''
+        CREATE OR REPLACE FUNCTION bids_stats_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO property_bid_stats AS s (property_id, high_bid, bid_count, pending_count, last_bid_at)
+            VALUES (
+                NEW.property_id,
+                CASE WHEN NEW.status != 'rejected' THEN NEW.amount END,
+                1,
+                (NEW.status = 'pending')::int,
+                NEW.timestamp
+            )
+            ON CONFLICT (property_id) DO UPDATE SET
+                high_bid = CASE
+                    WHEN NEW.status != 'rejected' AND (s.high_bid IS NULL OR NEW.amount > s.high_bid)
+                    THEN NEW.amount ELSE s.high_bid END,
+                bid_count = s.bid_count + 1,
+                pending_count = s.pending_count + (NEW.status = 'pending')::int,
+                last_bid_at = GREATEST(s.last_bid_at, NEW.timestamp);
+            RETURN NULL;
+        END
+        $$
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION bids_stats_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE property_bid_stats SET
+                pending_count = pending_count + (NEW.status = 'pending')::int - (OLD.status = 'pending')::int,
+                high_bid = (
+                    SELECT MAX(amount) FROM bids
+                    WHERE property_id = NEW.property_id AND status != 'rejected'
+                )
+            WHERE property_id = NEW.property_id;
+            RETURN NULL;
+        END
+        $$
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION bids_stats_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE property_bid_stats SET
+                bid_count = bid_count - 1,
+                pending_count = pending_count - (OLD.status = 'pending')::int,
+                high_bid = (
+                    SELECT MAX(amount) FROM bids
+                    WHERE property_id = OLD.property_id AND status != 'rejected'
+                ),
+                last_bid_at = (SELECT MAX(timestamp) FROM bids WHERE property_id = OLD.property_id)
+            WHERE property_id = OLD.property_id;
+            DELETE FROM property_bid_stats WHERE property_id = OLD.property_id AND bid_count <= 0;
+            RETURN NULL;
+        END
+        $$
+        ''',
+        'CREATE TRIGGER bids_stats_insert AFTER INSERT ON bids FOR EACH ROW EXECUTE FUNCTION bids_stats_insert()',
+        '''
+        CREATE TRIGGER bids_stats_update AFTER UPDATE OF status, amount ON bids
+        FOR EACH ROW EXECUTE FUNCTION bids_stats_update()
+        ''',
+        'CREATE TRIGGER bids_stats_delete AFTER DELETE ON bids FOR EACH ROW EXECUTE FUNCTION bids_stats_delete()',
+        # Full-text search: the bm25() column weights of search.BM25_WEIGHTS
+        # become tsvector weights, title A, city B, street C, the rest D
+        '''
+        CREATE OR REPLACE FUNCTION property_search_vector(
+            title TEXT, city TEXT, street TEXT, description TEXT, features TEXT
+        ) RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+            SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('simple', coalesce(city, '')), 'B')
+                || setweight(to_tsvector('simple', coalesce(street, '')), 'C')
+                || setweight(to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(features, '')), 'D')
+        $$
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION property_features_text(listing_id TEXT) RETURNS TEXT LANGUAGE sql STABLE AS $$
+            SELECT string_agg(feature, ' ' ORDER BY position) FROM property_features WHERE property_id = listing_id
+        $$
+        ''',
+        # Bulk imports write features before the listing, so it's indexed once
+        '''
+        CREATE OR REPLACE FUNCTION properties_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := property_search_vector(
+                NEW.title, NEW.city, NEW.street, NEW.description, property_features_text(NEW.id)
+            );
+            RETURN NEW;
+        END
+        $$
+        ''',
+        '''
+        CREATE TRIGGER properties_search_vector BEFORE INSERT OR UPDATE OF title, description, street, city
+        ON properties FOR EACH ROW EXECUTE FUNCTION properties_search_vector()
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION property_features_search_vector() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE properties p SET search_vector = property_search_vector(
+                p.title, p.city, p.street, p.description, property_features_text(p.id)
+            )
+            WHERE p.id IN (SELECT property_id FROM changed);
+            RETURN NULL;
+        END
+        $$
+        ''',
+        '''
+        CREATE TRIGGER property_features_insert_search AFTER INSERT ON property_features
+        REFERENCING NEW TABLE AS changed
+        FOR EACH STATEMENT EXECUTE FUNCTION property_features_search_vector()
+        ''',
+        '''
+        CREATE TRIGGER property_features_delete_search AFTER DELETE ON property_features
+        REFERENCING OLD TABLE AS changed
+        FOR EACH STATEMENT EXECUTE FUNCTION property_features_search_vector()
+        ''',
+        # geo.haversine_km, which SQLite connections register from Python
+        '''
+        CREATE OR REPLACE FUNCTION haversine_km(
+            lat1 DOUBLE PRECISION, lng1 DOUBLE PRECISION, lat2 DOUBLE PRECISION, lng2 DOUBLE PRECISION
+        ) RETURNS DOUBLE PRECISION LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+            SELECT 2 * 6371.0088 * asin(least(1, sqrt(
+                sin(radians(lat2 - lat1) / 2) ^ 2
+                + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lng2 - lng1) / 2) ^ 2
+            )))
+        $$
+        ''',
+        _load_zip_centroids,
+        '''
+        CREATE OR REPLACE FUNCTION count_table_change() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE table_changes SET version = version + 1, changed_at = extract(epoch FROM clock_timestamp())
+            WHERE name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$
+        ''',
+    ] + [
+        step
+        for table in CHANGE_COUNTED_TABLES
+        for step in _change_counter_steps(table)
+    ]),
+    (2, 'dashboard summary tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS bid_daily_stats (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            bid_count INTEGER NOT NULL DEFAULT 0,
+            total_amount DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS listing_stats (
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            status TEXT NOT NULL,
+            listing_count INTEGER NOT NULL DEFAULT 0,
+            total_price DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (state, city, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS contract_agent_stats (
+            agent_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            contract_count INTEGER NOT NULL DEFAULT 0,
+            total_commission DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (agent_id, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_role_stats (
+            role TEXT PRIMARY KEY,
+            user_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    ] + [
+        step
+        for summary in DASHBOARD_SUMMARIES
+        for step in _summary_steps(*summary)
+    ] + [
+        rebuild_dashboard_stats,
+    ]),
+    (3, 'background job queue and notifications', [
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            available_at DOUBLE PRECISION NOT NULL,
+            created_at DOUBLE PRECISION NOT NULL,
+            started_at DOUBLE PRECISION,
+            finished_at DOUBLE PRECISION,
+            last_error TEXT
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (available_at) WHERE status IN ('queued', 'running')",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at) WHERE status = 'done'",
+        f'''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TEXT DEFAULT {NOW_TEXT}
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id, created_at)',
+    ]),
+]
+
+# migrations.HOT_QUERIES, with the FTS and R*Tree lookups replaced by the
+# queries that use their PostgreSQL counterparts
+HOT_QUERIES = [
+    query for query in HOT_QUERIES
+    if query[0] not in ('search result to listing', 'listings in a bounding box')
+] + [
+    ('search matches', '''
+        SELECT id FROM properties WHERE search_vector @@ to_tsquery('simple', ?)
+    ''', ('a',)),
+    ('listings in a bounding box', '''
+        SELECT id FROM properties WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+    ''', (0.0, 0.0, 0.0, 0.0)),
+]
@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Requests allowed per route, as (requests, seconds). Sign-in and sign-up are
+# kept tight to slow down credential stuffing; everything else gets the
+# default budget. Endpoint names are the Flask view function names.
+DEFAULT_LIMIT = (600, 60)
+ROUTE_LIMITS = {
+    'login': (10, 60),
+    'register': (5, 60),
+    'create_bid': (30, 10),
+    'create_property': (60, 60),
+    'bulk_create_properties': (10, 60),
+    'bulk_update_bid_status': (10, 60),
+}
+
+# Probes and scrapes are never limited
+EXEMPT_ROUTES = frozenset({'health_live', 'health_ready', 'get_metrics'})
+
+
+def parse_limits(spec):
+    """{'login': (10, 60), ...} from 'login=10/60,create_bid=30/10'.
+
+    'default=...' sets the budget of routes not listed.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        name, _, budget = item.partition('=')
+        requests, _, period = budget.partition('/')
+        try:
+            limits[name.strip()] = (int(requests), float(period or 1))
+        except ValueError:
+            raise ValueError(f'Invalid rate limit {item!r}, expected name=requests/seconds')
+    return limits
+
+
+class MemoryBucketStore:
+    # Token buckets for this process, evicted least recently used first. A
+    # bucket that has been idle for its whole period is full again, so an
+    # evicted one loses nothing a returning client could have used.
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, key, rate, burst, cost=1):
+        """Spend cost tokens from key's bucket.
+
+        Returns (allowed, retry_after), retry_after being the seconds until
+        enough tokens are back, or 0 when allowed.
+        """
+        with self._lock:
+            now = self._clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = burst
+                if len(self._buckets) >= self.maxsize:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(key)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return True, 0.0
+            self._buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'buckets': len(self._buckets),
+            'maxsize': self.maxsize,
+            'evictions': self.evictions,
+        }
+
+
+# Refill and spend in one round trip, atomically, on the server's clock so
+# workers on different hosts agree. Keys expire once the bucket would be full.
+TAKE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+    tokens = burst
+else
+    tokens = math.min(burst, tokens + math.max(0, now - tonumber(bucket[2])) * rate)
+end
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+'''
+
+
+class RedisBucketStore:
+    # Buckets shared by every worker pointed at the same Redis-compatible
+    # server, so a client's budget doesn't multiply with the worker count
+
+    def __init__(self, url, prefix='ebn:rl:'):
+        import redis  # optional dependency, only needed when configured
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+        self._prefix = prefix
+        self.url = url
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, wait = self._take(keys=[self._prefix + key], args=[rate, burst, cost])
+        return bool(allowed), float(wait)
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + '*'):
+            self._client.delete(key)
+
+    def stats(self):
+        return {'backend': 'redis', 'url': self.url}
+
+
+def make_bucket_store(url=None, maxsize=100000):
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBucketStore(url)
+    return MemoryBucketStore(maxsize=maxsize)
+
+
+class RateLimiter:
+    # Per-route token buckets keyed by who is asking: a bucket holds up to
+    # the route's request count and refills at count/seconds per second, so
+    # short bursts pass and a sustained rate above the budget doesn't. Each
+    # check is one dict operation under a lock on the in-process store.
+    #
+    # When the store can't be reached requests are let through rather than
+    # failing, and counted in store_errors.
+
+    def __init__(self, store, limits=None, default=DEFAULT_LIMIT, exempt=EXEMPT_ROUTES):
+        self.store = store
+        self.exempt = exempt
+        self._default = self._bucket(default)
+        self._limits = {route: self._bucket(limit) for route, limit in (limits or {}).items()}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.store_errors = 0
+
+    @staticmethod
+    def _bucket(limit):
+        requests, period = limit
+        return requests / period, requests
+
+    def limit(self, route):
+        rate, burst = self._limits.get(route, self._default)
+        return burst, burst / rate
+
+    def check(self, route, identity):
+        """(allowed, retry_after) for a request to route by identity."""
+        if route in self.exempt:
+            return True, 0.0
+        rate, burst = self._limits.get(route, self._default)
+        try:
+            allowed, retry_after = self.store.take(f'{route}:{identity}', rate, burst)
+        except Exception:
+            logger.warning('Rate limit store failed, letting the request through', exc_info=True)
+            with self._lock:
+                self.store_errors += 1
+            return True, 0.0
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return allowed, retry_after
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'store_errors': self.store_errors,
+                'default': dict(zip(('requests', 'seconds'), self.limit(None))),
+                'routes': {route: dict(zip(('requests', 'seconds'), self.limit(route))) for route in self._limits},
+            }
+        stats.update(self.store.stats())
+        return stats
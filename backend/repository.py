@@ -0,0 +1,548 @@
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+from bulk import import_properties, update_bid_statuses
+from caching import table_state
+from dashboard import (OVERVIEW_QUERIES, build_agent_commission_query, build_bid_volume_query,
+                       build_listing_location_query, shape_agent_commissions, shape_bid_volume,
+                       shape_listing_locations, shape_overview)
+from dialects import SQLITE
+from export import stream_query
+from geo import backfill_coordinates, build_bbox_query, build_cluster_query, build_radius_query, geocode, load_zip_centroids
+from jobs import (claim_job, complete_job, enqueue_job, fail_job, job_queue_depth, next_due_at, purge_jobs,
+                  retry_failed_jobs)
+from listings import build_property_detail_query, build_property_query, replace_property_children
+from migrations import (MIGRATIONS, check_query_plans, current_version, latest_version, migrate, rebuild_bid_stats,
+                        rebuild_dashboard_stats, rebuild_geo_index, rebuild_search_index)
+from search import build_search_query, build_suggest_query
+
+# Queries behind the admin exports, streamed in batches
+EXPORT_QUERIES = {
+    'users': 'SELECT id, username, email, role, created_at FROM users',
+    'bids': 'SELECT * FROM bids',
+    'contracts': 'SELECT * FROM contracts',
+}
+
+PROPERTY_COLUMNS = (
+    'id', 'title', 'description', 'type', 'property_type', 'price', 'bedrooms', 'bathrooms', 'area',
+    'street', 'city', 'state', 'zip_code', 'owner_id', 'status', 'latitude', 'longitude',
+)
+
+INSERT_PROPERTY_SQL = (
+    f"INSERT INTO properties ({', '.join(PROPERTY_COLUMNS)}) VALUES ({', '.join('?' * len(PROPERTY_COLUMNS))})"
+)
+
+
+class Repository:
+    # Data access for the API: routes call these methods rather than opening
+    # cursors, so the storage behind them can change. Everything here is
+    # written once, with ? placeholders, in SQL both backends run; the
+    # subclasses supply the schema and the few operations that differ.
+    # SQLiteRepository is below and PostgresRepository is in postgres.py.
+    #
+    # pool is a db.ConnectionPool or postgres.PostgresPool. Connections come
+    # from it per call, and writes that span statements run in one
+    # transaction opened with the dialect's begin_write.
+    #
+    # Two optional extras: read_pool serves the read-only listing, bid and
+    # contract queries (e.g. a db.ConnectionPool opened read_only, or a
+    # db.SnapshotPool), and writer, a db.GroupCommitWriter, runs the writes
+    # instead of the calling thread. Bulk imports and maintenance commands
+    # always run on pool, in transactions of their own.
+
+    dialect = SQLITE
+    migrations = MIGRATIONS
+    # Exceptions a writer may get when another one holds the lock it needs;
+    # is_lock_error() picks out the ones worth retrying
+    lock_errors = ()
+
+    def __init__(self, pool, read_pool=None, writer=None):
+        self.pool = pool
+        self.read_pool = read_pool or pool
+        self.writer = writer
+
+    def connect(self):
+        # A pooled connection; close() returns it
+        return self.pool.acquire()
+
+    @contextmanager
+    def connection(self, read_only=False):
+        conn = (self.read_pool if read_only else self.pool).acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute(self.dialect.begin_write)
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def fetchone(self, sql, params=(), read_only=False):
+        with self.connection(read_only) as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=(), read_only=False):
+        with self.connection(read_only) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def run_write(self, fn, *args):
+        # fn(conn, *args) in a write transaction, through the writer when
+        # there is one; fn mustn't commit or roll back itself
+        if self.writer is not None:
+            return self.writer.submit(fn, *args)
+        with self.transaction() as conn:
+            return fn(conn, *args)
+
+    def write(self, sql, params=()):
+        # One statement in its own transaction; returns the rows it changed
+        return self.run_write(_execute_write, sql, params)
+
+    def is_lock_error(self, error):
+        raise NotImplementedError
+
+    @contextmanager
+    def streaming_cursor(self, sql, params=(), batch_size=500):
+        # A cursor for reading a large result in fetchmany() batches
+        raise NotImplementedError
+
+    # Schema and maintenance
+
+    def migrate(self):
+        with self.connection() as conn:
+            return migrate(conn, self.migrations, begin=self.dialect.begin_migration)
+
+    def schema_version(self):
+        with self.connection() as conn:
+            return current_version(conn)
+
+    def latest_version(self):
+        return latest_version(self.migrations)
+
+    def slow_query_plans(self):
+        """[(name, [plan steps])] for the hot queries whose plans scan or sort."""
+        raise NotImplementedError
+
+    def optimize(self):
+        # Housekeeping after a bulk load
+        pass
+
+    def table_state(self, tables):
+        # Versions of what the read-only queries see, so from read_pool too
+        with self.connection(read_only=True) as conn:
+            return table_state(conn, tables)
+
+    def rebuild_bid_stats(self):
+        with self.transaction() as conn:
+            rebuild_bid_stats(conn)
+            return conn.execute('SELECT COUNT(*) FROM property_bid_stats').fetchone()[0]
+
+    def rebuild_dashboard_stats(self):
+        with self.transaction() as conn:
+            rebuild_dashboard_stats(conn)
+
+    def load_zip_centroids(self, path):
+        # Returns (centroids loaded, properties geocoded)
+        with self.transaction() as conn:
+            count = load_zip_centroids(conn, path)
+            return count, backfill_coordinates(conn)
+
+    # Users
+
+    def get_user(self, user_id):
+        return self.fetchone("SELECT * FROM users WHERE id = ?", (user_id,))
+
+    def get_user_by_username(self, username):
+        return self.fetchone("SELECT * FROM users WHERE username = ?", (username,))
+
+    def user_exists(self, username, email):
+        row = self.fetchone("SELECT id FROM users WHERE username = ? OR email = ?", (username, email))
+        return row is not None
+
+    def create_user(self, user_id, username, email, password_hash, role, if_absent=False):
+        # if_absent skips a user whose id, username or email is taken, e.g.
+        # by another process seeding the same account at startup
+        sql = "INSERT INTO users (id, username, email, password, role) VALUES (?, ?, ?, ?, ?)"
+        if if_absent:
+            sql += " ON CONFLICT DO NOTHING"
+        self.write(sql, (user_id, username, email, password_hash, role))
+
+    def replace_password(self, user_id, old_hash, new_hash):
+        # Only if it's still old_hash, so a concurrent password change wins
+        self.write("UPDATE users SET password = ? WHERE id = ? AND password = ?", (new_hash, user_id, old_hash))
+
+    def delete_user(self, user_id):
+        # False when there was no such user. Their listings, bids, contracts
+        # and notifications go in a cleanup_user job queued with the delete.
+        return self.run_write(_delete_user, user_id)
+
+    def cleanup_user(self, user_id):
+        """Delete what a deleted user left behind.
+
+        Returns the ids of their listings, and {property_id: (high_bid,
+        bid_count)} for the other listings they had bid on, as those stand
+        once their bids are gone. Their listings' own bids, contracts and
+        children are left to the cleanup_property jobs this queues.
+        """
+        def cleanup(conn):
+            property_ids = [row[0] for row in conn.execute("SELECT id FROM properties WHERE owner_id = ?", (user_id,))]
+            bid_property_ids = [
+                row[0] for row in conn.execute("SELECT DISTINCT property_id FROM bids WHERE user_id = ?", (user_id,))
+                if row[0] not in property_ids
+            ]
+            conn.execute("DELETE FROM bids WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM contracts WHERE owner_id = ? OR agent_id = ?", (user_id, user_id))
+            conn.execute("DELETE FROM notifications WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM properties WHERE owner_id = ?", (user_id,))
+            for property_id in property_ids:
+                _queue_property_cleanup(conn, property_id)
+            bid_stats = {}
+            for property_id in bid_property_ids:
+                row = conn.execute(
+                    "SELECT high_bid, bid_count FROM property_bid_stats WHERE property_id = ?", (property_id,)
+                ).fetchone()
+                bid_stats[property_id] = tuple(row) if row else (None, 0)
+            return property_ids, bid_stats
+
+        return self.run_write(cleanup)
+
+    # Properties
+
+    def get_property(self, property_id):
+        return self.fetchone("SELECT * FROM properties WHERE id = ?", (property_id,))
+
+    def property_page(self, args):
+        # Rows of one listing page and the plan shape_property_page() needs
+        sql, params, plan = build_property_query(args, self.dialect)
+        return self.fetchall(sql, params, read_only=True), plan
+
+    def property_document(self, property_id, args=None):
+        # The listing's JSON document, or None when it doesn't exist
+        sql, params = build_property_detail_query(property_id, args, self.dialect)
+        row = self.fetchone(sql, params, read_only=True)
+        return row['doc'] if row else None
+
+    def search_properties(self, args):
+        sql, params, plan = build_search_query(args, self.dialect)
+        return self.fetchall(sql, params, read_only=True), plan
+
+    def suggest_properties(self, args):
+        sql, params = build_suggest_query(args, self.dialect)
+        return self.fetchall(sql, params, read_only=True)
+
+    def properties_in_bbox(self, args):
+        sql, params = build_bbox_query(args, self.dialect)
+        return self.fetchall(sql, params, read_only=True)
+
+    def properties_in_radius(self, args):
+        sql, params = build_radius_query(args, self.dialect)
+        return self.fetchall(sql, params, read_only=True)
+
+    def property_clusters(self, args):
+        sql, params, _ = build_cluster_query(args, self.dialect)
+        return self.fetchall(sql, params, read_only=True)
+
+    def geocode(self, data, zip_code):
+        with self.connection() as conn:
+            return geocode(conn.cursor(), data, zip_code)
+
+    def create_property(self, property_id, data, owner_id, features, images):
+        """Insert a listing from a create payload, with its features and images.
+
+        Raises ListingQueryError when its coordinates are invalid.
+        """
+        latitude, longitude = self.geocode(data, data.get('zipCode'))
+        row = (
+            property_id, data['title'], data.get('description'), data['type'], data['propertyType'],
+            data['price'], data.get('bedrooms'), data.get('bathrooms'), data['area'], data.get('street'),
+            data['city'], data['state'], data.get('zipCode'), owner_id, 'active', latitude, longitude,
+        )
+
+        def insert(conn):
+            cursor = conn.cursor()
+            cursor.execute(INSERT_PROPERTY_SQL, row)
+            replace_property_children(cursor, property_id, features, images)
+
+        self.run_write(insert)
+
+    def update_property(self, property, data, features=None, images=None):
+        """Apply an update payload to the listing row property.
+
+        Fields missing from data keep their values. Coordinates are looked up
+        again when they're sent or the zip code changes; raises
+        ListingQueryError when they're invalid.
+        """
+        zip_code = data.get('zipCode', property['zip_code'])
+        latitude, longitude = property['latitude'], property['longitude']
+        if 'latitude' in data or zip_code != property['zip_code'] or latitude is None:
+            latitude, longitude = self.geocode(data, zip_code)
+
+        values = (
+            data.get('title', property['title']),
+            data.get('description', property['description']),
+            data.get('type', property['type']),
+            data.get('propertyType', property['property_type']),
+            data.get('price', property['price']),
+            data.get('bedrooms', property['bedrooms']),
+            data.get('bathrooms', property['bathrooms']),
+            data.get('area', property['area']),
+            data.get('street', property['street']),
+            data.get('city', property['city']),
+            data.get('state', property['state']),
+            zip_code,
+            data.get('status', property['status']),
+            latitude,
+            longitude,
+            property['id'],
+        )
+
+        def update(conn):
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE properties SET
+                title = ?, description = ?, type = ?, property_type = ?, price = ?,
+                bedrooms = ?, bathrooms = ?, area = ?, street = ?, city = ?,
+                state = ?, zip_code = ?, status = ?, latitude = ?, longitude = ?
+                WHERE id = ?
+                """,
+                values
+            )
+            replace_property_children(cursor, property['id'], features, images)
+
+        self.run_write(update)
+
+    def delete_property(self, property_id):
+        # Only the listing row; its features, images, bids and contracts go
+        # in a cleanup_property job queued with the delete
+        self.run_write(_delete_property, property_id)
+
+    def cleanup_property(self, property_id):
+        def cleanup(conn):
+            conn.execute("DELETE FROM property_features WHERE property_id = ?", (property_id,))
+            conn.execute("DELETE FROM property_images WHERE property_id = ?", (property_id,))
+            conn.execute("DELETE FROM bids WHERE property_id = ?", (property_id,))
+            conn.execute("DELETE FROM contracts WHERE property_id = ?", (property_id,))
+
+        self.run_write(cleanup)
+
+    def import_properties(self, items, owner_id, errors=None, batch_size=5000, optimize_delay=60):
+        # Queues an optimize job for optimize_delay seconds after the import;
+        # imports within the same window share it
+        with self.connection() as conn:
+            results = import_properties(conn, items, owner_id, errors, batch_size, begin=self.dialect.begin_write)
+        window = int(time.time() // optimize_delay)
+        self.run_write(enqueue_job, 'optimize', {}, f'optimize:{window}', (window + 1) * optimize_delay - time.time())
+        return results
+
+    # Bids (placed through bidding.BidEngine)
+
+    def bids_for_property(self, property_id, plan):
+        return self.fetchall(
+            f"SELECT {plan.select_sql} FROM bids WHERE property_id = ?", (property_id,), read_only=True
+        )
+
+    def bids_for_user(self, user_id, plan):
+        return self.fetchall(f"SELECT {plan.select_sql} FROM bids WHERE user_id = ?", (user_id,), read_only=True)
+
+    def get_bid(self, bid_id):
+        # The bid with its listing's owner_id
+        return self.fetchone("""
+            SELECT b.*, p.owner_id
+            FROM bids b
+            JOIN properties p ON b.property_id = p.id
+            WHERE b.id = ?
+        """, (bid_id,))
+
+    def set_bid_status(self, bid_id, status):
+        # The bidder is notified by a notify_bid_status job queued with the update
+        def update(conn):
+            conn.execute("UPDATE bids SET status = ? WHERE id = ?", (status, bid_id))
+            _queue_bid_notification(conn, bid_id, status)
+
+        self.run_write(update)
+
+    def update_bid_statuses(self, items, current_user, errors=None):
+        def notify(conn, updated):
+            for bid_id, _, status in updated:
+                _queue_bid_notification(conn, bid_id, status)
+
+        with self.connection() as conn:
+            return update_bid_statuses(conn, items, current_user, errors, begin=self.dialect.begin_write,
+                                       before_commit=notify)
+
+    def notify_bid_status(self, notification_id, bid_id, status):
+        # The notification's id comes with the job, so a rerun inserts nothing
+        self.write(
+            """
+            INSERT INTO notifications (id, user_id, kind, data)
+            SELECT ?, b.user_id, 'bid_status', """ + self.dialect.document(self.dialect.json_object([
+                ('bidId', 'b.id'), ('propertyId', 'b.property_id'), ('propertyTitle', 'p.title'),
+                ('amount', 'b.amount'), ('status', 'CAST(? AS TEXT)'),
+            ])) + """
+            FROM bids b LEFT JOIN properties p ON p.id = b.property_id
+            WHERE b.id = ?
+            ON CONFLICT (id) DO NOTHING
+            """,
+            (notification_id, status, bid_id)
+        )
+
+    def notifications_for_user(self, user_id, limit=50):
+        return self.fetchall(
+            """
+            SELECT id, kind, data, created_at FROM notifications
+            WHERE user_id = ? ORDER BY created_at DESC, id LIMIT ?
+            """,
+            (user_id, limit),
+            read_only=True
+        )
+
+    # Contracts
+
+    def create_contract(self, contract_id, property_id, owner_id, agent_id, commission, start_date, end_date):
+        self.write(
+            """
+            INSERT INTO contracts
+            (id, property_id, owner_id, agent_id, commission, status, start_date, end_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (contract_id, property_id, owner_id, agent_id, commission, 'pending', start_date, end_date)
+        )
+
+    def get_contract(self, contract_id):
+        return self.fetchone("SELECT * FROM contracts WHERE id = ?", (contract_id,))
+
+    def contracts_for_user(self, user_id, plan):
+        return self.fetchall(
+            f"SELECT {plan.select_sql} FROM contracts WHERE owner_id = ? OR agent_id = ?",
+            (user_id, user_id),
+            read_only=True
+        )
+
+    def set_contract_status(self, contract_id, status):
+        self.write("UPDATE contracts SET status = ? WHERE id = ?", (status, contract_id))
+
+    # Admin dashboard aggregates, from the summary tables
+
+    def dashboard_overview(self):
+        with self.connection(read_only=True) as conn:
+            return {
+                name: shape_overview(name, conn.execute(sql).fetchall())
+                for name, sql in OVERVIEW_QUERIES.items()
+            }
+
+    def bid_volume(self, args):
+        sql, params = build_bid_volume_query(args, self.dialect)
+        return shape_bid_volume(self.fetchall(sql, params, read_only=True))
+
+    def listing_locations(self, args):
+        sql, params = build_listing_location_query(args)
+        return shape_listing_locations(self.fetchall(sql, params, read_only=True))
+
+    def agent_commissions(self, args):
+        sql, params = build_agent_commission_query(args)
+        return shape_agent_commissions(self.fetchall(sql, params, read_only=True))
+
+    # Background jobs; see jobs.JobQueue
+
+    def enqueue_job(self, kind, payload, key=None, delay=0.0, max_attempts=5):
+        return self.run_write(enqueue_job, kind, payload, key, delay, max_attempts)
+
+    def claim_job(self, visibility_timeout):
+        # Idle workers poll; a plain read keeps that from taking the write lock
+        with self.connection() as conn:
+            due = next_due_at(conn)
+        if due is None or due > time.time():
+            return None
+        return self.run_write(claim_job, visibility_timeout, self.dialect.skip_locked)
+
+    def complete_job(self, job_id, attempt):
+        return self.run_write(complete_job, job_id, attempt)
+
+    def fail_job(self, job_id, attempt, error, retry_delay=None):
+        return self.run_write(fail_job, job_id, attempt, error, retry_delay)
+
+    def purge_jobs(self, finished_before):
+        return self.run_write(purge_jobs, finished_before)
+
+    def retry_failed_jobs(self, kind=None):
+        return self.run_write(retry_failed_jobs, kind)
+
+    def job_queue_depth(self):
+        with self.connection() as conn:
+            return job_queue_depth(conn)
+
+    # Exports
+
+    def export(self, name, fmt='json', batch_size=500):
+        """Lazily encoded export of one of EXPORT_QUERIES; see export.stream_query."""
+        return stream_query(self.streaming_cursor, EXPORT_QUERIES[name], (), fmt, batch_size)
+
+
+def _execute_write(conn, sql, params):
+    return conn.execute(sql, params).rowcount
+
+
+def _delete_user(conn, user_id):
+    if conn.execute("DELETE FROM users WHERE id = ?", (user_id,)).rowcount == 0:
+        return False
+    enqueue_job(conn, 'cleanup_user', {'user_id': user_id}, key=f'cleanup_user:{user_id}')
+    return True
+
+
+def _delete_property(conn, property_id):
+    conn.execute("DELETE FROM properties WHERE id = ?", (property_id,))
+    _queue_property_cleanup(conn, property_id)
+
+
+def _queue_property_cleanup(conn, property_id):
+    enqueue_job(conn, 'cleanup_property', {'property_id': property_id}, key=f'cleanup_property:{property_id}')
+
+
+def _queue_bid_notification(conn, bid_id, status):
+    enqueue_job(conn, 'notify_bid_status', {'id': str(uuid.uuid4()), 'bid_id': bid_id, 'status': status})
+
+
+class SQLiteRepository(Repository):
+    lock_errors = (sqlite3.OperationalError,)
+
+    def is_lock_error(self, error):
+        message = str(error).lower()
+        return 'locked' in message or 'busy' in message
+
+    @contextmanager
+    def streaming_cursor(self, sql, params=(), batch_size=500):
+        # SQLite cursors already step through the result as it's fetched
+        with self.connection(read_only=True) as conn:
+            yield conn.execute(sql, params)
+
+    def slow_query_plans(self):
+        with self.connection() as conn:
+            return check_query_plans(conn)
+
+    def optimize(self):
+        # Merge the FTS segments a bulk load writes, and fold the WAL back
+        # into the database file
+        with self.connection() as conn:
+            conn.execute("INSERT INTO properties_fts (properties_fts) VALUES ('optimize')")
+            conn.commit()
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def rebuild_search_index(self):
+        with self.transaction() as conn:
+            rebuild_search_index(conn)
+        with self.connection() as conn:
+            conn.execute("INSERT INTO properties_fts (properties_fts) VALUES ('optimize')")
+            conn.commit()
+
+    def rebuild_geo_index(self):
+        with self.transaction() as conn:
+            rebuild_geo_index(conn)
@@ -0,0 +1,139 @@
+import re
+
+from dialects import SQLITE
+from listings import (
+    ListingQueryError, filter_clauses, parse_fields, parse_key_case, parse_limit, property_json_sql,
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# bm25() column weights, in properties_fts column order:
+# title, description, street, city, features
+BM25_WEIGHTS = '8.0, 1.0, 2.0, 4.0, 3.0'
+
+# On PostgreSQL properties.search_vector weights title A, city B, street C and
+# description plus features D; ts_rank() takes the weights as {D, C, B, A}
+TS_RANK_WEIGHTS = "'{0.2, 0.25, 0.5, 1.0}'"
+
+MAX_SEARCH_OFFSET = 1000
+
+
+def search_tokens(text):
+    tokens = TOKEN_RE.findall(text or '')
+    if not tokens:
+        raise ListingQueryError('q must contain at least one word')
+    return tokens
+
+
+def fts_match(text, columns=None):
+    # Quote every word so user input can't inject FTS5 syntax; words are
+    # ANDed and the last one is a prefix so results follow the user's typing
+    tokens = search_tokens(text)
+    terms = ['"' + token + '"' for token in tokens]
+    terms[-1] += '*'
+    query = ' '.join(terms)
+    if columns:
+        query = '{' + ' '.join(columns) + '}: (' + query + ')'
+    return query
+
+
+def ts_query(text, weights=''):
+    # The PostgreSQL counterpart of fts_match, for to_tsquery(): the same
+    # quoted, ANDed words with a prefix last, restricted to the given weights
+    tokens = search_tokens(text)
+    terms = [f"'{token}'" + (':' + weights if weights else '') for token in tokens[:-1]]
+    terms.append(f"'{tokens[-1]}':*" + weights)
+    return ' & '.join(terms)
+
+
+def parse_page(args):
+    limit = parse_limit(args, default=20, maximum=100)
+    try:
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ListingQueryError('offset must be an integer')
+    if not 0 <= offset <= MAX_SEARCH_OFFSET:
+        raise ListingQueryError(f'offset must be between 0 and {MAX_SEARCH_OFFSET}')
+    return limit, offset
+
+
+def build_search_query(args, dialect=SQLITE):
+    """BM25-ranked full-text search combined with the structured listing filters."""
+    if dialect is not SQLITE:
+        return build_ts_search_query(args, dialect)
+    match = fts_match(args.get('q'))
+    where, params = filter_clauses(args)
+    limit, offset = parse_page(args)
+    fields = parse_fields(args.get('fields'))
+    case = parse_key_case(args)
+
+    # Rank and cut the page using only rowids and the filter columns, then
+    # build JSON for the page alone; building documents inside the ranked
+    # query would encode every match before the sort discards most of them
+    if where:
+        sql = 'WITH hits AS (SELECT properties_fts.rowid AS key, '
+        sql += f'bm25(properties_fts, {BM25_WEIGHTS}) AS score'
+        sql += ' FROM properties_fts JOIN property_keys k ON k.key = properties_fts.rowid'
+        sql += ' JOIN properties p ON p.id = k.property_id'
+        sql += ' WHERE properties_fts MATCH ? AND ' + ' AND '.join(where)
+    else:
+        sql = f'WITH hits AS (SELECT rowid AS key, bm25(properties_fts, {BM25_WEIGHTS}) AS score'
+        sql += ' FROM properties_fts WHERE properties_fts MATCH ?'
+    sql += ' ORDER BY score LIMIT ? OFFSET ?)'
+    sql += f' SELECT {property_json_sql(fields, case)} AS doc FROM hits'
+    sql += ' JOIN property_keys k ON k.key = hits.key JOIN properties p ON p.id = k.property_id'
+    sql += ' ORDER BY hits.score'
+    # One extra row tells us whether there is a next page
+    params = [match] + params + [limit + 1, offset]
+    return sql, params, {'limit': limit, 'offset': offset}
+
+
+def build_ts_search_query(args, dialect):
+    # PostgreSQL: ts_rank() over the GIN-indexed search_vector, ranking and
+    # cutting the page before any documents are built, as above
+    query = ts_query(args.get('q'))
+    where, params = filter_clauses(args)
+    limit, offset = parse_page(args)
+    fields = parse_fields(args.get('fields'))
+    case = parse_key_case(args)
+
+    sql = f'WITH hits AS (SELECT p.id, ts_rank({TS_RANK_WEIGHTS}, p.search_vector, q) AS score'
+    sql += " FROM properties p, to_tsquery('simple', ?) q WHERE p.search_vector @@ q"
+    for clause in where:
+        sql += ' AND ' + clause
+    sql += ' ORDER BY score DESC, p.id LIMIT ? OFFSET ?)'
+    sql += f' SELECT {property_json_sql(fields, case, dialect)} AS doc FROM hits'
+    sql += ' JOIN properties p ON p.id = hits.id ORDER BY hits.score DESC, p.id'
+    params = [query] + params + [limit + 1, offset]
+    return sql, params, {'limit': limit, 'offset': offset}
+
+
+def build_suggest_query(args, dialect=SQLITE):
+    """Prefix autocomplete over titles, cities and streets."""
+    if dialect is not SQLITE:
+        return build_ts_suggest_query(args, dialect)
+    match = fts_match(args.get('q'), columns=('title', 'city', 'street'))
+    limit = parse_limit(args, default=8, maximum=20)
+    sql = (
+        'WITH hits AS (SELECT rowid AS key, rank FROM properties_fts'
+        ' WHERE properties_fts MATCH ? ORDER BY rank LIMIT ?)'
+        " SELECT json_object('id', p.id, 'title', p.title, 'city', p.city, 'state', p.state) AS doc"
+        ' FROM hits JOIN property_keys k ON k.key = hits.key'
+        ' JOIN properties p ON p.id = k.property_id ORDER BY hits.rank'
+    )
+    return sql, [match, limit]
+
+
+def build_ts_suggest_query(args, dialect):
+    # PostgreSQL: weights A-C are the title, city and street
+    query = ts_query(args.get('q'), 'ABC')
+    limit = parse_limit(args, default=8, maximum=20)
+    doc = dialect.json_object([('id', 'p.id'), ('title', 'p.title'), ('city', 'p.city'), ('state', 'p.state')])
+    sql = (
+        'WITH hits AS (SELECT p.id, ts_rank(p.search_vector, q) AS score'
+        " FROM properties p, to_tsquery('simple', ?) q WHERE p.search_vector @@ q"
+        ' ORDER BY score DESC, p.id LIMIT ?)'
+        f' SELECT {dialect.document(doc)} AS doc FROM hits'
+        ' JOIN properties p ON p.id = hits.id ORDER BY hits.score DESC, p.id'
+    )
+    return sql, [query, limit]
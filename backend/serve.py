@@ -0,0 +1,341 @@
+# Production launcher. The master imports the app once, which runs the
+# migrations and seeds the mock users, then binds the listening socket and
+# forks preloaded worker processes that all accept on it.
+#
+#   cd backend && python serve.py --workers 4 --threads 8 --bind 0.0.0.0:5000
+#   cd backend && python serve.py --workers 4 --asgi    # workers run asgi.py on uvicorn
+#
+# Signals to the master:
+#   TERM, INT  graceful shutdown: workers stop accepting and finish in-flight requests
+#   HUP        zero-downtime reload: re-exec with the current code on the same socket,
+#              start the new workers, then drain the old ones
+#   TTIN, TTOU add or remove a worker
+#
+# Each worker is a separate process. The event hub, auth cache and bid
+# engine's high-bid map are per process, and so are the response cache and
+# rate limit buckets unless RESPONSE_CACHE_URL and RATE_LIMIT_STORE_URL point
+# at a shared server. The auth cache and high-bid map are invalidated in
+# every worker at once through counters in shared memory, created when the
+# master preloads the app, so they only reach workers of the same master.
+
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+LISTEN_FD_ENV = 'EBN_LISTEN_FD'
+RETIRING_WORKERS_ENV = 'EBN_RETIRING_WORKERS'
+
+logger = logging.getLogger('serve')
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    # werkzeug's WSGI server handing connections to a fixed-size thread pool
+    # instead of starting a thread per connection. Connections are not kept
+    # alive, so idle clients can't pin threads; long-lived event streams do
+    # hold one each, which is what --asgi is for.
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the API with preloaded worker processes.')
+    parser.add_argument('--bind', default=os.environ.get('WEB_BIND', '127.0.0.1:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 8)))
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30)))
+    parser.add_argument('--asgi', action='store_true', default=os.environ.get('WEB_ASGI', '0') == '1',
+                        help='serve asgi:application with uvicorn in each worker')
+    return parser.parse_args()
+
+
+def listening_socket(bind):
+    # Reuse the socket handed over by the master being reloaded, if any
+    if os.environ.get(LISTEN_FD_ENV):
+        fd = int(os.environ.pop(LISTEN_FD_ENV))
+        return socket.socket(fileno=fd)
+    host, _, port = bind.rpartition(':')
+    sock = socket.create_server((host or '0.0.0.0', int(port)), backlog=2048)
+    return sock
+
+
+def run_worker(args, sock, ready_fd, worker_id):
+    started = time.perf_counter()
+    import app as wsgi
+
+    # Drop the master's handlers; Ctrl-C reaches the whole process group but
+    # only the master acts on it
+    for sig in (signal.SIGTERM, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    wsgi.reset_after_fork()
+    wsgi.startup['worker'] = worker_id
+
+    def ready():
+        wsgi.startup['worker_ready_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+    if args.asgi:
+        serve_asgi(args, sock, wsgi, ready)
+    else:
+        serve_wsgi(args, sock, wsgi, ready)
+    wsgi.password_hasher.shutdown(wait=True)
+    wsgi.job_queue.shutdown(timeout=args.graceful_timeout)
+    os._exit(0)
+
+
+def serve_wsgi(args, sock, wsgi, ready):
+    host, port = sock.getsockname()[:2]
+    server = PooledWSGIServer(host, port, wsgi.app, args.threads, fd=sock.fileno())
+    # Every worker wakes up for each new connection but only one gets it;
+    # the others must not block in accept(), or they'd miss a shutdown
+    server.socket.setblocking(False)
+
+    def drain(signum, frame):
+        wsgi.app.config['DRAINING'] = True
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    ready()
+    server.serve_forever()
+
+    # Let in-flight requests finish, up to the graceful timeout
+    waiter = threading.Thread(target=server.executor.shutdown, daemon=True)
+    waiter.start()
+    waiter.join(args.graceful_timeout)
+
+
+def serve_asgi(args, sock, wsgi, ready):
+    import uvicorn
+    import asgi
+
+    class Server(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets)
+            ready()
+
+        def handle_exit(self, sig, frame):
+            wsgi.app.config['DRAINING'] = True
+            super().handle_exit(sig, frame)
+
+    config = uvicorn.Config(
+        asgi.application,
+        log_level=logging.getLevelName(logger.getEffectiveLevel()).lower(),
+        timeout_graceful_shutdown=args.graceful_timeout,
+        lifespan='on',
+    )
+    # uvicorn re-raises the signal it stopped on once it has shut down;
+    # ignore it so the worker still gets to clean up
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    Server(config).run(sockets=[sock])
+
+
+class Arbiter:
+    def __init__(self, args, sock, started):
+        self.args = args
+        self.sock = sock
+        self.started = started
+        self.workers = {}      # pid -> worker id
+        self.retiring = set()  # pids being drained after a reload
+        self.num_workers = args.workers
+        self.stopping = False
+        self._signals = []
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_w, False)
+
+    def spawn(self, worker_id):
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            try:
+                run_worker(self.args, self.sock, ready_w, worker_id)
+            finally:
+                os._exit(1)
+        os.close(ready_w)
+        self.workers[pid] = worker_id
+        return pid, ready_r
+
+    def spawn_workers(self, worker_ids):
+        started = time.perf_counter()
+        pending = dict(self.spawn(worker_id)[::-1] for worker_id in worker_ids)
+        deadline = time.monotonic() + 60
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending), [], [], 1.0)
+            for fd in readable:
+                pid = pending.pop(fd)
+                ok = os.read(fd, 1) == b'1'
+                os.close(fd)
+                if ok:
+                    logger.info('Worker %s (pid %s) ready after %.0f ms',
+                                self.workers.get(pid), pid, (time.perf_counter() - started) * 1000)
+                else:
+                    logger.error('Worker %s (pid %s) failed to start', self.workers.get(pid), pid)
+        for fd in pending:
+            os.close(fd)
+
+    def free_worker_ids(self, count):
+        used = set(self.workers.values())
+        ids = []
+        candidate = 1
+        while len(ids) < count:
+            if candidate not in used:
+                ids.append(candidate)
+            candidate += 1
+        return ids
+
+    def run(self, retiring=()):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD):
+            signal.signal(sig, self._on_signal)
+
+        self.spawn_workers(self.free_worker_ids(self.num_workers))
+        logger.info('%s workers serving on %s, %.0f ms after start',
+                    self.num_workers, self.args.bind, (time.perf_counter() - self.started) * 1000)
+        # Workers inherited from the master this one replaced
+        self.retire(retiring)
+
+        while True:
+            select.select([self._wakeup_r], [], [], 1.0)
+            try:
+                os.read(self._wakeup_r, 512)
+            except BlockingIOError:
+                pass
+            while self._signals:
+                self.handle(self._signals.pop(0))
+            self.reap()
+            if self.stopping:
+                if not self.workers and not self.retiring:
+                    return
+                continue
+            missing = self.num_workers - len(self.workers)
+            if missing > 0:
+                self.spawn_workers(self.free_worker_ids(missing))
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+        try:
+            os.write(self._wakeup_w, b'.')
+        except BlockingIOError:
+            pass
+
+    def handle(self, signum):
+        if signum in (signal.SIGTERM, signal.SIGINT):
+            self.stop()
+        elif signum == signal.SIGHUP and not self.stopping:
+            self.reload()
+        elif signum == signal.SIGTTIN:
+            self.num_workers += 1
+        elif signum == signal.SIGTTOU and self.num_workers > 1:
+            self.num_workers -= 1
+            pid = max(self.workers, key=self.workers.get)
+            self.retire([pid])
+
+    def retire(self, pids):
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+        if pids:
+            timer = threading.Timer(self.args.graceful_timeout + 5, self._kill_stragglers, [set(pids)])
+            timer.daemon = True
+            timer.start()
+
+    def _kill_stragglers(self, pids):
+        for pid in pids & self.retiring:
+            logger.warning('Worker pid %s did not stop in time, killing it', pid)
+            self._kill(pid, signal.SIGKILL)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif pid in self.workers:
+                worker_id = self.workers.pop(pid)
+                if not self.stopping:
+                    logger.warning('Worker %s (pid %s) exited with status %s, restarting', worker_id, pid, status)
+
+    def stop(self):
+        logger.info('Shutting down, draining %s workers', len(self.workers))
+        self.stopping = True
+        self.retire(list(self.workers))
+
+    def reload(self):
+        # exec() keeps our children, so the new master adopts the current
+        # workers and retires them once its own are ready
+        logger.info('Reloading')
+        os.set_inheritable(self.sock.fileno(), True)
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[RETIRING_WORKERS_ENV] = ','.join(str(pid) for pid in list(self.workers) + list(self.retiring))
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def main():
+    started = time.perf_counter()
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(asctime)s [%(process)d] %(message)s')
+    # werkzeug's access log would otherwise force itself to INFO
+    logging.getLogger('werkzeug').setLevel(logging.getLogger().level)
+    args = parse_args()
+    sock = listening_socket(args.bind)
+    retiring = [int(pid) for pid in os.environ.pop(RETIRING_WORKERS_ENV, '').split(',') if pid]
+
+    # Preload: migrations and seeding run here exactly once
+    import app as wsgi
+    if args.asgi:
+        import asgi  # noqa: F401
+    logger.info('Loaded app in %.0f ms (database init %s ms)',
+                (time.perf_counter() - started) * 1000, wsgi.startup.get('init_db_ms'))
+
+    # The master never serves requests or runs jobs; workers open their own
+    # connections, hashing pools and job workers
+    wsgi.job_queue.shutdown()
+    wsgi.db_pool.close_all()
+    wsgi.password_hasher.shutdown(wait=True)
+    if args.workers > 1 and wsgi.app.config['RESPONSE_CACHE_URL'] is None:
+        logger.warning('Response cache is per worker; set RESPONSE_CACHE_URL so writes invalidate it everywhere')
+    if args.workers > 1 and wsgi.rate_limiter is not None and wsgi.app.config['RATE_LIMIT_STORE_URL'] is None:
+        logger.warning('Rate limits are per worker, so clients get up to %s times the budget; '
+                       'set RATE_LIMIT_STORE_URL to share them', args.workers)
+
+    Arbiter(args, sock, started).run(retiring)
+
+
+if __name__ == '__main__':
+    main()
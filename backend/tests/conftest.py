@@ -0,0 +1,120 @@
+# Behaviour tests for the backend.
+#
+#   cd backend && python -m pytest tests
+#
+# with requirements-dev.txt installed. Tests taking the repository fixture
+# run once against SQLite and once against PostgreSQL. The PostgreSQL runs
+# need a server to point TEST_DATABASE_URL at, e.g.
+#
+#   TEST_DATABASE_URL=postgresql://postgres@127.0.0.1:5432/scratch
+#
+# and are skipped without it. Every test gets a schema of its own there,
+# dropped afterwards, so the database itself is left as it was.
+
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from db import ConnectionPool, GroupCommitWriter  # noqa: E402
+from geo import register_functions  # noqa: E402
+from repository import SQLiteRepository  # noqa: E402
+
+POSTGRES_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+def sqlite_repository(path):
+    # Wired up the way app.py does it: a read-only pool for the listing reads
+    # and group-committed writes
+    pool = ConnectionPool(path, size=4, on_connect=register_functions)
+    SQLiteRepository(pool).migrate()
+    read_pool = ConnectionPool(path, size=4, read_only=True, on_connect=register_functions)
+    return SQLiteRepository(pool, read_pool, GroupCommitWriter(pool, window_ms=1.0))
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / 'test.db')
+
+
+@pytest.fixture
+def postgres_url():
+    if not POSTGRES_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    psycopg = pytest.importorskip('psycopg')
+
+    schema = f'test_{uuid.uuid4().hex[:12]}'
+    with psycopg.connect(POSTGRES_URL, autocommit=True) as conn:
+        conn.execute(f'CREATE SCHEMA {schema}')
+    separator = '&' if '?' in POSTGRES_URL else '?'
+    yield f'{POSTGRES_URL}{separator}options=-csearch_path%3D{schema}'
+    with psycopg.connect(POSTGRES_URL, autocommit=True) as conn:
+        conn.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def repository(request):
+    if request.param == 'sqlite':
+        yield sqlite_repository(request.getfixturevalue('sqlite_path'))
+        return
+
+    from postgres import PostgresPool, PostgresRepository
+
+    pool = PostgresPool(request.getfixturevalue('postgres_url'), size=4)
+    repository = PostgresRepository(pool)
+    repository.migrate()
+    yield repository
+    pool.close_all()
+
+
+PROPERTY = {
+    'title': 'Two-bed flat',
+    'description': 'Near the station',
+    'type': 'sale',
+    'propertyType': 'apartment',
+    'price': 250000,
+    'bedrooms': 2,
+    'bathrooms': 1,
+    'area': 70,
+    'street': '1 High Street',
+    'city': 'Springfield',
+    'state': 'IL',
+    'zipCode': '62701',
+}
+
+
+def make_user(repository, role='user'):
+    user_id = str(uuid.uuid4())
+    repository.create_user(user_id, f'user-{user_id[:8]}', f'{user_id[:8]}@example.com', 'hash', role)
+    return user_id
+
+
+def make_property(repository, owner_id, features=(), images=(), **fields):
+    property_id = str(uuid.uuid4())
+    repository.create_property(property_id, dict(PROPERTY, **fields), owner_id, list(features), list(images))
+    return property_id
+
+
+def bid_stats(repository, property_id):
+    row = repository.fetchone(
+        "SELECT high_bid, bid_count, pending_count FROM property_bid_stats WHERE property_id = ?", (property_id,)
+    )
+    return tuple(row) if row else None
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    # backend/app.py against a throwaway SQLite database, with no job worker
+    # threads (tests run the queue themselves) and rate limiting off
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='ebn-test-'), 'app.db')
+    os.environ['DATABASE_URL'] = ''
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+    import app
+    return app
@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+
+from conftest import make_property, make_user
+from ratelimit import MemoryBucketStore, RateLimiter
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def test_listing_pages_follow_the_cursor(app_module, client):
+    repository = app_module.repository
+    owner = make_user(repository)
+    city = uuid.uuid4().hex
+    ids = {make_property(repository, owner, city=city) for _ in range(5)}
+    app_module.response_cache.invalidate('listings')
+
+    seen = []
+    path = f'/api/properties?city={city}&limit=2'
+    while path:
+        response = client.get(path)
+        assert response.status_code == 200
+        seen.extend(row['id'] for row in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        path = f'/api/properties?city={city}&limit=2&cursor={cursor}' if cursor else None
+    assert sorted(seen) == sorted(ids)
+
+
+def test_deleted_users_token_stops_working(app_module, client):
+    repository = app_module.repository
+    admin, user = make_user(repository, role='admin'), make_user(repository)
+    admin_headers = {'Authorization': f"Bearer {app_module.generate_token(admin, 'admin', 'admin')}"}
+    headers = {'Authorization': f"Bearer {app_module.generate_token(user, 'user', 'user')}"}
+    assert client.get('/api/notifications', headers=headers).status_code == 200
+
+    assert client.delete(f'/api/admin/users/{user}', headers=admin_headers).status_code == 200
+    assert client.get('/api/notifications', headers=headers).status_code == 401
+    assert client.get('/api/notifications', headers={'Authorization': 'Bearer not-a-jwt'}).status_code == 401
+
+
+def test_deleted_bidder_no_longer_holds_the_high_bid(app_module, client):
+    repository, engine = app_module.repository, app_module.bid_engine
+    owner, leaving, other = make_user(repository), make_user(repository), make_user(repository)
+    property_id = make_property(repository, owner)
+    engine.place_bid(property_id, other, 100)
+    engine.place_bid(property_id, leaving, 500)
+    before = client.get(f'/api/properties/{property_id}')
+    assert before.get_json()['bid_stats']['high_bid'] == 500
+    subscription, _ = app_module.event_hub.subscribe(property_id)
+
+    try:
+        assert repository.delete_user(leaving)
+        app_module.job_queue.run_pending()
+        _, event_type, data = subscription.queue.get_nowait()
+    finally:
+        app_module.event_hub.unsubscribe(subscription)
+
+    assert event_type == 'stats'
+    assert '"high_bid":100.0' in data
+    after = client.get(f'/api/properties/{property_id}', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.get_json()['bid_stats']['high_bid'] == 100
+    # Bids between the old and the new high bid are accepted again
+    engine.place_bid(property_id, other, 200)
+
+
+def test_rate_limit_answers_429(app_module, client):
+    app_module.rate_limiter = RateLimiter(MemoryBucketStore(), {'get_properties': (2, 60)})
+    try:
+        statuses = [client.get('/api/properties?limit=1').status_code for _ in range(3)]
+        limited = client.get('/api/properties?limit=1')
+        # Other routes have budgets of their own
+        other = client.get('/api/properties/suggest?q=fl')
+    finally:
+        app_module.rate_limiter = None
+    assert statuses == [200, 200, 429]
+    assert limited.headers['Retry-After'] == '30'
+    assert other.status_code == 200
@@ -0,0 +1,110 @@
+import itertools
+import threading
+
+import pytest
+
+from bidding import BidEngine, BidRejected
+from caching import SharedGeneration
+from conftest import bid_stats, make_property, make_user
+
+
+@pytest.fixture
+def listing(repository):
+    owner, bidder = make_user(repository), make_user(repository)
+    return make_property(repository, owner), bidder
+
+
+def test_bids_must_beat_the_high_bid(repository, listing):
+    property_id, bidder = listing
+    engine = BidEngine(repository)
+    engine.place_bid(property_id, bidder, 100)
+    engine.place_bid(property_id, bidder, 150)
+
+    with pytest.raises(BidRejected) as rejected:
+        engine.place_bid(property_id, bidder, 150)
+    assert (rejected.value.status, rejected.value.high_bid) == (409, 150)
+    assert engine.stats()['fast_rejects'] == 1
+    assert bid_stats(repository, property_id) == (150, 2, 2)
+
+
+def test_unknown_property(repository, listing):
+    _, bidder = listing
+    with pytest.raises(BidRejected) as rejected:
+        BidEngine(repository).place_bid('no-such-listing', bidder, 100)
+    assert rejected.value.status == 404
+
+
+def test_another_workers_bid_is_caught_in_the_transaction(repository, listing):
+    property_id, bidder = listing
+    engine, other = BidEngine(repository), BidEngine(repository)
+    engine.place_bid(property_id, bidder, 100)
+    other.place_bid(property_id, bidder, 300)
+
+    with pytest.raises(BidRejected) as rejected:
+        engine.place_bid(property_id, bidder, 200)
+    assert rejected.value.high_bid == 300
+
+
+def test_forget_reaches_other_workers(repository, listing):
+    # Engines sharing generations stand in for workers forked from one master
+    property_id, bidder = listing
+    generations = SharedGeneration(slots=16)
+    engine = BidEngine(repository, generations=generations)
+    other = BidEngine(repository, generations=generations)
+    engine.place_bid(property_id, bidder, 100)
+    high = engine.place_bid(property_id, bidder, 500)
+    repository.write("UPDATE bids SET status = 'rejected' WHERE id = ?", (high,))
+    other.forget(property_id)
+
+    engine.place_bid(property_id, bidder, 200)
+    assert bid_stats(repository, property_id)[0] == 200
+    with pytest.raises(BidRejected) as rejected:
+        engine.place_bid(property_id, bidder, 150)
+    assert rejected.value.high_bid == 200
+    assert engine.stats()['fast_rejects'] == 1
+
+
+def test_high_bids_are_kept_for_recent_listings(repository):
+    owner, bidder = make_user(repository), make_user(repository)
+    engine = BidEngine(repository, max_tracked=2)
+    property_ids = [make_property(repository, owner) for _ in range(3)]
+    for property_id in property_ids:
+        engine.place_bid(property_id, bidder, 100)
+    stats = engine.stats()
+    assert (stats['tracked_properties'], stats['evictions']) == (2, 1)
+
+    # The evicted listing's bid is rejected by the transaction instead
+    with pytest.raises(BidRejected):
+        engine.place_bid(property_ids[0], bidder, 100)
+    assert engine.stats()['fast_rejects'] == 0
+
+
+def test_concurrent_bids(repository, listing):
+    property_id, bidder = listing
+    engines = [BidEngine(repository), BidEngine(repository)]
+    amounts = itertools.count(1)
+    accepted, rejected = [], []
+    lock = threading.Lock()
+
+    def worker(engine):
+        for _ in range(25):
+            with lock:
+                amount = next(amounts)
+            try:
+                engine.place_bid(property_id, bidder, amount)
+            except BidRejected as e:
+                assert e.status == 409 and e.high_bid >= amount
+                outcome = rejected
+            else:
+                outcome = accepted
+            with lock:
+                outcome.append(amount)
+
+    threads = [threading.Thread(target=worker, args=(engines[n % 2],)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(accepted) + len(rejected) == 100
+    assert bid_stats(repository, property_id)[:2] == (max(accepted), len(accepted))
@@ -0,0 +1,39 @@
+import os
+import time
+
+from caching import AuthCache, SharedGeneration
+
+USER = {'id': 'u1', 'role': 'user'}
+
+
+def test_invalidation_reaches_caches_sharing_the_generation():
+    generation = SharedGeneration()
+    here, there = AuthCache(generation=generation), AuthCache(generation=generation)
+    there.set('token', USER, time.time() + 60)
+    assert there.get('token') == USER
+
+    here.invalidate_user('u1')
+    assert there.get('token') is None
+    assert there.stats()['generation'] == 1
+
+
+def test_invalidation_reaches_forked_processes():
+    cache = AuthCache()
+    cache.set('token', USER, time.time() + 60)
+    pid = os.fork()
+    if pid == 0:
+        cache.invalidate_user('u1')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert cache.peek('token') is None
+
+
+def test_row_read_before_an_invalidation_is_not_cached():
+    cache = AuthCache()
+    generation = cache.generation()
+    cache.invalidate_user('u1')
+    cache.set('token', USER, time.time() + 60, generation)
+    assert cache.get('token') is None
+    # Nor is a token past its exp claim
+    cache.set('token', USER, time.time() - 1)
+    assert cache.get('token') is None
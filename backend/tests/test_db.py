@@ -0,0 +1,182 @@
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import bid_stats, make_property, make_user
+from db import ConnectionPool, GroupCommitWriter, PoolTimeout, SnapshotPool
+from migrations import MIGRATIONS, current_version, latest_version, migrate
+
+
+@pytest.fixture
+def pool(sqlite_path):
+    pool = ConnectionPool(sqlite_path, size=2, timeout=0.05)
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.commit()
+    conn.close()
+    return pool
+
+
+def names(pool):
+    conn = pool.acquire()
+    try:
+        return sorted(row[0] for row in conn.execute('SELECT name FROM items'))
+    finally:
+        conn.close()
+
+
+def test_pool_reuses_connections(pool):
+    for _ in range(3):
+        pool.acquire().close()
+    stats = pool.stats()
+    assert stats['created'] == 1
+    assert (stats['idle'], stats['in_use']) == (1, 0)
+
+
+def test_pool_times_out_when_exhausted(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    held[0].close()
+    pool.acquire().close()
+    held[1].close()
+
+
+def test_release_rolls_back(pool):
+    conn = pool.acquire()
+    conn.execute('BEGIN')
+    conn.execute("INSERT INTO items (name) VALUES ('uncommitted')")
+    conn.close()
+    assert names(pool) == []
+
+
+def test_recycle_reopens_connections(pool):
+    held = pool.acquire()
+    pool.acquire().close()
+    pool.recycle()
+    held.close()
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['closed'] == 2
+
+
+def test_read_only_pool_cannot_write(pool, sqlite_path):
+    reader = ConnectionPool(sqlite_path, read_only=True)
+    conn = reader.acquire()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO items (name) VALUES ('nope')")
+    finally:
+        conn.close()
+
+
+def test_snapshot_pool_lags_until_refreshed(pool, tmp_path):
+    snapshot = SnapshotPool(pool, str(tmp_path / 'snapshot.db'), refresh_interval=3600)
+    writer = pool.acquire()
+    writer.execute("INSERT INTO items (name) VALUES ('first')")
+    writer.commit()
+    assert names(snapshot) == ['first']
+
+    writer.execute("INSERT INTO items (name) VALUES ('second')")
+    writer.commit()
+    writer.close()
+    assert names(snapshot) == ['first']
+    snapshot.refresh()
+    assert names(snapshot) == ['first', 'second']
+
+
+def insert(conn, name):
+    conn.execute('INSERT INTO items (name) VALUES (?)', (name,))
+    return name
+
+
+def insert_then_fail(conn, name):
+    insert(conn, name)
+    raise ValueError(name)
+
+
+def test_group_commit(pool):
+    writer = GroupCommitWriter(pool, window_ms=50)
+    results, errors = [], []
+
+    def submit(fn, name):
+        try:
+            results.append(writer.submit(fn, name))
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=submit, args=(insert, f'row{n}')) for n in range(8)]
+    threads.append(threading.Thread(target=submit, args=(insert_then_fail, 'bad')))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # A unit that raises undoes only its own changes
+    assert sorted(results) == [f'row{n}' for n in range(8)]
+    assert errors == ['bad']
+    assert names(pool) == sorted(results)
+    stats = writer.stats()
+    assert stats['writes'] == 9
+    assert stats['commits'] < 9
+    assert stats['failed_writes'] == 1
+
+
+def test_failed_commit_reaches_every_caller(pool):
+    writer = GroupCommitWriter(pool, begin='NOT SQL')
+    with pytest.raises(sqlite3.OperationalError):
+        writer.submit(insert, 'lost')
+    assert writer.stats()['failed_commits'] == 1
+    assert names(pool) == []
+
+
+def test_migrations_apply_once(sqlite_path):
+    pool = ConnectionPool(sqlite_path, size=4)
+    applied = []
+
+    def run():
+        conn = pool.acquire()
+        try:
+            applied.extend(migrate(conn))
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(applied) == sorted(version for version, _, _ in MIGRATIONS)
+    conn = pool.acquire()
+    try:
+        assert current_version(conn) == latest_version()
+        assert migrate(conn) == []
+    finally:
+        conn.close()
+
+
+def test_migrations_step_by_step(sqlite_path):
+    conn = ConnectionPool(sqlite_path).acquire()
+    assert migrate(conn, target=4) == [1, 2, 3, 4]
+    assert current_version(conn) == 4
+    assert migrate(conn) == [version for version, _, _ in MIGRATIONS if version > 4]
+    conn.close()
+
+
+def test_hot_queries_use_indexes(repository):
+    assert repository.slow_query_plans() == []
+
+
+def test_rebuilt_bid_stats_match_triggers(repository):
+    owner, bidder = make_user(repository), make_user(repository)
+    property_ids = [make_property(repository, owner) for _ in range(3)]
+    for n, amount in enumerate([100, 250, 175, 90, 300]):
+        repository.write(
+            "INSERT INTO bids (id, property_id, user_id, amount, status) VALUES (?, ?, ?, ?, ?)",
+            (f'b{n}', property_ids[n % 3], bidder, amount, 'rejected' if amount == 300 else 'pending')
+        )
+    maintained = {property_id: bid_stats(repository, property_id) for property_id in property_ids}
+    repository.rebuild_bid_stats()
+    assert {property_id: bid_stats(repository, property_id) for property_id in property_ids} == maintained
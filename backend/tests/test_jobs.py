@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(repository):
+    return JobQueue(repository, workers=0, retry_backoff=0.0)
+
+
+def job_row(repository, kind):
+    return repository.fetchone("SELECT status, attempts, last_error FROM jobs WHERE kind = ?", (kind,))
+
+
+def test_claim_and_complete(repository):
+    assert repository.enqueue_job('thing', {'n': 1})
+    job = repository.claim_job(60)
+    assert (job['kind'], job['payload'], job['attempts']) == ('thing', {'n': 1}, 1)
+    # Hidden from other workers while claimed
+    assert repository.claim_job(60) is None
+    assert repository.complete_job(job['id'], 1)
+    assert job_row(repository, 'thing')['status'] == 'done'
+    assert repository.job_queue_depth() == {'queued': 0, 'running': 0, 'failed': 0, 'lag_s': 0.0}
+
+
+def test_delayed_job_waits(repository):
+    repository.enqueue_job('later', {}, delay=60)
+    assert repository.claim_job(60) is None
+    assert repository.job_queue_depth()['queued'] == 1
+
+
+def test_idempotency_key(repository):
+    assert repository.enqueue_job('once', {}, key='once:1')
+    assert not repository.enqueue_job('once', {}, key='once:1')
+    job = repository.claim_job(60)
+    repository.complete_job(job['id'], job['attempts'])
+    # Finished jobs hold their key until purged
+    assert not repository.enqueue_job('once', {}, key='once:1')
+    assert repository.purge_jobs(time.time() + 1) == 1
+    assert repository.enqueue_job('once', {}, key='once:1')
+
+
+def test_expired_claim_is_taken_over(repository):
+    repository.enqueue_job('slow', {})
+    first = repository.claim_job(0)
+    second = repository.claim_job(60)
+    assert second['id'] == first['id']
+    assert second['attempts'] == 2
+    # The first worker's outcome no longer counts
+    assert not repository.complete_job(first['id'], first['attempts'])
+    assert repository.complete_job(second['id'], second['attempts'])
+
+
+def test_concurrent_claims_take_each_job_once(repository):
+    for n in range(20):
+        repository.enqueue_job('item', {'n': n})
+    claimed = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            job = repository.claim_job(60)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job['payload']['n'])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == list(range(20))
+
+
+def test_run_pending(repository, queue):
+    seen = []
+    queue.handler('record')(seen.append)
+    repository.enqueue_job('record', {'n': 1})
+    repository.enqueue_job('record', {'n': 2})
+    assert queue.run_pending() == 2
+    assert sorted(payload['n'] for payload in seen) == [1, 2]
+    assert queue.stats()['completed'] == 2
+
+
+def test_failing_job_is_retried_then_failed(repository, queue):
+    calls = []
+
+    @queue.handler('flaky')
+    def flaky(payload):
+        calls.append(payload)
+        raise ValueError('boom')
+
+    repository.enqueue_job('flaky', {}, max_attempts=3)
+    assert queue.run_pending() == 3
+    assert len(calls) == 3
+    row = job_row(repository, 'flaky')
+    assert (row['status'], row['attempts'], row['last_error']) == ('failed', 3, 'ValueError: boom')
+    assert queue.stats()['retried'] == 2
+    assert queue.stats()['failed'] == 1
+
+    assert repository.retry_failed_jobs('flaky') == 1
+    queue.handler('flaky')(calls.append)
+    assert queue.run_pending() == 1
+    assert job_row(repository, 'flaky')['status'] == 'done'
+
+
+def test_retry_waits_for_backoff(repository):
+    queue = JobQueue(repository, workers=0, retry_backoff=60.0)
+
+    @queue.handler('flaky')
+    def flaky(payload):
+        raise ValueError('boom')
+
+    repository.enqueue_job('flaky', {})
+    assert queue.run_pending() == 1
+    row = job_row(repository, 'flaky')
+    assert (row['status'], row['attempts']) == ('queued', 1)
+
+
+def test_unknown_kind_fails_at_once(repository, queue):
+    repository.enqueue_job('mystery', {})
+    assert queue.run_pending() == 1
+    row = job_row(repository, 'mystery')
+    assert row['status'] == 'failed'
+    assert row['last_error'].startswith('LookupError')
+
+
+def test_worker_threads(repository):
+    queue = JobQueue(repository, workers=2, poll_interval=0.05)
+    done = threading.Event()
+    queue.handler('ping')(lambda payload: done.set())
+    queue.start()
+    try:
+        repository.enqueue_job('ping', {})
+        queue.notify()
+        assert done.wait(5)
+    finally:
+        queue.shutdown(timeout=5)
+    assert queue.stats()['workers'] == 0
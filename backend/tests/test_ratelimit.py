@@ -0,0 +1,97 @@
+import pytest
+
+from ratelimit import MemoryBucketStore, RateLimiter, make_bucket_store, parse_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenStore:
+    def take(self, key, rate, burst, cost=1):
+        raise ConnectionError('store unreachable')
+
+    def stats(self):
+        return {'backend': 'broken'}
+
+
+def test_parse_limits():
+    assert parse_limits('login=10/60, default=100/1,create_bid=5') == {
+        'login': (10, 60.0),
+        'default': (100, 1.0),
+        'create_bid': (5, 1.0),
+    }
+    assert parse_limits(None) == {}
+    with pytest.raises(ValueError):
+        parse_limits('login=ten/60')
+
+
+def test_bucket_allows_a_burst_then_refills():
+    clock = Clock()
+    store = MemoryBucketStore(clock=clock)
+    # 5 requests per 10 seconds
+    for _ in range(5):
+        assert store.take('k', 0.5, 5) == (True, 0.0)
+    assert store.take('k', 0.5, 5) == (False, 2.0)
+
+    clock.now += 1
+    assert store.take('k', 0.5, 5) == (False, 1.0)
+    clock.now += 1
+    assert store.take('k', 0.5, 5) == (True, 0.0)
+
+    # Never refills beyond the burst
+    clock.now += 3600
+    for _ in range(5):
+        assert store.take('k', 0.5, 5)[0]
+    assert not store.take('k', 0.5, 5)[0]
+
+
+def test_buckets_are_per_key_and_evicted_lru():
+    store = MemoryBucketStore(maxsize=2, clock=Clock())
+    store.take('a', 1, 1)
+    store.take('b', 1, 1)
+    assert not store.take('a', 1, 1)[0]
+    store.take('c', 1, 1)
+    # b was least recently used, so it went, and comes back full
+    assert store.stats()['evictions'] == 1
+    assert store.take('b', 1, 1)[0]
+    assert store.stats()['buckets'] == 2
+
+
+def test_limiter_routes_and_identities():
+    limiter = RateLimiter(MemoryBucketStore(clock=Clock()), {'login': (2, 60)}, default=(3, 60))
+    assert limiter.check('login', 'ip:1')[0]
+    assert limiter.check('login', 'ip:1')[0]
+    allowed, retry_after = limiter.check('login', 'ip:1')
+    assert not allowed
+    assert retry_after == pytest.approx(30.0)
+    # Other clients and routes have buckets of their own
+    assert limiter.check('login', 'ip:2')[0]
+    assert all(limiter.check('get_properties', 'ip:1')[0] for _ in range(3))
+    assert not limiter.check('get_properties', 'ip:1')[0]
+
+    stats = limiter.stats()
+    assert (stats['allowed'], stats['limited']) == (6, 2)
+    assert stats['routes'] == {'login': {'requests': 2, 'seconds': 60.0}}
+    assert stats['default'] == {'requests': 3, 'seconds': 60.0}
+
+
+def test_exempt_routes_are_not_counted():
+    limiter = RateLimiter(MemoryBucketStore(), default=(1, 60))
+    assert all(limiter.check('health_live', 'ip:1')[0] for _ in range(10))
+    assert limiter.stats()['allowed'] == 0
+
+
+def test_store_failure_lets_requests_through():
+    limiter = RateLimiter(BrokenStore())
+    assert limiter.check('login', 'ip:1') == (True, 0.0)
+    assert limiter.stats()['store_errors'] == 1
+
+
+def test_make_bucket_store():
+    assert isinstance(make_bucket_store(None, maxsize=10), MemoryBucketStore)
+    assert make_bucket_store('', maxsize=10).maxsize == 10
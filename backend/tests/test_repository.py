@@ -0,0 +1,197 @@
+import json
+
+from werkzeug.datastructures import MultiDict
+
+from conftest import bid_stats, make_property, make_user
+from listings import shape_property_page
+from serializers import BID_FIELDS, row_plan
+
+
+def page(repository, **args):
+    rows, plan = repository.property_page(MultiDict(args))
+    body, cursor = shape_property_page(rows, plan)
+    return json.loads(body), cursor
+
+
+def insert_bid(repository, bid_id, property_id, user_id, amount, status='pending'):
+    repository.write(
+        "INSERT INTO bids (id, property_id, user_id, amount, message, status) VALUES (?, ?, ?, ?, NULL, ?)",
+        (bid_id, property_id, user_id, amount, status)
+    )
+
+
+def test_schema_is_current(repository):
+    assert repository.schema_version() == repository.latest_version()
+    assert repository.migrate() == []
+
+
+def test_user_crud(repository):
+    user_id = make_user(repository)
+    user = repository.get_user(user_id)
+    assert user['role'] == 'user'
+    assert repository.get_user_by_username(user['username'])['id'] == user_id
+    assert repository.user_exists(user['username'], 'someone@else.com')
+    assert not repository.user_exists('nobody', 'nobody@example.com')
+
+    # Seeding the same account again is a no-op with if_absent
+    repository.create_user(user_id, user['username'], user['email'], 'other', 'admin', if_absent=True)
+    assert repository.get_user(user_id)['password'] == 'hash'
+
+    repository.replace_password(user_id, 'stale', 'new')
+    assert repository.get_user(user_id)['password'] == 'hash'
+    repository.replace_password(user_id, 'hash', 'new')
+    assert repository.get_user(user_id)['password'] == 'new'
+
+    assert repository.delete_user(user_id)
+    assert repository.get_user(user_id) is None
+    assert not repository.delete_user(user_id)
+
+
+def test_property_crud(repository):
+    owner = make_user(repository)
+    property_id = make_property(repository, owner, features=['garden', 'garage'], images=['a.jpg'])
+
+    document = json.loads(repository.property_document(property_id))
+    assert document['title'] == 'Two-bed flat'
+    assert document['features'] == ['garden', 'garage']
+    assert document['images'] == ['a.jpg']
+    assert document['bid_stats']['bid_count'] == 0
+
+    repository.update_property(repository.get_property(property_id), {'price': 240000}, features=['garden'])
+    document = json.loads(repository.property_document(property_id))
+    assert document['price'] == 240000
+    assert document['features'] == ['garden']
+    assert document['images'] == ['a.jpg']
+
+    repository.delete_property(property_id)
+    assert repository.get_property(property_id) is None
+    assert repository.property_document(property_id) is None
+
+
+def test_keyset_listing(repository):
+    owner = make_user(repository)
+    prices = [100000, 300000, 200000, 200000, 500000]
+    ids = {make_property(repository, owner, price=price) for price in prices}
+
+    seen = []
+    cursor = None
+    while True:
+        args = {'sort': 'price_asc', 'limit': 2}
+        if cursor:
+            args['cursor'] = cursor
+        rows, cursor = page(repository, **args)
+        assert len(rows) <= 2
+        seen.extend(rows)
+        if cursor is None:
+            break
+
+    assert {row['id'] for row in seen} == ids
+    assert [row['price'] for row in seen] == sorted(prices)
+
+    rows, cursor = page(repository, minPrice=200000, maxPrice=300000, sort='price_desc')
+    assert [row['price'] for row in rows] == [300000, 200000, 200000]
+    assert cursor is None
+
+
+def test_bid_stats_follow_bids(repository):
+    owner, bidder = make_user(repository), make_user(repository)
+    property_id = make_property(repository, owner)
+
+    insert_bid(repository, 'b1', property_id, bidder, 100)
+    insert_bid(repository, 'b2', property_id, bidder, 300)
+    insert_bid(repository, 'b3', property_id, bidder, 200)
+    assert bid_stats(repository, property_id) == (300, 3, 3)
+
+    # A rejected bid stops counting towards the high bid
+    repository.set_bid_status('b2', 'rejected')
+    assert bid_stats(repository, property_id) == (200, 3, 2)
+
+    repository.write("DELETE FROM bids WHERE id = ?", ('b3',))
+    assert bid_stats(repository, property_id) == (100, 2, 1)
+
+    repository.write("DELETE FROM bids WHERE property_id = ?", (property_id,))
+    assert bid_stats(repository, property_id) is None
+
+    insert_bid(repository, 'b4', property_id, bidder, 50)
+    repository.rebuild_bid_stats()
+    assert bid_stats(repository, property_id) == (50, 1, 1)
+
+    plan = row_plan(BID_FIELDS, 'snake')
+    assert [row['id'] for row in repository.bids_for_property(property_id, plan)] == ['b4']
+    assert [row['id'] for row in repository.bids_for_user(bidder, plan)] == ['b4']
+
+
+def test_bid_status_notifies_bidder(repository):
+    owner, bidder = make_user(repository), make_user(repository)
+    property_id = make_property(repository, owner)
+    insert_bid(repository, 'b1', property_id, bidder, 100)
+
+    repository.set_bid_status('b1', 'accepted')
+    job = repository.claim_job(60)
+    assert job['kind'] == 'notify_bid_status'
+    payload = job['payload']
+    repository.notify_bid_status(payload['id'], payload['bid_id'], payload['status'])
+    # A rerun of the same job adds nothing
+    repository.notify_bid_status(payload['id'], payload['bid_id'], payload['status'])
+
+    notifications = repository.notifications_for_user(bidder)
+    assert len(notifications) == 1
+    data = notifications[0]['data']
+    data = json.loads(data) if isinstance(data, str) else data
+    assert data['bidId'] == 'b1'
+    assert data['status'] == 'accepted'
+    assert data['propertyTitle'] == 'Two-bed flat'
+
+
+def test_cleanup_property(repository):
+    owner, bidder = make_user(repository), make_user(repository)
+    property_id = make_property(repository, owner, features=['garden'], images=['a.jpg'])
+    insert_bid(repository, 'b1', property_id, bidder, 100)
+
+    repository.delete_property(property_id)
+    job = repository.claim_job(60)
+    assert job['payload'] == {'property_id': property_id}
+    repository.cleanup_property(property_id)
+
+    for table in ('property_features', 'property_images', 'bids', 'property_bid_stats'):
+        assert repository.fetchone(f"SELECT COUNT(*) FROM {table} WHERE property_id = ?", (property_id,))[0] == 0
+
+
+def test_cleanup_user(repository):
+    owner, leaving, other = make_user(repository), make_user(repository), make_user(repository)
+    listing = make_property(repository, owner)
+    untouched = make_property(repository, owner)
+    own_listing = make_property(repository, leaving)
+    insert_bid(repository, 'b1', listing, other, 100)
+    insert_bid(repository, 'b2', listing, leaving, 500)
+    insert_bid(repository, 'b3', untouched, other, 70)
+    insert_bid(repository, 'b4', own_listing, other, 50)
+    repository.create_contract('c1', own_listing, leaving, owner, 2.5, '2024-01-01', '2024-12-31')
+
+    assert repository.delete_user(leaving)
+    job = repository.claim_job(60)
+    assert job['kind'] == 'cleanup_user'
+
+    property_ids, stats = repository.cleanup_user(leaving)
+    assert property_ids == [own_listing]
+    # The listings they had bid on, as they stand without those bids
+    assert stats == {listing: (100, 1)}
+    assert bid_stats(repository, listing) == (100, 1, 1)
+    assert bid_stats(repository, untouched) == (70, 1, 1)
+    assert repository.get_property(own_listing) is None
+    assert repository.get_contract('c1') is None
+
+    # Their listing's own bids go in the cleanup_property job this queued
+    job = repository.claim_job(60)
+    assert job['payload'] == {'property_id': own_listing}
+
+    # Running again finds nothing left to do
+    assert repository.cleanup_user(leaving) == ([], {})
+
+
+def test_export_keys_are_sorted(repository):
+    make_user(repository)
+    for fmt in ('json', 'ndjson'):
+        body = ''.join(repository.export('users', fmt, batch_size=1))
+        row = json.loads(body)[0] if fmt == 'json' else json.loads(body.splitlines()[0])
+        assert list(row) == sorted(row)
@@ -1,5 +1,5 @@
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import MainLayout from "@/layouts/MainLayout";
 import { Button } from "@/components/ui/button";
 import { Input } from "@/components/ui/input";
@@ -11,21 +11,28 @@ import {
   SelectValue,
 } from "@/components/ui/select";
 import { Slider } from "@/components/ui/slider";
-import { mockProperties } from "@/lib/mockData";
 import PropertyCard from "@/components/PropertyCard";
+import { useToast } from "@/hooks/use-toast";
+import { propertyApi } from "@/services/api";
 import { Search, Filter, MapPin } from "lucide-react";
 
+const MAX_PRICE = 5000000;
+
 const Properties = () => {
-  const [properties, setProperties] = useState(mockProperties);
+  const { toast } = useToast();
+  const [properties, setProperties] = useState<any[]>([]);
+  // Cursor (listing) or offset (search) of the next page; null on the last
+  const [nextPage, setNextPage] = useState<string | number | null>(null);
+  const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState("");
   const [propertyType, setPropertyType] = useState("all");
-  const [priceRange, setPriceRange] = useState([0, 5000000]);
+  const [priceRange, setPriceRange] = useState([0, MAX_PRICE]);
   const [location, setLocation] = useState("all");
+  const [bedrooms, setBedrooms] = useState("any");
+  const [sort, setSort] = useState("newest");
   const [showFilters, setShowFilters] = useState(false);
-  const [filteredProperties, setFilteredProperties] = useState(mockProperties);
-
-  // Get unique locations from properties
-  const locations = [...new Set(mockProperties.map(p => p.address.state))];
+  const [locations, setLocations] = useState<string[]>([]);
+  const requestId = useRef(0);
 
   // Format price for display
   const formatPrice = (price) => {
@@ -36,38 +43,57 @@ const Properties = () => {
     }).format(price);
   };
 
-  // Filter properties based on search and filters
-  useEffect(() => {
-    let filtered = [...mockProperties];
-
-    // Filter by search term
-    if (searchTerm) {
-      filtered = filtered.filter(
-        property =>
-          property.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-          property.description.toLowerCase().includes(searchTerm.toLowerCase()) ||
-          property.address.city.toLowerCase().includes(searchTerm.toLowerCase()) ||
-          property.address.state.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-    }
-
-    // Filter by property type
-    if (propertyType !== "all") {
-      filtered = filtered.filter(property => property.type === propertyType);
-    }
-
-    // Filter by price range
-    filtered = filtered.filter(
-      property => property.price >= priceRange[0] && property.price <= priceRange[1]
-    );
-
-    // Filter by location
-    if (location !== "all") {
-      filtered = filtered.filter(property => property.address.state === location);
+  // Filtering and sorting happen in the backend, a page at a time
+  const loadPage = async (next: string | number | null) => {
+    const id = ++requestId.current;
+    setLoading(true);
+    const filters = {
+      type: propertyType !== "all" ? propertyType : undefined,
+      state: location !== "all" ? location : undefined,
+      minPrice: priceRange[0] > 0 ? priceRange[0] : undefined,
+      maxPrice: priceRange[1],
+      minBedrooms: bedrooms !== "any" ? Number(bedrooms) : undefined,
+      sort,
+    };
+    const query = searchTerm.trim();
+
+    try {
+      let page, following;
+      if (query) {
+        const result = await propertyApi.searchProperties(query, filters, (next as number) || 0);
+        page = result.properties;
+        following = result.nextOffset;
+      } else {
+        const result = await propertyApi.getProperties(filters, (next as string) || undefined);
+        page = result.properties;
+        following = result.nextCursor;
+      }
+      // A newer request has replaced this one
+      if (id !== requestId.current) return;
+
+      setProperties(current => (next ? [...current, ...page] : page));
+      setNextPage(following);
+      setLocations(current => [...new Set([...current, ...page.map(p => p.address.state)])].sort());
+    } catch (error) {
+      if (id !== requestId.current) return;
+      toast({
+        title: "Could not load properties",
+        description: error.message,
+        variant: "destructive",
+      });
+    } finally {
+      if (id === requestId.current) setLoading(false);
     }
+  };
 
-    setFilteredProperties(filtered);
-  }, [searchTerm, propertyType, priceRange, location]);
+  // Start again from the first page whenever a filter changes, once typing
+  // or dragging the price slider has paused
+  useEffect(() => {
+    requestId.current++;
+    setLoading(true);
+    const timer = setTimeout(() => loadPage(null), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm, propertyType, priceRange, location, bedrooms, sort]);
 
   return (
     <MainLayout>
@@ -98,7 +124,7 @@ const Properties = () => {
         {showFilters && (
           <div className="bg-gray-50 p-6 rounded-lg mb-8">
             <h2 className="text-xl font-bold mb-4">Filters</h2>
-            <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
+            <div className="grid grid-cols-1 md:grid-cols-4 gap-6">
               <div>
                 <label className="block text-sm font-medium mb-2">Property Type</label>
                 <Select value={propertyType} onValueChange={setPropertyType}>
@@ -128,13 +154,29 @@ const Properties = () => {
                 </Select>
               </div>
 
+              <div>
+                <label className="block text-sm font-medium mb-2">Bedrooms</label>
+                <Select value={bedrooms} onValueChange={setBedrooms}>
+                  <SelectTrigger>
+                    <SelectValue placeholder="Select bedrooms" />
+                  </SelectTrigger>
+                  <SelectContent>
+                    <SelectItem value="any">Any</SelectItem>
+                    <SelectItem value="1">1+</SelectItem>
+                    <SelectItem value="2">2+</SelectItem>
+                    <SelectItem value="3">3+</SelectItem>
+                    <SelectItem value="4">4+</SelectItem>
+                  </SelectContent>
+                </Select>
+              </div>
+
               <div>
                 <label className="block text-sm font-medium mb-2">
                   Price Range: {formatPrice(priceRange[0])} - {formatPrice(priceRange[1])}
                 </label>
                 <Slider
-                  defaultValue={[0, 5000000]}
-                  max={5000000}
+                  defaultValue={[0, MAX_PRICE]}
+                  max={MAX_PRICE}
                   step={50000}
                   value={priceRange}
                   onValueChange={setPriceRange}
@@ -148,7 +190,9 @@ const Properties = () => {
         {/* Properties Count */}
         <div className="flex justify-between items-center mb-6">
           <div>
-            <h2 className="text-2xl font-bold">{filteredProperties.length} Properties</h2>
+            <h2 className="text-2xl font-bold">
+              {properties.length}{nextPage !== null ? "+" : ""} Properties
+            </h2>
             {location !== "all" && (
               <div className="flex items-center text-sm text-gray-500 mt-1">
                 <MapPin className="h-4 w-4 mr-1" /> 
@@ -156,26 +200,27 @@ const Properties = () => {
               </div>
             )}
           </div>
-          <Select defaultValue="newest">
+          {/* Search results come best match first */}
+          <Select value={sort} onValueChange={setSort} disabled={searchTerm.trim() !== ""}>
             <SelectTrigger className="w-[180px]">
               <SelectValue placeholder="Sort by" />
             </SelectTrigger>
             <SelectContent>
               <SelectItem value="newest">Newest</SelectItem>
-              <SelectItem value="price-low">Price: Low to High</SelectItem>
-              <SelectItem value="price-high">Price: High to Low</SelectItem>
+              <SelectItem value="price_asc">Price: Low to High</SelectItem>
+              <SelectItem value="price_desc">Price: High to Low</SelectItem>
             </SelectContent>
           </Select>
         </div>
 
         {/* Properties Grid */}
-        {filteredProperties.length > 0 ? (
+        {properties.length > 0 ? (
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6 mb-12">
-            {filteredProperties.map(property => (
+            {properties.map(property => (
               <PropertyCard key={property.id} property={property} />
             ))}
           </div>
-        ) : (
+        ) : !loading && (
           <div className="text-center py-12 bg-gray-50 rounded-lg">
             <h3 className="text-xl font-semibold mb-2">No properties found</h3>
             <p className="text-gray-600 mb-6">
@@ -184,29 +229,21 @@ const Properties = () => {
             <Button onClick={() => {
               setSearchTerm("");
               setPropertyType("all");
-              setPriceRange([0, 5000000]);
+              setPriceRange([0, MAX_PRICE]);
               setLocation("all");
+              setBedrooms("any");
             }}>
               Reset Filters
             </Button>
           </div>
         )}
 
-        {/* Pagination */}
-        {filteredProperties.length > 0 && (
+        {/* Next page */}
+        {nextPage !== null && properties.length > 0 && (
           <div className="flex justify-center mt-8">
-            <nav className="flex items-center space-x-2">
-              <Button variant="outline" disabled>
-                Previous
-              </Button>
-              <Button variant="outline" className="bg-primary text-white">
-                1
-              </Button>
-              <Button variant="outline">2</Button>
-              <Button variant="outline">3</Button>
-              <span className="mx-2">...</span>
-              <Button variant="outline">Next</Button>
-            </nav>
+            <Button variant="outline" disabled={loading} onClick={() => loadPage(nextPage)}>
+              {loading ? "Loading..." : "Load more"}
+            </Button>
           </div>
         )}
       </div>
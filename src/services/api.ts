@@ -45,11 +45,79 @@ export const authApi = {
   },
 };
 
+// Listing filters the backend applies; unset and empty values are left out
+export interface PropertyFilters {
+  city?: string;
+  state?: string;
+  type?: string;
+  propertyType?: string;
+  status?: string;
+  minPrice?: number;
+  maxPrice?: number;
+  minBedrooms?: number;
+  maxBedrooms?: number;
+  minArea?: number;
+  maxArea?: number;
+  sort?: string;
+}
+
+export const PROPERTY_PAGE_SIZE = 24;
+
+const listingParams = (filters: PropertyFilters) => {
+  const params = new URLSearchParams({ case: "camel", limit: String(PROPERTY_PAGE_SIZE) });
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== "") {
+      params.set(key, String(value));
+    }
+  });
+  return params;
+};
+
+// Listing rows are flat; the components expect the address grouped
+const toProperty = (row: any) => ({
+  ...row,
+  address: {
+    street: row.street,
+    city: row.city,
+    state: row.state,
+    zipCode: row.zipCode,
+  },
+});
+
 // Property API calls
 export const propertyApi = {
-  getAllProperties: async () => {
-    const response = await fetch(`${API_URL}/properties`);
-    return handleResponse(response);
+  // One page of listings, filtered and sorted by the backend. Pass the
+  // returned nextCursor back in to get the page after it; it is null on
+  // the last page.
+  getProperties: async (filters: PropertyFilters = {}, cursor?: string) => {
+    const params = listingParams(filters);
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    const response = await fetch(`${API_URL}/properties?${params}`);
+    const rows = await handleResponse(response);
+    return {
+      properties: rows.map(toProperty),
+      nextCursor: response.headers.get("X-Next-Cursor"),
+    };
+  },
+
+  // Full-text search over the same filters, best match first. Ranked
+  // results page by offset rather than cursor; nextOffset is null on the
+  // last page.
+  searchProperties: async (q: string, filters: PropertyFilters = {}, offset = 0) => {
+    const params = listingParams({ ...filters, sort: undefined });
+    params.set("q", q);
+    if (offset) {
+      params.set("offset", String(offset));
+    }
+    const response = await fetch(`${API_URL}/properties/search?${params}`);
+    const rows = await handleResponse(response);
+    const nextOffset = response.headers.get("X-Next-Offset");
+    return {
+      properties: rows.map(toProperty),
+      nextOffset: nextOffset ? Number(nextOffset) : null,
+    };
   },
 
   getPropertyById: async (id: string) => {